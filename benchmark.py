@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+from aioquic.quic.packet import QuicPacketType
+from aioquic.quic.packet_builder import QuicSentPacket
+from aioquic.tls import Epoch
+
+from drl_comunication import WIRE_FORMATS, benchmark_round_trip
+from meta_con import OBSERVATION_FEATURES, MetaConCongestionControl
+from shm_channel import benchmark_shm_round_trip
+
+SECTIONS = ("controller", "ipc", "env")
+
+
+def _git_commit():
+    root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=root, stderr=subprocess.DEVNULL
+        )
+        status = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=root,
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.decode().strip(), bool(status.strip())
+
+
+def _packets(n: int, size: int = 1200):
+    return [
+        QuicSentPacket(
+            epoch=Epoch.ONE_RTT,
+            in_flight=True,
+            is_ack_eliciting=True,
+            is_crypto_packet=False,
+            packet_number=i,
+            packet_type=QuicPacketType.ONE_RTT,
+            sent_time=i * 1e-4,
+            sent_bytes=size,
+        )
+        for i in range(n)
+    ]
+
+
+def bench_controller(n_packets: int = 200000, observation_features=()) -> dict:
+    """
+    Per-call cost of the controller callbacks under a synthetic ACK stream:
+    every packet is sent, then acknowledged with one RTT sample, with a
+    decision every 1000 ACKs.
+    """
+    now = [0.0]
+    cc = MetaConCongestionControl(
+        max_datagram_size=1200,
+        clock=lambda: now[0],
+        auto_decision=False,
+        observation_features=observation_features,
+    )
+    packets = _packets(n_packets)
+    rtts = (0.06 + 0.01 * np.random.default_rng(0).random(n_packets)).tolist()
+
+    start = time.perf_counter()
+    for packet in packets:
+        cc.on_packet_sent(packet=packet)
+    sent = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for packet in packets:
+        cc.on_packet_acked(now=packet.sent_time, packet=packet)
+    acked = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for rtt in rtts:
+        cc.on_rtt_measurement(now=0.0, rtt=rtt)
+    measured = time.perf_counter() - start
+
+    # 决策之间的 ACK 都进入观测值
+    decisions = n_packets // 1000
+    start = time.perf_counter()
+    for i in range(decisions):
+        for packet in packets[i * 1000 : (i + 1) * 1000]:
+            cc.on_packet_acked(now=packet.sent_time, packet=packet)
+            cc.on_rtt_measurement(now=0.0, rtt=0.06)
+        now[0] += 0.1
+        cc.get_observation()
+        cc.observer.reset()
+    stream = time.perf_counter() - start
+
+    return {
+        "packets": n_packets,
+        "observation_features": list(observation_features),
+        "on_packet_sent_ns": sent / n_packets * 1e9,
+        "on_packet_acked_ns": acked / n_packets * 1e9,
+        "on_rtt_measurement_ns": measured / n_packets * 1e9,
+        "ack_stream_ns_per_ack": stream / (decisions * 1000) * 1e9,
+        "acks_per_sec": decisions * 1000 / stream,
+    }
+
+
+def bench_ipc(n_messages: int = 10000) -> dict:
+    results = {
+        wire_format: benchmark_round_trip(wire_format, n_messages)
+        for wire_format in WIRE_FORMATS
+    }
+    results["shm"] = benchmark_shm_round_trip(n_messages)
+    return results
+
+
+def bench_env(n_episodes: int = 5, episode_length: int = 100) -> dict:
+    """
+    ``MetaConEnv`` reset latency and step rate end to end, with the
+    in-process trace emulator standing in for mm-link.
+    """
+    # 延迟导入：env 依赖 garage
+    from env import MetaConEnv
+
+    env = MetaConEnv(
+        backend="emulator",
+        max_episode_length=episode_length,
+        data_dir=os.path.join("/tmp", f"metacon_benchmark.{os.getpid()}"),
+    )
+    action = np.zeros(1)
+    resets = []
+    steps = 0
+    step_time = 0.0
+    for _ in range(n_episodes):
+        start = time.perf_counter()
+        env.reset()
+        resets.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(episode_length):
+            env.step(action)
+        step_time += time.perf_counter() - start
+        steps += episode_length
+    env.close()
+    return {
+        "backend": "emulator",
+        "trace_file": env.trace_file,
+        "decision_interval": env.decision_interval,
+        "episodes": n_episodes,
+        "first_reset_ms": resets[0] * 1000,
+        "reset_ms": float(np.median(resets[1:] or resets)) * 1000,
+        "steps_per_sec": steps / step_time,
+    }
+
+
+def run(sections=SECTIONS, quick: bool = False) -> dict:
+    scale = 10 if quick else 1
+    results = {}
+    if "controller" in sections:
+        results["controller"] = bench_controller(200000 // scale)
+        results["controller_all_features"] = bench_controller(
+            200000 // scale, OBSERVATION_FEATURES
+        )
+    if "ipc" in sections:
+        results["ipc"] = bench_ipc(10000 // scale)
+    if "env" in sections:
+        results["env"] = bench_env(n_episodes=5 if not quick else 2)
+    commit, dirty = _git_commit()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the controller, DRL transports and environment"
+    )
+    parser.add_argument(
+        "--output", default="benchmark.json", help="JSON file to write"
+    )
+    parser.add_argument(
+        "--sections", nargs="*", choices=SECTIONS, default=list(SECTIONS)
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="10x fewer iterations"
+    )
+    args = parser.parse_args()
+    report = run(args.sections, args.quick)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,358 @@
+import argparse
 import asyncio
-import sys
+import functools
+import signal
+import time
+from typing import Optional
 from aioquic.asyncio import connect
 from aioquic.asyncio.protocol import QuicConnectionProtocol
 from aioquic.quic.configuration import QuicConfiguration
-from aioquic.quic.events import HandshakeCompleted, StreamDataReceived
+from aioquic.quic.events import HandshakeCompleted
 import meta_con
+from event_log import EventRecorder
+from instrumentation import create_sink
+from receiver_stats import STAMP_SPACING, stamp_payload
+from shm_channel import TRANSPORTS
+
+TRAFFIC_PATTERNS = ("bulk", "onoff", "short")
+DEFAULT_CHUNK_SIZE = 16 * 1024
+
+
+class TrafficGenerator:
+    """
+    Offer load on a QUIC connection without growing the send buffers.
+
+    ``streams`` flows run side by side. ``"bulk"`` flows never end,
+    ``"onoff"`` flows send for ``on_time`` seconds and pause for
+    ``off_time`` seconds, and ``"short"`` flows carry ``flow_size`` bytes
+    each and are replaced by a new stream when they finish.
+
+    Every ``tick`` seconds the generator writes at most as much as
+    ``rate_mbps`` allows (no limit by default). Writes are also capped by
+    the stream flow-control credit. The bytes buffered in the streams,
+    sent or not, are kept below the congestion window plus
+    ``buffer_limit`` (one more window by default). That keeps enough data
+    queued for the congestion controller to fill its window. All writes
+    are slices of one preallocated payload.
+
+    The payload carries the send time every ``STAMP_SPACING`` bytes of
+    stream offset (see :mod:`receiver_stats`), so server.py can measure
+    one-way delay. Writes are therefore whole multiples of the spacing,
+    except for the last write of a short flow.
+    """
+
+    def __init__(
+        self,
+        protocol: QuicConnectionProtocol,
+        pattern: str = "bulk",
+        streams: int = 1,
+        rate_mbps: Optional[float] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        flow_size: int = 100 * 1000,
+        on_time: float = 1.0,
+        off_time: float = 1.0,
+        buffer_limit: Optional[int] = None,
+        tick: float = 0.001,
+    ):
+        if pattern not in TRAFFIC_PATTERNS:
+            raise ValueError(f"Unknown traffic pattern: {pattern}")
+        self.protocol = protocol
+        self.pattern = pattern
+        self.streams = streams
+        self.rate = rate_mbps * 1000 * 1000 / 8 if rate_mbps else None
+        self.chunk_size = max(chunk_size // STAMP_SPACING, 1) * STAMP_SPACING
+        self.flow_size = flow_size
+        self.on_time = on_time
+        self.off_time = off_time
+        self.buffer_limit = buffer_limit
+        self.tick = tick
+        self.payload = bytearray(self.chunk_size)
+        self._payload_view = memoryview(self.payload)
+        # [stream_id, 剩余字节数]，None 表示不结束
+        self._flows = []
+        # 已经写完但还没有全部被确认的短流
+        self._draining = []
+        self.bytes_offered = 0
+        self.flows_completed = 0
+
+    def _open_flow(self) -> list:
+        quic = self.protocol._quic
+        # 数据只从客户端流向服务端，单向流在发送完成后会被 aioquic 释放
+        stream_id = quic.get_next_available_stream_id(is_unidirectional=True)
+        # 写入空数据以创建流
+        quic.send_stream_data(stream_id, b"")
+        remaining = self.flow_size if self.pattern == "short" else None
+        return [stream_id, remaining]
+
+    def _queued_bytes(self) -> int:
+        streams = self.protocol._quic._streams
+        queued = 0
+        for stream_id, _ in self._flows:
+            sender = streams[stream_id].sender
+            queued += sender._buffer_stop - sender._buffer_start
+        draining = []
+        for stream_id in self._draining:
+            stream = streams.get(stream_id)
+            if stream is None:
+                continue
+            backlog = stream.sender._buffer_stop - stream.sender._buffer_start
+            if backlog:
+                queued += backlog
+                draining.append(stream_id)
+        self._draining = draining
+        return queued
+
+    def _write(self, budget: int) -> int:
+        """Write up to ``budget`` bytes round-robin over the flows."""
+        quic = self.protocol._quic
+        now = time.time()
+        written = 0
+        progress = True
+        while budget > 0 and progress:
+            progress = False
+            for i, flow in enumerate(self._flows):
+                stream_id, remaining = flow
+                stream = quic._streams[stream_id]
+                credit = stream.max_stream_data_remote - stream.sender._buffer_stop
+                size = min(self.chunk_size, budget, credit)
+                if remaining is not None:
+                    size = min(size, remaining)
+                end_stream = remaining is not None and size == remaining
+                if not end_stream:
+                    # 保持写入的起点和时间戳位置对齐
+                    size -= size % STAMP_SPACING
+                if size <= 0:
+                    continue
+                stamp_payload(self.payload, size, now)
+                quic.send_stream_data(
+                    stream_id, self._payload_view[:size], end_stream=end_stream
+                )
+                written += size
+                budget -= size
+                progress = True
+                if end_stream:
+                    self.flows_completed += 1
+                    self._draining.append(stream_id)
+                    self._flows[i] = self._open_flow()
+                elif remaining is not None:
+                    flow[1] = remaining - size
+                if budget <= 0:
+                    break
+        return written
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        recovery = self.protocol._quic._loss
+        self._flows = [self._open_flow() for _ in range(self.streams)]
+        last = loop.time()
+        phase_end = last + self.on_time
+        sending = True
+        tokens = 0.0
+        while True:
+            await asyncio.sleep(self.tick)
+            now = loop.time()
+            elapsed, last = now - last, now
+            if self.pattern == "onoff" and now >= phase_end:
+                sending = not sending
+                phase_end = now + (self.on_time if sending else self.off_time)
+            if not sending:
+                tokens = 0.0
+                continue
+            cwnd = recovery.congestion_window
+            limit = cwnd if self.buffer_limit is None else self.buffer_limit
+            budget = cwnd + limit - self._queued_bytes()
+            if self.rate is not None:
+                # 令牌桶，最多积累一个 chunk 或一个 tick 的量
+                burst = max(self.chunk_size, self.rate * self.tick)
+                tokens = min(tokens + self.rate * elapsed, burst)
+                budget = min(budget, int(tokens))
+            written = self._write(budget) if budget > 0 else 0
+            if written:
+                tokens -= written
+                self.bytes_offered += written
+                self.protocol.transmit()
+
 
 class EchoClientProtocol(QuicConnectionProtocol):
+    def __init__(self, *args, traffic_options: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 拥塞控制在连接创建时就已实例化，发送第一个包之前换上它的 pacer
+        meta_con.install_pacer(self._quic)
+        self.traffic_options = traffic_options or {}
+        self.traffic_generator = None
+        self.traffic_task = None
+
     def quic_event_received(self, event):
         if isinstance(event, HandshakeCompleted):
             print("Handshake completed!")
-            asyncio.ensure_future(self.send_data_loop())
-        elif isinstance(event, StreamDataReceived):
-            print(f"Client received: {event.data.decode()}")
-            # stream_id = self._quic.get_next_available_stream_id()
-            # self._quic.send_stream_data(stream_id, b"1111")
-
-    async def send_data_loop(self):
-        stream_id = self._quic.get_next_available_stream_id()
-        # 发送 1400 字节的数据
-        data = b"1" * 5000
-        while True:
-            self._quic.send_stream_data(stream_id, data)
-            await asyncio.sleep(0.00001)
+            self.traffic_generator = TrafficGenerator(self, **self.traffic_options)
+            self.traffic_task = asyncio.ensure_future(self.traffic_generator.run())
+
 
 async def main():
     # 加一段逻辑，解析命令行参数，支持指定ip和端口
-    if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} <ip> <port>")
-        return
-    ip = sys.argv[1]
-    port = int(sys.argv[2])
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ip")
+    parser.add_argument("port", type=int)
+    parser.add_argument(
+        "--cc", choices=("meta_con", "meta_con_embedded"), default="meta_con"
+    )
+    parser.add_argument(
+        "--policy", help="exported policy used by meta_con_embedded"
+    )
+    parser.add_argument(
+        "--drl-socket",
+        default=meta_con.DEFAULT_DRL_SOCKET,
+        help="unix socket of the environment that makes the decisions",
+    )
+    parser.add_argument(
+        "--drl-transport",
+        choices=TRANSPORTS,
+        default=meta_con.DEFAULT_DRL_TRANSPORT,
+        help="reach the environment over the socket or shared memory",
+    )
+    parser.add_argument(
+        "--decision-mode", choices=meta_con.DECISION_MODES, default="blocking"
+    )
+    parser.add_argument(
+        "--decision-deadline",
+        type=float,
+        default=0.5,
+        help="seconds an async decision may take before it is dropped",
+    )
+    parser.add_argument(
+        "--decision-interval",
+        type=float,
+        default=1.0,
+        help="seconds between two decisions",
+    )
+    parser.add_argument(
+        "--decision-rtt-multiple",
+        type=float,
+        default=None,
+        help="decide every N smoothed RTTs instead of a fixed interval",
+    )
+    parser.add_argument(
+        "--observation-features",
+        nargs="*",
+        choices=meta_con.OBSERVATION_FEATURES,
+        default=[],
+        help="optional features appended to the observation",
+    )
+    parser.add_argument(
+        "--min-delay-window",
+        type=float,
+        default=None,
+        help="seconds after which min_delay is refreshed (default: never)",
+    )
+    parser.add_argument(
+        "--metrics", help="write per-decision timings and counters to this file"
+    )
+    parser.add_argument(
+        "--metrics-format", choices=("binary", "csv", "dowel"), default="binary"
+    )
+    parser.add_argument(
+        "--pacing",
+        choices=meta_con.PACING_MODES,
+        default=None,
+        help="pace at cwnd/srtt (window) or at a rate set by the policy (direct)",
+    )
+    parser.add_argument("--pacing-gain", type=float, default=1.0)
+    parser.add_argument(
+        "--max-burst", type=int, default=2, help="packets sent back to back"
+    )
+    parser.add_argument(
+        "--record-events",
+        help="log every packet, RTT and decision event for event_log.py replay",
+    )
+    parser.add_argument("--traffic", choices=TRAFFIC_PATTERNS, default="bulk")
+    parser.add_argument("--streams", type=int, default=1)
+    parser.add_argument(
+        "--rate-mbps",
+        type=float,
+        default=None,
+        help="offered load; by default limited only by the congestion window",
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--flow-size", type=int, default=100 * 1000, help="bytes per short flow"
+    )
+    parser.add_argument("--on-time", type=float, default=1.0)
+    parser.add_argument("--off-time", type=float, default=1.0)
+    parser.add_argument(
+        "--buffer-limit",
+        type=int,
+        default=None,
+        help="bytes buffered beyond the congestion window (default: one window)",
+    )
+    args = parser.parse_args()
+    ip = args.ip
+    port = args.port
+    timing = {
+        "decision_interval": args.decision_interval,
+        "decision_rtt_multiple": args.decision_rtt_multiple,
+        "observation_features": args.observation_features,
+        "min_delay_window": args.min_delay_window,
+        "pacing": args.pacing,
+        "pacing_gain": args.pacing_gain,
+        "max_burst": args.max_burst,
+    }
+    metrics_sink = create_sink(args.metrics, args.metrics_format)
+    timing["metrics_sink"] = metrics_sink
+    event_recorder = None
+    if args.record_events:
+        event_recorder = EventRecorder(args.record_events)
+    timing["event_recorder"] = event_recorder
+    if args.cc == "meta_con_embedded":
+        meta_con.register_meta_con(
+            args.cc,
+            meta_con.EmbeddedMetaConCongestionControl,
+            policy_path=args.policy,
+            **timing,
+        )
+    else:
+        meta_con.register_meta_con(
+            args.cc,
+            decision_mode=args.decision_mode,
+            decision_deadline=args.decision_deadline,
+            drl_socket_path=args.drl_socket,
+            drl_transport=args.drl_transport,
+            **timing,
+        )
     configuration = QuicConfiguration(is_client=True)
     configuration.verify_mode = False
-    configuration.congestion_control_algorithm = "meta_con"
-
-    async with connect(
-        ip,
-        port,
-        configuration=configuration,
-        create_protocol=EchoClientProtocol,
-    ) as protocol:
-        print("Connected")
-        await protocol.wait_closed()
+    configuration.congestion_control_algorithm = args.cc
+
+    # env 用 SIGTERM 停止客户端，转成取消以便写完指标文件
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    try:
+        async with connect(
+            ip,
+            port,
+            configuration=configuration,
+            create_protocol=functools.partial(
+                EchoClientProtocol,
+                traffic_options={
+                    "pattern": args.traffic,
+                    "streams": args.streams,
+                    "rate_mbps": args.rate_mbps,
+                    "chunk_size": args.chunk_size,
+                    "flow_size": args.flow_size,
+                    "on_time": args.on_time,
+                    "off_time": args.off_time,
+                    "buffer_limit": args.buffer_limit,
+                },
+            ),
+        ) as protocol:
+            print("Connected")
+            await protocol.wait_closed()
+    finally:
+        if metrics_sink is not None:
+            metrics_sink.close()
+        if event_recorder is not None:
+            event_recorder.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,38 @@
+import time
+
+
+class WallClock:
+    """Seconds since the epoch, ``time.time()`` behind the clock interface."""
+
+    __slots__ = ()
+
+    def __call__(self) -> float:
+        return time.time()
+
+
+class ManualClock:
+    """
+    Clock that only moves when told to, for simulations and event replay.
+
+    Like :class:`WallClock` it is called to read the time, so it can be
+    passed wherever a ``clock`` callable is expected.
+    """
+
+    __slots__ = ("now",)
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def set(self, now: float) -> None:
+        if now < self.now:
+            raise ValueError(f"Clock cannot go back from {self.now} to {now}")
+        self.now = now
+
+    def advance(self, seconds: float) -> None:
+        self.set(self.now + seconds)
+
+
+WALL_CLOCK = WallClock()
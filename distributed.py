@@ -0,0 +1,768 @@
+import argparse
+import copy
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from queue import Empty, Full, Queue
+from typing import List, Optional
+
+import numpy as np
+from garage.sampler import Sampler
+
+from drl_comunication import recv_exactly
+from embedded_policy import NumpyGaussianMLPPolicy
+
+DEFAULT_LEARNER_PORT = 5960
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# 帧：4 字节大端长度 + 类型(1B) + 参数版本(4B) + 帧体
+_LENGTH = struct.Struct("!I")
+_HEAD = struct.Struct("<BI")
+# worker -> learner
+KIND_HELLO = 1
+KIND_PULL = 2
+KIND_TRAJECTORY = 3
+# learner -> worker
+KIND_WELCOME = 4
+KIND_PARAMS = 5
+KIND_CONTINUE = 6
+
+# 轨迹帧体：步数 + 观测维度 + 动作维度 + env_info 个数 + 键名长度，
+# 随后是键名（换行分隔）、float32 数组和 uint8 的 step_type
+_TRAJECTORY = struct.Struct("<IHHHH")
+_JSON_LENGTH = struct.Struct("<I")
+
+
+def parse_address(address: str, default_port: int = DEFAULT_LEARNER_PORT):
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, default_port
+    return host, int(port)
+
+
+def _send_frame(sock: socket.socket, kind: int, version: int, body=b"") -> None:
+    head = _LENGTH.pack(_HEAD.size + len(body)) + _HEAD.pack(kind, version)
+    sock.sendall(head + body)
+
+
+def _recv_frame(sock: socket.socket):
+    """``(kind, version, body)`` of the next frame, ``None`` once closed."""
+    raw_length = bytearray(_LENGTH.size)
+    if not recv_exactly(sock, memoryview(raw_length)):
+        return None
+    (length,) = _LENGTH.unpack(raw_length)
+    if not _HEAD.size <= length <= MAX_FRAME_SIZE:
+        raise ValueError(f"Bad frame size: {length} bytes")
+    payload = bytearray(length)
+    view = memoryview(payload)
+    while True:
+        try:
+            if not recv_exactly(sock, view):
+                return None
+            break
+        except socket.timeout:
+            # 长度已经读到，帧体必须读完
+            continue
+    kind, version = _HEAD.unpack_from(payload)
+    return kind, version, view[_HEAD.size :]
+
+
+def _json_body(data) -> bytes:
+    return json.dumps(data).encode()
+
+
+def encode_params(policy: NumpyGaussianMLPPolicy, task=None) -> bytes:
+    """Policy parameters and the task to sample, as float32 arrays."""
+    arrays = [w.T for w in policy.weights] + list(policy.biases) + [policy.log_std]
+    header = _json_body(
+        {
+            "task": task,
+            "n_layers": len(policy.weights),
+            "shapes": [list(a.shape) for a in arrays],
+            "hidden_nonlinearity": policy.hidden_nonlinearity,
+            "output_nonlinearity": policy.output_nonlinearity,
+        }
+    )
+    parts = [_JSON_LENGTH.pack(len(header)), header]
+    parts.extend(np.ascontiguousarray(a, dtype="<f4").tobytes() for a in arrays)
+    return b"".join(parts)
+
+
+def decode_params(body: memoryview):
+    """``(policy, task)`` of an :func:`encode_params` body."""
+    (length,) = _JSON_LENGTH.unpack_from(body)
+    offset = _JSON_LENGTH.size + length
+    header = json.loads(bytes(body[_JSON_LENGTH.size : offset]))
+    arrays = []
+    for shape in header["shapes"]:
+        count = int(np.prod(shape))
+        array = np.frombuffer(body, dtype="<f4", count=count, offset=offset)
+        arrays.append(array.reshape(shape).astype(np.float64))
+        offset += 4 * count
+    n = header["n_layers"]
+    policy = NumpyGaussianMLPPolicy(
+        weights=arrays[:n],
+        biases=arrays[n : 2 * n],
+        log_std=arrays[2 * n],
+        hidden_nonlinearity=header["hidden_nonlinearity"],
+        output_nonlinearity=header["output_nonlinearity"],
+    )
+    return policy, header["task"]
+
+
+def encode_trajectory(trajectory: dict) -> bytes:
+    """
+    One episode as float32 columns. ``log_std`` is state independent for a
+    garage ``GaussianMLPPolicy``, so it is sent once per episode.
+    """
+    observations = np.asarray(trajectory["observations"], dtype="<f4")
+    actions = np.asarray(trajectory["actions"], dtype="<f4")
+    steps, obs_dim = observations.shape
+    act_dim = actions.shape[1]
+    env_infos = trajectory["env_infos"]
+    keys = sorted(env_infos)
+    names = "\n".join(keys).encode()
+    parts = [
+        _TRAJECTORY.pack(steps, obs_dim, act_dim, len(keys), len(names)),
+        names,
+        observations.tobytes(),
+        np.asarray(trajectory["last_observation"], dtype="<f4").tobytes(),
+        actions.tobytes(),
+        np.asarray(trajectory["rewards"], dtype="<f4").tobytes(),
+        np.asarray(trajectory["mean"], dtype="<f4").tobytes(),
+        np.asarray(trajectory["log_std"], dtype="<f4").tobytes(),
+    ]
+    parts.extend(np.asarray(env_infos[key], dtype="<f4").tobytes() for key in keys)
+    parts.append(np.asarray(trajectory["step_types"], dtype="u1").tobytes())
+    return b"".join(parts)
+
+
+def decode_trajectory(body: memoryview) -> dict:
+    steps, obs_dim, act_dim, n_infos, names_length = _TRAJECTORY.unpack_from(body)
+    offset = _TRAJECTORY.size
+    names = bytes(body[offset : offset + names_length]).decode()
+    offset += names_length
+
+    def take(shape, dtype="<f4"):
+        nonlocal offset
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        array = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+        offset += dtype.itemsize * count
+        return array.reshape(shape).copy()
+
+    trajectory = {
+        "observations": take((steps, obs_dim)),
+        "last_observation": take((obs_dim,)),
+        "actions": take((steps, act_dim)),
+        "rewards": take((steps,)),
+        "mean": take((steps, act_dim)),
+        "log_std": take((act_dim,)),
+    }
+    keys = names.split("\n") if n_infos else []
+    trajectory["env_infos"] = {key: take((steps,)) for key in keys}
+    trajectory["step_types"] = take((steps,), "u1")
+    return trajectory
+
+
+class TrajectoryLearner:
+    """
+    Central end of the rollout split: a TCP server that hands the latest
+    policy parameters to :class:`RolloutWorker`\\ s and gathers their
+    episodes.
+
+    Every :meth:`publish` starts a new parameter version (policy and task)
+    and opens collection; :meth:`collect` then returns at least
+    ``num_samples`` steps sampled with exactly that version and closes
+    collection again. Episodes from older versions are counted in
+    :attr:`stale` and dropped, so the batch stays on-policy.
+
+    Backpressure: workers only get work while collection is open, and
+    received episodes go through a queue of ``queue_size``; when it is
+    full the connection's thread stops reading, so TCP flow control
+    blocks the worker's send.
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = DEFAULT_LEARNER_PORT,
+        env_kwargs: Optional[dict] = None,
+        wrapper_kwargs: Optional[dict] = None,
+        queue_size: int = 64,
+        verbose: bool = False,
+    ):
+        self.host = host
+        self.port = port
+        self.env_kwargs = env_kwargs or {}
+        self.wrapper_kwargs = wrapper_kwargs or {}
+        self.verbose = verbose
+        self.version = 0
+        self.received = 0
+        self.stale = 0
+        self._params = None
+        self._collecting = False
+        self._condition = threading.Condition()
+        self._queue = Queue(queue_size)
+        self._stop_event = threading.Event()
+        self._server = None
+        self._accept_thread = None
+        self._connections = {}
+        self._next_worker = 0
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def n_workers(self) -> int:
+        return len(self._connections)
+
+    def start(self) -> None:
+        if self._server is not None:
+            return
+        self._server = socket.create_server((self.host, self.port))
+        self._server.settimeout(1.0)
+        # port=0 时取系统分配的端口
+        self.port = self._server.getsockname()[1]
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+
+    def _accept_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                conn, peer = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.settimeout(1.0)
+            worker_id = self._next_worker
+            self._next_worker += 1
+            self._connections[worker_id] = conn
+            threading.Thread(
+                target=self._serve, args=(worker_id, conn, peer), daemon=True
+            ).start()
+
+    def _serve(self, worker_id: int, conn: socket.socket, peer) -> None:
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    frame = _recv_frame(conn)
+                except socket.timeout:
+                    continue
+                if frame is None:
+                    break
+                kind, version, body = frame
+                if kind == KIND_HELLO:
+                    hello = json.loads(bytes(body))
+                    if self.verbose:
+                        print(f"Worker {worker_id} joined from {peer}: {hello}")
+                    welcome = {
+                        "worker_id": worker_id,
+                        "env_kwargs": self.env_kwargs,
+                        "wrapper_kwargs": self.wrapper_kwargs,
+                    }
+                    _send_frame(conn, KIND_WELCOME, 0, _json_body(welcome))
+                elif kind == KIND_PULL:
+                    current = self._wait_for_work()
+                    if current is None:
+                        break
+                    current_version, params = current
+                    if version == current_version:
+                        _send_frame(conn, KIND_CONTINUE, current_version)
+                    else:
+                        _send_frame(conn, KIND_PARAMS, current_version, params)
+                elif kind == KIND_TRAJECTORY:
+                    self.received += 1
+                    if version != self.version:
+                        self.stale += 1
+                        continue
+                    trajectory = decode_trajectory(body)
+                    trajectory["version"] = version
+                    trajectory["worker"] = worker_id
+                    if not self._put(trajectory):
+                        break
+                else:
+                    raise ValueError(f"Unexpected frame kind {kind} from {peer}")
+        except (ConnectionError, ValueError) as e:
+            if self.verbose:
+                print(f"Worker {worker_id} dropped: {e}")
+        finally:
+            self._connections.pop(worker_id, None)
+            conn.close()
+
+    def _wait_for_work(self):
+        with self._condition:
+            while not self._collecting:
+                if self._stop_event.is_set():
+                    return None
+                self._condition.wait(1.0)
+            return self.version, self._params
+
+    def _put(self, trajectory: dict) -> bool:
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(trajectory, timeout=1.0)
+                return True
+            except Full:
+                continue
+        return False
+
+    def publish(self, policy: NumpyGaussianMLPPolicy, task=None) -> int:
+        """Make ``policy`` and ``task`` the new version and open collection."""
+        params = encode_params(policy, task)
+        with self._condition:
+            self.version += 1
+            self._params = params
+            self._collecting = True
+            self._condition.notify_all()
+        # 丢弃上一版本留在队列里的轨迹
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+            self.stale += 1
+        return self.version
+
+    def collect(self, num_samples: int, timeout: Optional[float] = None) -> List[dict]:
+        """
+        Episodes of the current version until they hold ``num_samples``
+        steps. Raises ``TimeoutError`` if that takes longer than ``timeout``
+        seconds, e.g. because no worker is connected.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        trajectories = []
+        steps = 0
+        try:
+            while steps < num_samples:
+                if self._stop_event.is_set():
+                    raise RuntimeError("Learner stopped")
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(
+                        f"{steps}/{num_samples} steps after {timeout}s "
+                        f"from {self.n_workers} workers"
+                    )
+                try:
+                    trajectory = self._queue.get(timeout=1.0)
+                except Empty:
+                    continue
+                if trajectory["version"] != self.version:
+                    self.stale += 1
+                    continue
+                trajectories.append(trajectory)
+                steps += len(trajectory["rewards"])
+        finally:
+            with self._condition:
+                self._collecting = False
+        return trajectories
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._server is not None:
+            self._server.close()
+            self._accept_thread.join()
+            self._server = None
+        for conn in list(self._connections.values()):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class RolloutWorker:
+    """
+    Remote sampler process: owns a :class:`~env.MetaConEnv` (emulator
+    backend unless the learner says otherwise), pulls parameters from a
+    :class:`TrajectoryLearner` whenever they changed, samples episodes
+    with the stochastic :class:`~embedded_policy.NumpyGaussianMLPPolicy`
+    and pushes each one back as soon as it is done.
+
+    The env is built from the ``env_kwargs`` and ``wrapper_kwargs`` (for
+    garage's ``normalize``) sent by the learner, so workers need no
+    configuration besides its address.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        seed: Optional[int] = None,
+        connect_timeout: float = 60.0,
+        verbose: bool = False,
+    ):
+        self.host, self.port = parse_address(address)
+        self.rng = np.random.default_rng(seed)
+        self.connect_timeout = connect_timeout
+        self.verbose = verbose
+        self.episodes = 0
+        self.steps = 0
+        self._sock = None
+        self._meta_con_env = None
+        self._env = None
+
+    def _connect(self) -> socket.socket:
+        # learner 可能比 worker 晚启动
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                sock = socket.create_connection((self.host, self.port))
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _make_env(self, env_kwargs: dict, wrapper_kwargs: dict):
+        from garage.envs import normalize
+
+        from env import MetaConEnv
+
+        self._meta_con_env = MetaConEnv(**{"backend": "emulator", **env_kwargs})
+        self._env = normalize(self._meta_con_env, **wrapper_kwargs)
+
+    def rollout(self, policy: NumpyGaussianMLPPolicy) -> dict:
+        """One episode, collected like garage's ``DefaultWorker``."""
+        env = self._env
+        max_length = env.spec.max_episode_length
+        observation, _ = env.reset()
+        observations, actions, rewards, step_types, means = [], [], [], [], []
+        env_infos = {}
+        while True:
+            action, agent_info = policy.sample_action(observation, self.rng)
+            env_step = env.step(action)
+            observations.append(observation)
+            actions.append(env_step.action)
+            rewards.append(env_step.reward)
+            step_types.append(env_step.step_type)
+            means.append(agent_info["mean"])
+            for key, value in env_step.env_info.items():
+                env_infos.setdefault(key, []).append(value)
+            observation = env_step.observation
+            if env_step.last or len(rewards) >= max_length:
+                break
+        return {
+            "observations": observations,
+            "last_observation": observation,
+            "actions": actions,
+            "rewards": rewards,
+            "step_types": step_types,
+            "mean": means,
+            "log_std": policy.log_std,
+            "env_infos": env_infos,
+        }
+
+    def run(self) -> None:
+        """Sample until the learner goes away."""
+        sock = self._sock = self._connect()
+        try:
+            hello = {"host": socket.gethostname(), "pid": os.getpid()}
+            _send_frame(sock, KIND_HELLO, 0, _json_body(hello))
+            frame = _recv_frame(sock)
+            if frame is None or frame[0] != KIND_WELCOME:
+                raise ConnectionError("Learner did not welcome this worker")
+            welcome = json.loads(bytes(frame[2]))
+            self._make_env(welcome["env_kwargs"], welcome["wrapper_kwargs"])
+            version = 0
+            policy = None
+            task = None
+            while True:
+                _send_frame(sock, KIND_PULL, version)
+                frame = _recv_frame(sock)
+                if frame is None:
+                    break
+                kind, version, body = frame
+                if kind == KIND_PARAMS:
+                    policy, new_task = decode_params(body)
+                    if new_task is not None and new_task != task:
+                        self._meta_con_env.set_task(new_task)
+                        task = new_task
+                elif kind != KIND_CONTINUE:
+                    raise ValueError(f"Unexpected frame kind {kind} from learner")
+                trajectory = self.rollout(policy)
+                _send_frame(
+                    sock, KIND_TRAJECTORY, version, encode_trajectory(trajectory)
+                )
+                self.episodes += 1
+                self.steps += len(trajectory["rewards"])
+        except ConnectionError as e:
+            if self.verbose:
+                print(f"Learner connection lost: {e}")
+        finally:
+            sock.close()
+            if self._env is not None:
+                self._env.close()
+            if self.verbose:
+                print(
+                    f"Worker {os.getpid()}: {self.episodes} episodes, "
+                    f"{self.steps} steps"
+                )
+
+
+def run_worker(address: str, seed: Optional[int] = None, verbose: bool = False):
+    RolloutWorker(address, seed=seed, verbose=verbose).run()
+
+
+def launch_local_workers(
+    address: str, n_workers: int, seed: Optional[int] = None
+) -> subprocess.Popen:
+    """
+    Start ``n_workers`` rollout workers for ``address`` on this machine.
+
+    They run under a fresh interpreter, not forked from the (threaded,
+    torch-importing) learner process.
+    """
+    args = [sys.executable, os.path.abspath(__file__), "worker", address]
+    args += ["-n", str(n_workers)]
+    if seed is not None:
+        args += ["--seed", str(seed)]
+    return subprocess.Popen(args)
+
+
+def to_episode_batch(trajectories: List[dict], env_spec):
+    """Build a garage ``EpisodeBatch`` from :class:`TrajectoryLearner` episodes."""
+    from garage import EpisodeBatch, StepType
+
+    env_info_keys = set(trajectories[0]["env_infos"])
+    env_infos = {
+        key: np.concatenate([t["env_infos"][key] for t in trajectories])
+        for key in env_info_keys
+    }
+    log_std = [np.broadcast_to(t["log_std"], t["mean"].shape) for t in trajectories]
+    step_types = np.concatenate([t["step_types"] for t in trajectories])
+    return EpisodeBatch(
+        env_spec=env_spec,
+        episode_infos={},
+        observations=np.concatenate([t["observations"] for t in trajectories]),
+        last_observations=np.stack([t["last_observation"] for t in trajectories]),
+        actions=np.concatenate([t["actions"] for t in trajectories]),
+        rewards=np.concatenate([t["rewards"] for t in trajectories]),
+        step_types=np.array([StepType(s) for s in step_types], dtype=StepType),
+        env_infos=env_infos,
+        agent_infos={
+            "mean": np.concatenate([t["mean"] for t in trajectories]),
+            "log_std": np.concatenate(log_std),
+        },
+        lengths=np.array([len(t["rewards"]) for t in trajectories], dtype="i"),
+    )
+
+
+class DistributedSampler(Sampler):
+    """
+    garage ``Sampler`` backed by a :class:`TrajectoryLearner`, a drop-in
+    for ``LocalSampler``/``MultiprocessingSampler`` in ``train.py``.
+
+    Each :meth:`obtain_samples` publishes the agent's parameters (and the
+    task of a ``SetTaskUpdate``) as a new version and waits for enough
+    steps from the connected :class:`RolloutWorker`\\ s. Workers can join
+    from any host with ``python distributed.py worker <host>:<port>``;
+    ``n_local_workers`` of them are started on this machine.
+
+    Args:
+        agents (Policy): garage ``GaussianMLPPolicy`` being trained. A copy
+            is kept to load the parameters of each update into.
+        envs (Environment): Environment whose spec the episodes follow.
+        env_kwargs (dict): ``MetaConEnv`` arguments of the workers.
+        wrapper_kwargs (dict): ``normalize`` arguments of the workers.
+    """
+
+    def __init__(
+        self,
+        agents,
+        envs,
+        max_episode_length: Optional[int] = None,
+        host: str = "0.0.0.0",
+        port: int = DEFAULT_LEARNER_PORT,
+        env_kwargs: Optional[dict] = None,
+        wrapper_kwargs: Optional[dict] = None,
+        n_local_workers: int = 0,
+        queue_size: int = 64,
+        sample_timeout: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        # pylint: disable=super-init-not-called
+        self._policy = copy.deepcopy(agents)
+        self._env_spec = envs.spec
+        env_kwargs = dict(env_kwargs or {})
+        if max_episode_length is not None:
+            env_kwargs["max_episode_length"] = max_episode_length
+        self._learner = TrajectoryLearner(
+            host,
+            port,
+            env_kwargs=env_kwargs,
+            wrapper_kwargs=wrapper_kwargs,
+            queue_size=queue_size,
+        )
+        self._learner.start()
+        self._sample_timeout = sample_timeout
+        self._task = None
+        self._local_workers = None
+        if n_local_workers:
+            address = f"127.0.0.1:{self._learner.port}"
+            self._local_workers = launch_local_workers(address, n_local_workers, seed)
+        self.total_env_steps = 0
+
+    @property
+    def learner(self) -> TrajectoryLearner:
+        return self._learner
+
+    def _update_task(self, env_update) -> None:
+        from garage.sampler.env_update import SetTaskUpdate
+
+        if env_update is None:
+            return
+        if isinstance(env_update, SetTaskUpdate):
+            # pylint: disable=protected-access
+            self._task = env_update._task
+            return
+        # 远端 worker 自己构造 env，只能同步任务
+        raise TypeError(
+            "DistributedSampler only supports SetTaskUpdate env updates, "
+            f"got {type(env_update).__name__}"
+        )
+
+    def obtain_samples(self, itr, num_samples, agent_update, env_update=None):
+        """Collect at least ``num_samples`` steps with the updated agent."""
+        from embedded_policy import from_garage_policy
+
+        if agent_update is not None:
+            if hasattr(agent_update, "get_param_values"):
+                agent_update = agent_update.get_param_values()
+            self._policy.set_param_values(agent_update)
+        self._update_task(env_update)
+        self._learner.publish(from_garage_policy(self._policy), self._task)
+        trajectories = self._learner.collect(num_samples, self._sample_timeout)
+        batch = to_episode_batch(trajectories, self._env_spec)
+        self.total_env_steps += int(sum(batch.lengths))
+        return batch
+
+    def shutdown_worker(self):
+        self._learner.stop()
+        if self._local_workers is not None:
+            try:
+                self._local_workers.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._local_workers.terminate()
+            self._local_workers = None
+
+
+def benchmark(
+    n_workers: int = 2,
+    iterations: int = 3,
+    num_samples: int = 1000,
+    env_kwargs: Optional[dict] = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Learner loop with local workers and a random policy, without torch:
+    publishes ``iterations`` versions and collects ``num_samples`` steps
+    of each.
+    """
+    from env import MetaConEnv
+
+    env_kwargs = {"max_episode_length": 100, **(env_kwargs or {})}
+    spec_env = MetaConEnv(**{"backend": "emulator", **env_kwargs})
+    obs_dim = spec_env.observation_space.shape[0]
+    act_dim = spec_env.action_space.shape[0]
+    rng = np.random.default_rng(seed)
+    learner = TrajectoryLearner("127.0.0.1", 0, env_kwargs=env_kwargs)
+    learner.start()
+    workers = launch_local_workers(f"127.0.0.1:{learner.port}", n_workers, seed)
+    results = []
+    try:
+        for _ in range(iterations):
+            sizes = [obs_dim, 64, 64, act_dim]
+            weights = [
+                rng.normal(0, 0.1, (n_out, n_in))
+                for n_in, n_out in zip(sizes, sizes[1:])
+            ]
+            # 均值为 0 的小幅随机游走：窗口没有上限，偏向一侧的策略会让
+            # 模拟器每毫秒发出海量的包
+            weights[-1][:] = 0
+            policy = NumpyGaussianMLPPolicy(
+                weights=weights,
+                biases=[np.zeros(n) for n in sizes[1:]],
+                log_std=np.full(act_dim, -2.0),
+            )
+            started = time.perf_counter()
+            version = learner.publish(policy)
+            trajectories = learner.collect(num_samples, timeout=600)
+            elapsed = time.perf_counter() - started
+            steps = sum(len(t["rewards"]) for t in trajectories)
+            results.append(
+                {
+                    "version": version,
+                    "episodes": len(trajectories),
+                    "steps": steps,
+                    "steps_per_sec": steps / elapsed,
+                    "workers": sorted({t["worker"] for t in trajectories}),
+                    "mean_reward": float(
+                        np.mean([t["rewards"].sum() for t in trajectories])
+                    ),
+                }
+            )
+    finally:
+        learner.stop()
+        workers.wait(timeout=30)
+        spec_env.close()
+    return {"iterations": results, "received": learner.received, "stale": learner.stale}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Distributed rollout workers for train.py"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker = subparsers.add_parser("worker", help="run rollout workers")
+    worker.add_argument("learner", help="host:port of the learner")
+    worker.add_argument("-n", "--workers", type=int, default=1)
+    worker.add_argument("--seed", type=int, default=None)
+    worker.add_argument("--verbose", action="store_true")
+    bench = subparsers.add_parser(
+        "benchmark", help="learner with local workers and a random policy"
+    )
+    bench.add_argument("-n", "--workers", type=int, default=2)
+    bench.add_argument("--iterations", type=int, default=3)
+    bench.add_argument("--samples", type=int, default=1000)
+    bench.add_argument("--max-episode-length", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        result = benchmark(
+            args.workers,
+            args.iterations,
+            args.samples,
+            {"max_episode_length": args.max_episode_length},
+        )
+        print(json.dumps(result, indent=2))
+        return
+
+    if args.workers == 1:
+        run_worker(args.learner, args.seed, args.verbose)
+        return
+    import multiprocessing
+
+    processes = []
+    for i in range(args.workers):
+        seed = None if args.seed is None else args.seed + i
+        process = multiprocessing.Process(
+            target=run_worker, args=(args.learner, seed, args.verbose)
+        )
+        process.start()
+        processes.append(process)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,170 @@
+import asyncio
 import socket
 import os
 import time
 import threading
 import struct
 import json
-from queue import Queue
+from queue import Empty, Queue
+from typing import Callable
+
+WIRE_JSON = "json"
+WIRE_BINARY = "binary"
+WIRE_FORMATS = (WIRE_JSON, WIRE_BINARY)
+
+# 帧头：4 字节大端长度
+_LENGTH = struct.Struct("!I")
+# 二进制帧体：类型(1B) + 流编号(4B) + 序号(4B) + float64 个数(2B) + 小端 float64 数组
+_BINARY_HEAD = struct.Struct("<BIIH")
+KIND_JSON = 0
+KIND_OBSERVATION = 1
+KIND_ACTION = 2
+MAX_FRAME_SIZE = 64 * 1024
+
+# 可以随观测值/动作一起编码进二进制帧头的标签
+TAG_KEYS = ("flow", "seq")
+_OBSERVATION_KEYS = frozenset(("observation", "window", *TAG_KEYS))
+_ACTION_KEYS = frozenset(("action", "pacing", *TAG_KEYS))
+_float_structs = {}
+
+
+def _floats(count: int) -> struct.Struct:
+    layout = _float_structs.get(count)
+    if layout is None:
+        layout = _float_structs[count] = struct.Struct(f"<{count}d")
+    return layout
+
+
+def encode_message(msg: dict, wire_format: str, buf: bytearray) -> int:
+    """
+    Encode ``msg`` as one length-prefixed frame into ``buf``.
+
+    In binary mode observations and actions (optionally tagged with a
+    ``flow`` id and a ``seq`` number) use a fixed float64 layout and any
+    other message is carried as a JSON body. Returns the frame size.
+    """
+    if wire_format == WIRE_BINARY:
+        keys = msg.keys()
+        if "observation" in msg and "window" in msg and keys <= _OBSERVATION_KEYS:
+            values = list(msg["observation"])
+            values.append(msg["window"])
+            kind = KIND_OBSERVATION
+        elif "action" in msg and keys <= _ACTION_KEYS:
+            values = [msg["action"]]
+            if "pacing" in msg:
+                values.append(msg["pacing"])
+            kind = KIND_ACTION
+        else:
+            values = None
+        if values is not None:
+            count = len(values)
+            _BINARY_HEAD.pack_into(
+                buf,
+                _LENGTH.size,
+                kind,
+                msg.get("flow", 0),
+                msg.get("seq", 0),
+                count,
+            )
+            _floats(count).pack_into(buf, _LENGTH.size + _BINARY_HEAD.size, *values)
+            size = _BINARY_HEAD.size + 8 * count
+            _LENGTH.pack_into(buf, 0, size)
+            return _LENGTH.size + size
+        body = bytes((KIND_JSON,)) + json.dumps(msg).encode()
+    else:
+        body = json.dumps(msg).encode()
+    size = len(body)
+    _LENGTH.pack_into(buf, 0, size)
+    buf[_LENGTH.size : _LENGTH.size + size] = body
+    return _LENGTH.size + size
+
+
+def decode_message(payload: memoryview, wire_format: str) -> dict:
+    if wire_format != WIRE_BINARY:
+        return json.loads(bytes(payload))
+    if payload[0] == KIND_JSON:
+        return json.loads(bytes(payload[1:]))
+    kind, flow, seq, count = _BINARY_HEAD.unpack_from(payload)
+    values = _floats(count).unpack_from(payload, _BINARY_HEAD.size)
+    if kind == KIND_OBSERVATION:
+        return {
+            "observation": list(values[:-1]),
+            "window": values[-1],
+            "flow": flow,
+            "seq": seq,
+        }
+    if kind == KIND_ACTION:
+        msg = {"action": values[0], "flow": flow, "seq": seq}
+        if count > 1:
+            msg["pacing"] = values[1]
+        return msg
+    raise ValueError(f"Unknown frame kind: {kind}")
+
+
+def negotiate_wire_format(msg: dict):
+    """
+    Return the wire format requested by a client hello, or None if ``msg``
+    is not a hello. Unsupported formats fall back to JSON.
+    """
+    hello = msg.get("hello")
+    if hello is None:
+        return None
+    wire_format = hello.get("wire_format", WIRE_JSON)
+    return wire_format if wire_format in WIRE_FORMATS else WIRE_JSON
+
+
+def recv_exactly(sock: socket.socket, view: memoryview) -> bool:
+    """Fill ``view`` from ``sock``; returns False if the peer closed first."""
+    received = 0
+    while received < len(view):
+        try:
+            n = sock.recv_into(view[received:])
+        except socket.timeout:
+            # 只在帧边界上把超时交给调用方，帧中间的超时继续等待
+            if received == 0:
+                raise
+            continue
+        if n == 0:
+            return False
+        received += n
+    return True
+
+
+def recv_frame(sock: socket.socket, buf: bytearray):
+    """Read one frame into the preallocated ``buf`` and return its body."""
+    view = memoryview(buf)
+    if not recv_exactly(sock, view[: _LENGTH.size]):
+        return None
+    msglen = _LENGTH.unpack_from(buf)[0]
+    if msglen > len(buf):
+        raise ValueError(f"Frame too large: {msglen} bytes")
+    if not recv_exactly(sock, view[:msglen]):
+        return None
+    return view[:msglen]
+
+
+async def read_message(reader: asyncio.StreamReader, wire_format: str) -> dict:
+    """asyncio version of :func:`recv_frame` followed by decoding."""
+    raw_msglen = await reader.readexactly(_LENGTH.size)
+    payload = await reader.readexactly(_LENGTH.unpack(raw_msglen)[0])
+    return decode_message(payload, wire_format)
 
 
 class DrlComunicationServer:
-    def __init__(self, unix_socket_path: str):
+    """
+    Lockstep observation/action server for one controller. The wire format
+    is negotiated by the client: a ``{"hello": {"wire_format": ...}}`` first
+    frame switches the connection to that format, otherwise JSON is used.
+    """
+
+    def __init__(self, unix_socket_path: str, verbose: bool = False):
         self.unix_socket_path = unix_socket_path
+        self.verbose = verbose
+        self.wire_format = WIRE_JSON
         self.inner_thread = None
         self.stop_event = threading.Event()
         self.ready_event = threading.Event()
+        self.connected_event = threading.Event()
         self.receive_queue = Queue(1)
         self.send_queue = Queue(1)
 
@@ -24,39 +176,85 @@ class DrlComunicationServer:
         self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self.server.bind(self.unix_socket_path)
         self.server.listen(1)
+        # accept/等待动作都带超时，stop_server 不会被卡住
+        self.server.settimeout(1.0)
         self.ready_event.set()
-        client, _ = self.server.accept()
+        client = self._accept()
+        if client is None:
+            self.server.close()
+            return
         client.settimeout(1.0)  # 设置超时
+        self.connected_event.set()
+        recv_buf = bytearray(MAX_FRAME_SIZE)
+        send_buf = bytearray(MAX_FRAME_SIZE)
+        self.wire_format = WIRE_JSON
+        negotiating = True
 
         while not self.stop_event.is_set():
-            # 读取前四个字节，获取数据长度
             try:
-                raw_msglen = client.recv(4)
+                payload = recv_frame(client, recv_buf)
             except socket.timeout:
                 continue
-            if not raw_msglen:
+            if payload is None:
                 break
-            msglen = struct.unpack("!I", raw_msglen)[0]
-            data = client.recv(msglen).decode()
-            msg = json.loads(data)
+            msg = decode_message(payload, self.wire_format)
+
+            if negotiating:
+                negotiating = False
+                wire_format = negotiate_wire_format(msg)
+                if wire_format is not None:
+                    size = encode_message(
+                        {"wire_format": wire_format}, WIRE_JSON, send_buf
+                    )
+                    client.sendall(memoryview(send_buf)[:size])
+                    self.wire_format = wire_format
+                    continue
 
             # 将消息放到接收队列
             self.receive_queue.put(msg)
 
             # 从发送队列取一个消息来进行响应
-            response = self.send_queue.get()
-            send_data = json.dumps(response)
-            # 先发送四个字节数据长度
-            msglen = struct.pack("!I", len(send_data))
-            client.send(msglen)
-            client.send(send_data.encode())
+            response = self._wait_response()
+            if response is None:
+                break
+            # 回显流编号和序号，异步客户端据此识别过期的动作
+            tags = {key: msg[key] for key in TAG_KEYS if key in msg}
+            if tags:
+                response = {**tags, **response}
+            size = encode_message(response, self.wire_format, send_buf)
+            client.sendall(memoryview(send_buf)[:size])
+
+        self.connected_event.clear()
+        client.close()
+        self.server.close()
+
+    def _accept(self):
+        while not self.stop_event.is_set():
+            try:
+                return self.server.accept()[0]
+            except socket.timeout:
+                continue
+        return None
+
+    def _wait_response(self):
+        while not self.stop_event.is_set():
+            try:
+                return self.send_queue.get(timeout=1.0)
+            except Empty:
+                continue
+        return None
+
+    def is_connected(self) -> bool:
+        """Whether a controller is connected and the server is still serving it."""
+        return self.inner_thread is not None and self.connected_event.is_set()
 
     def send(self, msg: dict):
         self.send_queue.put(msg)
 
     def receive(self) -> dict:
         res = self.receive_queue.get()
-        print(f"Server received: {res}")
+        if self.verbose:
+            print(f"Server received: {res}")
         return res
 
     def start_server(self):
@@ -72,12 +270,22 @@ class DrlComunicationServer:
             self.stop_event.set()
             self.inner_thread.join()
             self.inner_thread = None
+        try:
+            os.unlink(self.unix_socket_path)
+        except FileNotFoundError:
+            pass
 
 
 class DrlComunicationClient:
-    def __init__(self, unix_socket_path: str):
+    def __init__(self, unix_socket_path: str, wire_format: str = WIRE_BINARY):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"Unknown wire format: {wire_format}")
         self.unix_socket_path = unix_socket_path
+        self.requested_wire_format = wire_format
+        self.wire_format = WIRE_JSON
         self.client = None
+        self._recv_buf = bytearray(MAX_FRAME_SIZE)
+        self._send_buf = bytearray(MAX_FRAME_SIZE)
 
     def is_connected(self):
         return self.client is not None
@@ -85,47 +293,211 @@ class DrlComunicationClient:
     def connect(self):
         self.client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self.client.connect(self.unix_socket_path)
+        self.wire_format = WIRE_JSON
+        if self.requested_wire_format != WIRE_JSON:
+            # 协商二进制格式，服务端回复实际采用的格式
+            self.send({"hello": {"wire_format": self.requested_wire_format}})
+            reply = self.receive()
+            self.wire_format = reply.get("wire_format", WIRE_JSON)
 
     def send(self, msg):
-        send_data = json.dumps(msg)
-        msglen = struct.pack("!I", len(send_data))
-        self.client.send(msglen)
-        self.client.send(send_data.encode())
+        size = encode_message(msg, self.wire_format, self._send_buf)
+        self.client.sendall(memoryview(self._send_buf)[:size])
 
     def receive(self):
-        # 读取前四个字节，获取数据长度
-        raw_msglen = self.client.recv(4)
-        if not raw_msglen:
+        payload = recv_frame(self.client, self._recv_buf)
+        if payload is None:
             return None
-        msglen = struct.unpack("!I", raw_msglen)[0]
-        data = self.client.recv(msglen).decode()
-        return json.loads(data)
+        return decode_message(payload, self.wire_format)
 
     def close(self):
         self.client.close()
 
 
-# if __name__ == "__main__":
-#     server = DrlComunicationServer("/tmp/drl_comunication")
-#     server.start_server()
+class AsyncDrlComunicationClient:
+    """
+    asyncio counterpart of :class:`DrlComunicationClient`. ``send_nowait``
+    only queues the frame on the transport, and every reply is handed to
+    ``on_message`` by a reader task running on the same event loop.
+    """
+
+    def __init__(
+        self,
+        unix_socket_path: str,
+        on_message: Callable[[dict], None],
+        wire_format: str = WIRE_BINARY,
+    ):
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"Unknown wire format: {wire_format}")
+        self.unix_socket_path = unix_socket_path
+        self.on_message = on_message
+        self.requested_wire_format = wire_format
+        self.wire_format = WIRE_JSON
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._send_buf = bytearray(MAX_FRAME_SIZE)
+
+    def is_connected(self):
+        return self._writer is not None and self._reader_task is not None
+
+    async def connect(self):
+        reader, writer = await asyncio.open_unix_connection(self.unix_socket_path)
+        self._reader, self._writer = reader, writer
+        self.wire_format = WIRE_JSON
+        if self.requested_wire_format != WIRE_JSON:
+            self.send_nowait({"hello": {"wire_format": self.requested_wire_format}})
+            reply = await read_message(self._reader, self.wire_format)
+            self.wire_format = reply.get("wire_format", WIRE_JSON)
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    def send_nowait(self, msg: dict):
+        size = encode_message(msg, self.wire_format, self._send_buf)
+        # transport 可能暂存数据，不能直接交出可复用的缓冲区
+        self._writer.write(bytes(memoryview(self._send_buf)[:size]))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                self.on_message(await read_message(self._reader, self.wire_format))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writer = None
+            self._reader_task = None
+
+    def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+
+
+class MultiplexedDrlChannel:
+    """
+    One :class:`AsyncDrlComunicationClient` connection shared by every flow
+    of a process. Each flow gets a :class:`FlowChannel` with the async
+    client API; replies are routed back by their ``flow`` tag, which the
+    other end echoes (as :class:`DrlComunicationServer` and
+    ``inference_server.BatchedInferenceServer`` do).
+    """
+
+    def __init__(self, unix_socket_path: str, wire_format: str = WIRE_BINARY):
+        self.unix_socket_path = unix_socket_path
+        self._client = AsyncDrlComunicationClient(
+            unix_socket_path, on_message=self._dispatch, wire_format=wire_format
+        )
+        self._flows = {}
+        self._connect_task = None
+        # 找不到对应流的回复，例如流已经关闭
+        self.unroutable = 0
+
+    def open_flow(self, flow_id: int, on_message: Callable[[dict], None]):
+        if flow_id in self._flows:
+            raise ValueError(f"Flow {flow_id} is already open")
+        self._flows[flow_id] = on_message
+        return FlowChannel(self, flow_id)
+
+    def is_connected(self) -> bool:
+        return self._client.is_connected()
+
+    async def connect(self) -> None:
+        """Connect once; concurrent callers wait for the same attempt."""
+        task = self._connect_task
+        if task is None or (task.done() and not self._client.is_connected()):
+            task = self._connect_task = asyncio.ensure_future(self._client.connect())
+        await asyncio.shield(task)
+
+    def send_nowait(self, msg: dict) -> None:
+        self._client.send_nowait(msg)
+
+    def _dispatch(self, msg: dict) -> None:
+        on_message = self._flows.get(msg.get("flow"))
+        if on_message is None:
+            self.unroutable += 1
+            return
+        on_message(msg)
+
+    def _close_flow(self, flow_id: int) -> None:
+        self._flows.pop(flow_id, None)
+
+    def close(self) -> None:
+        self._flows.clear()
+        self._client.close()
+
+
+class FlowChannel:
+    """The view of one flow on a :class:`MultiplexedDrlChannel`."""
+
+    def __init__(self, channel: MultiplexedDrlChannel, flow_id: int):
+        self.channel = channel
+        self.flow_id = flow_id
+
+    def is_connected(self) -> bool:
+        return self.channel.is_connected()
+
+    async def connect(self) -> None:
+        await self.channel.connect()
+
+    def send_nowait(self, msg: dict) -> None:
+        msg["flow"] = self.flow_id
+        self.channel.send_nowait(msg)
+
+    def close(self) -> None:
+        # 只注销本流，共享连接由 channel 的所有者关闭
+        self.channel._close_flow(self.flow_id)
+
+
+def benchmark_round_trip(
+    wire_format: str, n_messages: int = 10000, unix_socket_path: str = None
+) -> dict:
+    """
+    Measure observation/action round trips through a local server.
+
+    Returns the median and 99th percentile latency in microseconds and the
+    number of round trips per second.
+    """
+    if unix_socket_path is None:
+        unix_socket_path = f"/tmp/drl_comunication_bench.{os.getpid()}"
+    server = DrlComunicationServer(unix_socket_path, verbose=False)
+    server.start_server()
+    client = DrlComunicationClient(unix_socket_path, wire_format=wire_format)
+    client.connect()
 
-#     time.sleep(1)
+    observation = [12345678.0, 23456789.0, 0.061, 0.06, 0, 0.0605, 120000.0]
+    latencies = []
+    begin = time.perf_counter()
+    for _ in range(n_messages):
+        start = time.perf_counter()
+        client.send({"observation": observation, "window": 120000.0})
+        server.receive()
+        server.send({"action": 0.1})
+        client.receive()
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - begin
 
-#     client = DrlComunicationClient("/tmp/drl_comunication")
-#     client.connect()
+    client.close()
+    server.stop_server()
+    latencies.sort()
+    return {
+        "wire_format": wire_format,
+        "messages": n_messages,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "round_trips_per_sec": n_messages / elapsed,
+    }
 
-#     client.send({"msg": "hello"})
-#     msg = server.receive()
-#     print(f"Server received: {msg}")
-#     server.send({"msg": "world"})
-#     print(client.receive())
 
-#     time.sleep(2)
-#     client.send({"msg": "hello2"})
-#     msg = server.receive()
-#     print(f"Server received: {msg}")
-#     server.send({"msg": "world2"})
-#     print(client.receive())
+if __name__ == "__main__":
+    # python drl_comunication.py [n_messages]
+    import sys
 
-#     server.stop_server()
-#     client.close()
+    n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for wire_format in WIRE_FORMATS:
+        result = benchmark_round_trip(wire_format, n_messages)
+        print(
+            f"{wire_format:>6}: p50 {result['p50_us']:.1f} us, "
+            f"p99 {result['p99_us']:.1f} us, "
+            f"{result['round_trips_per_sec']:.0f} round trips/s"
+        )
@@ -0,0 +1,267 @@
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+
+_NONLINEARITIES = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+    None: None,
+}
+
+
+class NumpyGaussianMLPPolicy:
+    """
+    Inference-only copy of a garage ``GaussianMLPPolicy``.
+
+    Only the mean network is evaluated (deterministic action), with the
+    observation normalization and action scaling of garage's
+    ``NormalizedEnv`` applied around it, so the output can be used as the
+    MetaCon action directly. Parameters come from :func:`export_policy`.
+    """
+
+    def __init__(
+        self,
+        weights: Sequence[np.ndarray],
+        biases: Sequence[np.ndarray],
+        log_std: np.ndarray,
+        hidden_nonlinearity: Optional[str] = "tanh",
+        output_nonlinearity: Optional[str] = None,
+        obs_mean: Optional[np.ndarray] = None,
+        obs_var: Optional[np.ndarray] = None,
+        action_low: Optional[np.ndarray] = None,
+        action_high: Optional[np.ndarray] = None,
+        expected_action_scale: float = 1.0,
+    ):
+        # 预先转置，前向时直接 obs @ W
+        self.weights = [np.ascontiguousarray(w.T, dtype=np.float64) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float64) for b in biases]
+        self.log_std = np.asarray(log_std, dtype=np.float64)
+        self.hidden_nonlinearity = hidden_nonlinearity
+        self.output_nonlinearity = output_nonlinearity
+        self._hidden_fn = _NONLINEARITIES[hidden_nonlinearity]
+        self._output_fn = _NONLINEARITIES[output_nonlinearity]
+        self.obs_mean = obs_mean
+        self.obs_var = obs_var
+        self._obs_scale = None
+        if obs_mean is not None and obs_var is not None:
+            self._obs_scale = 1 / (np.sqrt(obs_var) + 1e-8)
+        self.action_low = action_low
+        self.action_high = action_high
+        self.expected_action_scale = expected_action_scale
+
+    @property
+    def observation_dim(self) -> int:
+        return self.weights[0].shape[0]
+
+    @property
+    def action_dim(self) -> int:
+        return self.weights[-1].shape[1]
+
+    def get_mean_actions(self, observations: np.ndarray) -> np.ndarray:
+        """Return the raw mean network output for a batch of observations."""
+        x = np.asarray(observations, dtype=np.float64)
+        if self._obs_scale is not None:
+            x = (x - self.obs_mean) * self._obs_scale
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w + b
+            fn = self._output_fn if i == last else self._hidden_fn
+            if fn is not None:
+                x = fn(x)
+        return x
+
+    def scale_actions(self, actions: np.ndarray) -> np.ndarray:
+        if self.action_low is None or self.action_high is None:
+            return actions
+        lb, ub = self.action_low, self.action_high
+        scale = self.expected_action_scale
+        scaled = lb + (actions + scale) * (0.5 * (ub - lb) / scale)
+        return np.clip(scaled, lb, ub)
+
+    def get_actions(self, observations: np.ndarray) -> np.ndarray:
+        """Deterministic environment actions for a batch of observations."""
+        return self.scale_actions(self.get_mean_actions(observations))
+
+    def get_action(self, observation: Sequence[float]) -> np.ndarray:
+        return self.get_actions(np.asarray(observation)[None, :])[0]
+
+    def sample_actions(self, observations: np.ndarray, rng=None):
+        """
+        Stochastic actions for a batch of observations, drawn from the
+        Gaussian like garage's ``get_actions``, with its ``mean`` and
+        ``log_std`` agent infos (before action scaling).
+        """
+        mean = self.get_mean_actions(observations)
+        rng = np.random.default_rng() if rng is None else rng
+        log_std = np.broadcast_to(self.log_std, mean.shape)
+        actions = mean + rng.standard_normal(mean.shape) * np.exp(log_std)
+        return self.scale_actions(actions), {"mean": mean, "log_std": log_std}
+
+    def sample_action(self, observation: Sequence[float], rng=None):
+        actions, infos = self.sample_actions(np.asarray(observation)[None, :], rng)
+        return actions[0], {key: value[0] for key, value in infos.items()}
+
+    def save(self, path: str) -> None:
+        arrays = {
+            "n_layers": np.array(len(self.weights)),
+            "log_std": self.log_std,
+            "hidden_nonlinearity": np.array(self.hidden_nonlinearity or ""),
+            "output_nonlinearity": np.array(self.output_nonlinearity or ""),
+            "expected_action_scale": np.array(self.expected_action_scale),
+        }
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"weight_{i}"] = w.T
+            arrays[f"bias_{i}"] = b
+        optional = {
+            "obs_mean": self.obs_mean,
+            "obs_var": self.obs_var,
+            "action_low": self.action_low,
+            "action_high": self.action_high,
+        }
+        for key, value in optional.items():
+            if value is not None:
+                arrays[key] = value
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyGaussianMLPPolicy":
+        with np.load(path) as data:
+            n_layers = int(data["n_layers"])
+            return cls(
+                weights=[data[f"weight_{i}"] for i in range(n_layers)],
+                biases=[data[f"bias_{i}"] for i in range(n_layers)],
+                log_std=data["log_std"],
+                hidden_nonlinearity=str(data["hidden_nonlinearity"]) or None,
+                output_nonlinearity=str(data["output_nonlinearity"]) or None,
+                obs_mean=data["obs_mean"] if "obs_mean" in data else None,
+                obs_var=data["obs_var"] if "obs_var" in data else None,
+                action_low=data["action_low"] if "action_low" in data else None,
+                action_high=data["action_high"] if "action_high" in data else None,
+                expected_action_scale=float(data["expected_action_scale"]),
+            )
+
+
+_policy_cache = {}
+
+
+def load_policy(path: str) -> NumpyGaussianMLPPolicy:
+    """Load an exported policy once per process."""
+    path = os.path.abspath(path)
+    policy = _policy_cache.get(path)
+    if policy is None:
+        policy = _policy_cache[path] = NumpyGaussianMLPPolicy.load(path)
+    return policy
+
+
+def nonlinearity_name(fn) -> Optional[str]:
+    """Name under which a torch nonlinearity is stored in exported policies."""
+    if fn is None:
+        return None
+    name = getattr(fn, "__name__", type(fn).__name__).lower()
+    if name not in _NONLINEARITIES:
+        raise ValueError(f"Unsupported nonlinearity: {name}")
+    return name
+
+
+def from_garage_policy(policy, env=None) -> NumpyGaussianMLPPolicy:
+    """
+    Convert a garage torch ``GaussianMLPPolicy``. If ``env`` is a garage
+    ``NormalizedEnv`` its observation statistics and action scaling are
+    exported as well.
+    """
+    module = policy._module
+    mean_module = module._mean_module
+    layers = list(mean_module._layers) + list(mean_module._output_layers)
+    weights = [layer.linear.weight.detach().cpu().numpy() for layer in layers]
+    biases = [layer.linear.bias.detach().cpu().numpy() for layer in layers]
+    log_std = module._init_std.detach().cpu().numpy()
+
+    return NumpyGaussianMLPPolicy(
+        weights,
+        biases,
+        log_std,
+        hidden_nonlinearity=nonlinearity_name(module._hidden_nonlinearity),
+        output_nonlinearity=nonlinearity_name(module._output_nonlinearity),
+        **normalization_kwargs(env),
+    )
+
+
+def normalization_kwargs(env) -> dict:
+    """
+    Observation statistics and action scaling of a garage ``NormalizedEnv``
+    as :class:`NumpyGaussianMLPPolicy` arguments (empty for other envs).
+    """
+    kwargs = {}
+    if env is not None and hasattr(env, "_expected_action_scale"):
+        if getattr(env, "_normalize_obs", False):
+            kwargs["obs_mean"] = np.array(env._obs_mean)
+            kwargs["obs_var"] = np.array(env._obs_var)
+        kwargs["expected_action_scale"] = env._expected_action_scale
+        kwargs["action_low"] = np.array(env.action_space.low)
+        kwargs["action_high"] = np.array(env.action_space.high)
+    return kwargs
+
+
+def policy_from_state_dict(
+    state_dict: dict,
+    hidden_nonlinearity: Optional[str] = "tanh",
+    output_nonlinearity: Optional[str] = None,
+    **kwargs,
+) -> NumpyGaussianMLPPolicy:
+    """
+    Build the policy from the ``state_dict`` of a garage
+    ``GaussianMLPPolicy`` whose values are NumPy arrays, as written by
+    :class:`~snapshot.AsyncSnapshotter`.
+    """
+    prefix = "_module._mean_module."
+    weights, biases = [], []
+    for group in ("_layers", "_output_layers"):
+        i = 0
+        while f"{prefix}{group}.{i}.linear.weight" in state_dict:
+            weights.append(state_dict[f"{prefix}{group}.{i}.linear.weight"])
+            biases.append(state_dict[f"{prefix}{group}.{i}.linear.bias"])
+            i += 1
+    if not weights:
+        raise ValueError("Not the state_dict of a GaussianMLPPolicy")
+    return NumpyGaussianMLPPolicy(
+        weights,
+        biases,
+        state_dict["_module._init_std"],
+        hidden_nonlinearity=hidden_nonlinearity,
+        output_nonlinearity=output_nonlinearity,
+        **kwargs,
+    )
+
+
+def load_snapshot_policy(snapshot_dir: str, itr="last") -> NumpyGaussianMLPPolicy:
+    """
+    Policy of a ``train.py`` snapshot. Reads both
+    :class:`~snapshot.AsyncSnapshotter` directories (where ``itr`` may also
+    be ``"best"``) and garage ``Snapshotter`` pickles.
+    """
+    import snapshot
+
+    if snapshot.is_snapshot_dir(snapshot_dir):
+        return snapshot.load_policy(snapshot_dir, itr)
+    # 只有旧格式需要 torch/garage，推理端不依赖它们
+    from garage.experiment import Snapshotter
+
+    saved = Snapshotter().load(snapshot_dir, itr=itr)
+    return from_garage_policy(saved["algo"].policy, saved.get("env"))
+
+
+def export_policy(snapshot_dir: str, output_path: str, itr="last") -> None:
+    """Export the policy of a ``train.py`` snapshot to a NumPy archive."""
+    load_snapshot_policy(snapshot_dir, itr).save(output_path)
+
+
+if __name__ == "__main__":
+    # python embedded_policy.py <snapshot_dir> <output.npz> [itr]
+    import sys
+
+    if len(sys.argv) < 3:
+        print(f"Usage: {sys.argv[0]} <snapshot_dir> <output.npz> [itr]")
+        sys.exit(1)
+    itr = sys.argv[3] if len(sys.argv) > 3 else "last"
+    export_policy(sys.argv[1], sys.argv[2], int(itr) if itr.isdigit() else itr)
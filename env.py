@@ -1,10 +1,42 @@
 import akro
 from dowel import logger
 import os
+import socket
 import numpy as np
 from garage import Environment, EnvSpec, EnvStep, StepType
 from drl_comunication import DrlComunicationServer
+from shm_channel import TRANSPORTS, ShmDrlServer
+from transition_store import TransitionRecorder
 from expirement import MmlinkLimitServer
+from link_log import LogTail
+from receiver_stats import ReceiverMetricsListener, summarize
+from trace_store import get_trace_store, resolve_trace_path
+
+BACKENDS = ("mahimahi", "emulator")
+# meta_con.OBSERVATION_FEATURES 的上界
+FEATURE_HIGH = {
+    "rtt_p50": 100000,
+    "rtt_p95": 100000,
+    "jitter": 100000,
+    "delivery_rate": 100 * 1000 * 1000 * 8,
+    "loss_rate": 1,
+    "pacing_rate": 125 * 1000 * 1000,
+}
+# mahimahi 后端每一步从 mm-link 日志中统计的真实链路指标
+LINK_INFO_KEYS = (
+    "utilization",
+    "throughput_mbps",
+    "capacity_mbps",
+    "delay_mean_ms",
+    "delay_p95_ms",
+    "dropped_packets",
+)
+
+
+def _free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
 
 
 class MetaConEnv(Environment):
@@ -19,6 +51,50 @@ class MetaConEnv(Environment):
         never_done (bool): Never send a `done` signal, even if the
             agent achieves the goal
         max_episode_length (int): The maximum steps allowed for an episode.
+        backend (str): "mahimahi" runs mm-link with server.py/client.py in
+            wall-clock time, "emulator" replays the trace in-process with
+            :class:`~link_emulator.TraceLinkEmulator` in simulated time.
+        trace_file (str): Trace replayed on the bottleneck link until a
+            task is set.
+        delay_ms (int): One-way propagation delay of the link (mm-delay).
+        queue_packets (int): Droptail queue size of the link in packets.
+        decision_interval (float): Simulated seconds between two decisions
+            of the emulator backend.
+        socket_path (str): DRL socket of this env. By default every process
+            gets its own path, so sampler workers can step concurrently.
+        port (int): QUIC server port. By default a free port is picked per
+            process.
+        soft_reset (bool): Start a new episode on the same link by resetting
+            the controller in place (window, observer statistics) instead of
+            relaunching mm-link, server.py and client.py. Only used when the
+            task's link is already running; the mm-link logs are still split
+            into one directory per episode.
+        observation_features (tuple[str]): Optional observation entries
+            appended after the 7 base ones, from
+            ``meta_con.OBSERVATION_FEATURES`` (RTT percentiles, jitter,
+            delivery rate, loss rate).
+        min_delay_window (float): Seconds after which the controller
+            refreshes ``min_delay``. By default it is kept per episode.
+        receiver_metrics (bool): Have server.py send its goodput and
+            one-way delay to the env over a unix datagram socket, reported
+            as ``receiver_*`` in ``env_info`` (mahimahi backend).
+        transport (str): "socket" exchanges observations and actions with
+            client.py over the unix socket, "shm" over the shared-memory
+            channel of :mod:`shm_channel`. Defaults to the
+            ``METACON_DRL_TRANSPORT`` environment variable, else "socket".
+        pacing (str): Pace the sender with the controller's
+            :class:`~meta_con.PolicyPacer`: "window" paces at cwnd/srtt with
+            small bursts, "direct" adds a second action dimension that
+            scales the pacing rate by ``2**action[1]``. Either adds
+            ``pacing_rate`` to the observation features.
+        record_dir (str): Append every transition, with its task and
+            ``env_info``, to a :class:`~transition_store.TransitionRecorder`
+            in ``<record_dir>/worker-<pid>``, for offline training with
+            :class:`~transition_store.TransitionDataset`.
+        use_zygote (bool): Fork server.py and client.py from pre-imported
+            :mod:`zygote` processes (one in the mm-link shell, one in the
+            sampler process) instead of starting a fresh interpreter for
+            each (mahimahi backend).
 
     """
 
@@ -27,6 +103,38 @@ class MetaConEnv(Environment):
         self._max_episode_length = kwargs.pop("max_episode_length", 1000)
         self.target_step = kwargs.pop("target_step", 1000)
         self.expirement_id = kwargs.pop("expirement_id", "default")
+        self.backend = kwargs.pop("backend", "mahimahi")
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {self.backend}")
+        self.trace_file = kwargs.pop("trace_file", "12mbps.trace")
+        self.delay_ms = kwargs.pop("delay_ms", 30)
+        self.queue_packets = kwargs.pop("queue_packets", 200)
+        self.decision_interval = kwargs.pop("decision_interval", 1.0)
+        self.soft_reset = kwargs.pop("soft_reset", True)
+        self.observation_features = tuple(kwargs.pop("observation_features", ()))
+        self.pacing = kwargs.pop("pacing", None)
+        self.record_dir = kwargs.pop("record_dir", None)
+        self.use_zygote = kwargs.pop("use_zygote", False)
+        if self.pacing is not None and "pacing_rate" not in self.observation_features:
+            self.observation_features += ("pacing_rate",)
+        self.min_delay_window = kwargs.pop("min_delay_window", None)
+        self.receiver_metrics = kwargs.pop("receiver_metrics", True)
+        self.transport = kwargs.pop(
+            "transport", os.environ.get("METACON_DRL_TRANSPORT", "socket")
+        )
+        if self.transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport: {self.transport}")
+        self._task = None
+        # 正在运行的链路对应的参数，相同任务的下一回合直接复用
+        self._link_key = None
+        self._server_ip = None
+        self._socket_path = kwargs.pop("socket_path", None)
+        self._port = kwargs.pop("port", None)
+        # 在第一次 reset 时按进程分配，env 可能先被 pickle 到 worker 中
+        self._worker_pid = None
+        self.socket_path = None
+        self.port = None
+        self.worker_dir = None
         self.cur_iter = 0
         self.data_dir = kwargs.pop(
             "data_dir", os.path.join(os.getcwd(), "data", self.expirement_id)
@@ -35,21 +143,22 @@ class MetaConEnv(Environment):
             os.makedirs(self.data_dir)
         self._step_cnt = 0
         # thr, thr_max, avg_delay, min_delay, loss, srtt, cwnd
-        self._observation_space = akro.Box(
-            np.array([0, 0, 0, 0, 0, 0, 0]),
-            np.array(
-                [
-                    100 * 1000 * 1000 * 8,
-                    100 * 1000 * 1000 * 8,
-                    100000,
-                    100000,
-                    1,
-                    100000,
-                    100000000,
-                ]
-            ),
+        high = [
+            100 * 1000 * 1000 * 8,
+            100 * 1000 * 1000 * 8,
+            100000,
+            100000,
+            1,
+            100000,
+            100000000,
+        ]
+        high += [FEATURE_HIGH[feature] for feature in self.observation_features]
+        self._observation_space = akro.Box(np.zeros(len(high)), np.array(high))
+        # 第一维调节窗口，direct 模式的第二维调节发送速率
+        action_dim = 2 if self.pacing == "direct" else 1
+        self._action_space = akro.Box(
+            np.full(action_dim, -0.5), np.full(action_dim, 0.5)
         )
-        self._action_space = akro.Box(np.array([-0.5]), np.array([0.5]))
         self._spec = EnvSpec(
             action_space=self.action_space,
             observation_space=self.observation_space,
@@ -57,7 +166,28 @@ class MetaConEnv(Environment):
         )
         self.drl_comunication_server = None
         self.mahimhi_limit_server = None
-        
+        self.link_emulator = None
+        self.controller = None
+        self._link_tail = None
+        self._receiver_listener = None
+        self._recorder = None
+        self._recorder_pid = None
+        self._last_observation = None
+
+    def __getstate__(self):
+        # 发给 sampler worker 时不带上本进程的线程、子进程和链路状态
+        state = self.__dict__.copy()
+        state["drl_comunication_server"] = None
+        state["mahimhi_limit_server"] = None
+        state["link_emulator"] = None
+        state["controller"] = None
+        state["_link_tail"] = None
+        state["_receiver_listener"] = None
+        state["_worker_pid"] = None
+        state["_recorder"] = None
+        state["_recorder_pid"] = None
+        return state
+
     @property
     def action_space(self):
         """akro.Space: The action space specification."""
@@ -93,31 +223,222 @@ class MetaConEnv(Environment):
                 goal-conditioned or MTRL.)
 
         """
+        if self.backend == "emulator":
+            observation = self._reset_emulator()
+        else:
+            observation = self._reset_mahimahi()
+
+        self._step_cnt = 0
+        if self.record_dir is not None:
+            self._transition_recorder().begin_episode(self._task)
+            self._last_observation = observation
+        return observation, {}
+
+    def _transition_recorder(self):
+        """Recorder of the current process, see ``record_dir``."""
+        pid = os.getpid()
+        if self._recorder_pid != pid:
+            self._recorder = TransitionRecorder(
+                os.path.join(self.record_dir, f"worker-{pid}")
+            )
+            self._recorder_pid = pid
+        return self._recorder
+
+    def _allocate_worker_resources(self):
+        """Give the current process its own DRL socket, port and log dir."""
+        pid = os.getpid()
+        if self._worker_pid == pid:
+            return
+        self._worker_pid = pid
+        self.socket_path = self._socket_path or f"/tmp/drl_comunication.{pid}"
+        self.port = self._port or _free_udp_port()
+        self.worker_dir = os.path.join(self.data_dir, f"worker-{pid}")
+        self.cur_iter = 0
+
+    def _link_params(self):
+        """Link parameters of the current task, or of the constructor."""
+        if self._task is not None:
+            task = self._task
+            return (
+                task["uplink_trace"],
+                task["downlink_trace"],
+                task["delay_ms"],
+                task["queue_packets"],
+            )
+        return self.trace_file, self.trace_file, self.delay_ms, self.queue_packets
+
+    def _episode_dir(self):
+        return os.path.join(self.worker_dir, f"{self.cur_iter}")
+
+    def _rotate_link_logs(self):
+        """Move the mm-link logs of the current episode to its own dir."""
+        if self.mahimhi_limit_server is None or self.cur_iter == 0:
+            return
+        episode_dir = self._episode_dir()
+        os.makedirs(episode_dir, exist_ok=True)
+        self.mahimhi_limit_server.rotate_logs(
+            os.path.join(episode_dir, "uplink_log_file"),
+            os.path.join(episode_dir, "downlink_log_file"),
+        )
+
+    def _can_soft_reset(self, link_key):
+        return (
+            self.soft_reset
+            and self.mahimhi_limit_server is not None
+            and self._link_key == link_key
+            and self.mahimhi_limit_server.is_running()
+            and self.mahimhi_limit_server.is_client_running()
+            and self.drl_comunication_server is not None
+            and self.drl_comunication_server.is_connected()
+        )
+
+    def _reset_mahimahi(self):
+        self._allocate_worker_resources()
+        link_key = self._link_params()
+        self._rotate_link_logs()
+        self.cur_iter += 1
+        os.makedirs(self._episode_dir(), exist_ok=True)
+        if self._can_soft_reset(link_key):
+            # 软重置：QUIC 连接和 mm-link 都保留，控制器恢复初始窗口并清空统计，
+            # 然后立即回复新回合的第一个观测值
+            self.drl_comunication_server.send({"reset": True})
+        else:
+            self._restart_mahimahi(link_key)
+
+        # 获取第一次观测值
+        obs_msg = self.drl_comunication_server.receive()
+        # 之后每一步的链路指标从这里开始统计
+        self._link_tail.poll()
+        if self._receiver_listener is not None:
+            self._receiver_listener.drain()
+        return obs_msg.get("observation", self._default_observation())
+
+    def _restart_mahimahi(self, link_key):
         if self.drl_comunication_server is not None:
             self.drl_comunication_server.stop_server()
-        if self.mahimhi_limit_server is not None:
+        reuse_link = (
+            self.mahimhi_limit_server is not None
+            and self._link_key == link_key
+            and self.mahimhi_limit_server.is_running()
+        )
+        if reuse_link:
+            # 同一任务：保留 mm-link 和其中的 server.py，只重启客户端
+            self.mahimhi_limit_server.stop_client()
+        elif self.mahimhi_limit_server is not None:
             self.mahimhi_limit_server.clear()
-        self.drl_comunication_server = DrlComunicationServer("/tmp/drl_comunication")
+        if self.transport == "shm":
+            self.drl_comunication_server = ShmDrlServer(self.socket_path)
+        else:
+            self.drl_comunication_server = DrlComunicationServer(self.socket_path)
         self.drl_comunication_server.start_server()
-        self.cur_iter += 1
-        log_dir = os.path.join(self.data_dir, f"{self.cur_iter}")
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        self.mahimhi_limit_server = MmlinkLimitServer(
-            "12mbps.trace",
-            "12mbps.trace",
-            os.path.join(log_dir, "uplink_log_file"),
-            os.path.join(log_dir, "downlink_log_file"),
+        if not reuse_link:
+            # mm-link 一直写同一份日志，每回合结束时切分到回合目录
+            live_dir = os.path.join(self.worker_dir, "live")
+            os.makedirs(live_dir, exist_ok=True)
+            uplink_trace, downlink_trace, delay_ms, queue_packets = link_key
+            # 数据从 shell 外的客户端流向 shell 内的服务端，走 mm-link 的 downlink：
+            # 任务的数据方向（uplink）轨迹和队列放在 downlink 上，和模拟器后端一致
+            self.mahimhi_limit_server = MmlinkLimitServer(
+                resolve_trace_path(downlink_trace),
+                resolve_trace_path(uplink_trace),
+                os.path.join(live_dir, "uplink_log_file"),
+                os.path.join(live_dir, "downlink_log_file"),
+                delay_ms=delay_ms,
+                downlink_queue="droptail" if queue_packets else None,
+                downlink_queue_args=(
+                    f"packets={queue_packets}" if queue_packets else None
+                ),
+                use_zygote=self.use_zygote,
+            )
+            server_args = []
+            if self.receiver_metrics:
+                if self._receiver_listener is None:
+                    self._receiver_listener = ReceiverMetricsListener(
+                        f"/tmp/metacon_receiver.{os.getpid()}"
+                    )
+                server_args += ["--metrics-socket", self._receiver_listener.path]
+            self._server_ip = self.mahimhi_limit_server.start_server(
+                self.port, server_args
+            )
+            # 数据从 mm-link 外的客户端流向 shell 内的服务端，走的是 downlink
+            self._link_tail = LogTail(os.path.join(live_dir, "downlink_log_file"))
+            self._link_key = link_key
+        self.mahimhi_limit_server.start_client(
+            self._server_ip,
+            self.port,
+            drl_socket_path=self.socket_path,
+            client_args=self._client_args(),
         )
-        server_ip = self.mahimhi_limit_server.start_server(12345)
-        self.mahimhi_limit_server.start_client(server_ip, 12345)
 
-        # 获取第一次观测值
-        obs_msg = self.drl_comunication_server.receive()
-        observation = obs_msg.get("observation", [0, 0, 0, 0, 0, 0, 0])
+    def _client_args(self):
+        args = ["--drl-transport", self.transport]
+        if self.observation_features:
+            args += ["--observation-features", *self.observation_features]
+        if self.min_delay_window is not None:
+            args += ["--min-delay-window", str(self.min_delay_window)]
+        if self.pacing is not None:
+            args += ["--pacing", self.pacing]
+        return args
+
+    def _link_info(self):
+        """Ground-truth link metrics since the previous call, from mm-link."""
+        summary = self._link_tail.poll().summary()
+        info = {f"link_{key}": summary[key] for key in LINK_INFO_KEYS}
+        if self._receiver_listener is not None:
+            receiver = summarize(self._receiver_listener.drain())
+            info["receiver_goodput_mbps"] = receiver["goodput_mbps"]
+            info["receiver_delay_mean"] = receiver["delay_mean"]
+            info["receiver_delay_max"] = receiver["delay_max"]
+        return info
+
+    def _default_observation(self):
+        return [0] * self.observation_space.shape[0]
+
+    def _reset_emulator(self):
+        # 延迟导入，mahimahi 后端的训练进程不需要加载 aioquic
+        from link_emulator import TraceLinkEmulator
 
-        self._step_cnt = 0
-        return observation, {}
+        self.cur_iter += 1
+        link_key = self._link_params()
+        if self.link_emulator is None or self._link_key != link_key:
+            uplink_trace, _, delay_ms, queue_packets = link_key
+            self.link_emulator = TraceLinkEmulator(
+                uplink_trace,
+                delay_ms=delay_ms,
+                queue_packets=queue_packets,
+            )
+            self._link_key = link_key
+            self.controller = None
+        if self.soft_reset and self.controller is not None:
+            # 和 mahimahi 后端一致：链路上的排队和在途包保留
+            self.controller.reset_episode()
+        else:
+            self.controller = self.link_emulator.create_controller(
+                observation_features=self.observation_features,
+                min_delay_window=self.min_delay_window,
+                pacing=self.pacing,
+            )
+            self.link_emulator.start(self.controller)
+        self.link_emulator.run_for(self.decision_interval)
+        return self.controller.get_observation()
+
+    def _advance(self, action):
+        """Apply ``action`` and return the observation of the next decision."""
+        pacing = float(action[1]) if self.pacing == "direct" else None
+        if self.backend == "emulator":
+            self.controller.apply_action(float(action[0]), pacing)
+            self.link_emulator.run_for(self.decision_interval)
+            return self.controller.get_observation()
+
+        # 执行动作
+        msg = {"action": float(action[0])}
+        if pacing is not None:
+            msg["pacing"] = pacing
+        self.drl_comunication_server.send(msg)
+
+        # 获取下一轮观测值
+        obs_msg = self.drl_comunication_server.receive()
+        return obs_msg.get("observation", self._default_observation())
 
     def step(self, action):
         """Step the environment.
@@ -134,13 +455,8 @@ class MetaConEnv(Environment):
                 constructed and `reset()` has not been called.
 
         """
-        # 执行动作
-        self.drl_comunication_server.send({"action": float(action[0])})
-
-        # 获取下一轮观测值
-        obs_msg = self.drl_comunication_server.receive()
         # thr, thr_max, avg_delay, min_delay, loss, srtt, cwnd
-        observation = obs_msg.get("observation", [0, 0, 0, 0, 0, 0, 0])
+        observation = self._advance(action)
 
         reward = 0
         if observation[1] > 0:
@@ -167,11 +483,26 @@ class MetaConEnv(Environment):
         # self.mahimhi_limit_server.print_client_output()
         # self.mahimhi_limit_server.print_server_output()
 
+        env_info = {}
+        if self.backend == "mahimahi":
+            env_info = self._link_info()
+
+        if self.record_dir is not None:
+            self._transition_recorder().record(
+                self._last_observation,
+                action,
+                reward,
+                observation,
+                step_type,
+                env_info,
+            )
+            self._last_observation = observation
+
         return EnvStep(
             env_spec=self.spec,
             action=action,
             reward=reward,
-            env_info={},
+            env_info=env_info,
             observation=observation,
             step_type=step_type,
         )
@@ -197,32 +528,56 @@ class MetaConEnv(Environment):
 
     def close(self):
         """Close the env."""
+        self._rotate_link_logs()
+        if self._recorder is not None:
+            self._recorder.close()
+        if self.drl_comunication_server is not None:
+            self.drl_comunication_server.stop_server()
+            self.drl_comunication_server = None
+        if self.mahimhi_limit_server is not None:
+            self.mahimhi_limit_server.clear()
+            self.mahimhi_limit_server = None
+        if self._receiver_listener is not None:
+            self._receiver_listener.close()
+            self._receiver_listener = None
 
     def sample_tasks(self, num_tasks):
         """Sample a list of `num_tasks` tasks.
 
+        Tasks are the link configurations of the trace dataset (see
+        :meth:`~trace_store.TraceStore.link_tasks`). Sampling is stratified
+        across trace families (constant rate, bus, timessquare, ...): every
+        family is drawn once, in random order, before any family repeats.
+
         Args:
             num_tasks (int): Number of tasks to sample.
 
         Returns:
-            list[dict[str, np.ndarray]]: A list of "tasks", where each task is
-                a dictionary containing a single key, "goal", mapping to a
-                point in 2D space.
+            list[dict]: A list of "tasks", each a dictionary with the
+                uplink/downlink trace, delay and queue size of a link.
 
         """
-        print("sample_tasks")
-        goals = np.random.uniform(-2, 2, size=(num_tasks, 2))
-        tasks = [{"goal": goal} for goal in goals]
-        return tasks
+        tasks = get_trace_store().link_tasks(self.delay_ms, self.queue_packets)
+        by_family = {}
+        for task in tasks:
+            by_family.setdefault(task["family"], []).append(task)
+        families = sorted(by_family)
+        sampled = []
+        while len(sampled) < num_tasks:
+            for i in np.random.permutation(len(families)):
+                family_tasks = by_family[families[i]]
+                sampled.append(family_tasks[np.random.randint(len(family_tasks))])
+        return sampled[:num_tasks]
 
     def set_task(self, task):
         """Reset with a task.
 
+        The link of the task is used from the next `reset()` on. If it is
+        the link that is already running, it is reused instead of being
+        relaunched.
+
         Args:
-            task (dict[str, np.ndarray]): A task (a dictionary containing a
-                single key, "goal", which should be a point in 2D space).
+            task (dict): A task returned by `sample_tasks()`.
 
         """
-        pass
-        # self._task = task
-        # self._goal = task["goal"]
+        self._task = task
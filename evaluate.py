@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedded_policy import NumpyGaussianMLPPolicy, load_snapshot_policy
+from trace_store import get_trace_store, resolve_trace_path
+
+# 评估逻辑变化时递增，旧的缓存结果随之失效
+EVAL_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "eval_cache"
+)
+# pantheon 场景的默认运行时长（秒），每秒一次决策
+DEFAULT_STEPS = 30
+METRICS = (
+    "capacity_mbps",
+    "throughput_mbps",
+    "utilization",
+    "delay_p50_ms",
+    "delay_p95_ms",
+    "loss_rate",
+    "return",
+)
+
+
+def load_eval_policy(path: str, itr="last") -> NumpyGaussianMLPPolicy:
+    """An exported ``.npz`` policy, or the ``itr`` policy of a snapshot directory."""
+    if os.path.isdir(path):
+        return load_snapshot_policy(path, itr)
+    return NumpyGaussianMLPPolicy.load(path)
+
+
+def policy_hash(policy: NumpyGaussianMLPPolicy) -> str:
+    """Content hash of everything that determines the policy's actions."""
+    digest = hashlib.sha256()
+    arrays = [*policy.weights, *policy.biases, policy.log_std]
+    optional = (policy.obs_mean, policy.obs_var, policy.action_low, policy.action_high)
+    arrays += [a for a in optional if a is not None]
+    for array in arrays:
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    digest.update(
+        json.dumps(
+            [
+                policy.hidden_nonlinearity,
+                policy.output_nonlinearity,
+                policy.expected_action_scale,
+                [a is None for a in optional],
+            ]
+        ).encode()
+    )
+    return digest.hexdigest()
+
+
+_trace_hashes = {}
+
+
+def _trace_hash(trace_file: str) -> str:
+    digest = _trace_hashes.get(trace_file)
+    if digest is None:
+        with open(resolve_trace_path(trace_file), "rb") as f:
+            digest = _trace_hashes[trace_file] = hashlib.sha1(f.read()).hexdigest()
+    return digest
+
+
+def cache_key(policy_digest: str, task: dict, env_kwargs: dict, steps: int) -> str:
+    """Cache key of one (policy, traces, link config, evaluation setup) run."""
+    key = {
+        "version": EVAL_VERSION,
+        "policy": policy_digest,
+        "uplink_trace": _trace_hash(task["uplink_trace"]),
+        "downlink_trace": _trace_hash(task["downlink_trace"]),
+        "link": [task["delay_ms"], task["queue_packets"]],
+        "steps": steps,
+        "env": env_kwargs,
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def evaluate_task(
+    policy: NumpyGaussianMLPPolicy, task: dict, steps: int, env_kwargs: dict
+) -> dict:
+    """
+    One deterministic episode (mean actions) of ``policy`` on the emulated
+    link of ``task``. The first decision interval, before any action, is
+    left out of the metrics.
+    """
+    from env import MetaConEnv
+
+    env = MetaConEnv(
+        backend="emulator",
+        max_episode_length=steps,
+        target_step=steps,
+        soft_reset=False,
+        **env_kwargs,
+    )
+    env.set_task(task)
+    observation, _ = env.reset()
+    link = env.link_emulator
+    start_ms = link.now_ms
+    start_bytes = link.delivered_bytes
+    start_sent, start_dropped = link.sent_packets, link.dropped_packets
+    link.rtt_samples = rtts = []
+    total_reward = 0.0
+    for _ in range(steps):
+        env_step = env.step(policy.get_action(observation))
+        observation = env_step.observation
+        total_reward += env_step.reward
+        if env_step.last:
+            break
+    env.close()
+
+    duration = (link.now_ms - start_ms) / 1000
+    throughput = (link.delivered_bytes - start_bytes) * 8 / duration / 1e6
+    capacity = get_trace_store().stats(task["uplink_trace"])["mean_mbps"]
+    sent = link.sent_packets - start_sent
+    delays = np.array(rtts) * 1000 if rtts else np.array([np.nan])
+    return {
+        "capacity_mbps": capacity,
+        "throughput_mbps": throughput,
+        "utilization": throughput / capacity if capacity > 0 else 0.0,
+        "delay_p50_ms": float(np.percentile(delays, 50)),
+        "delay_p95_ms": float(np.percentile(delays, 95)),
+        "delay_min_ms": float(delays.min()),
+        "loss_rate": (link.dropped_packets - start_dropped) / sent if sent else 0.0,
+        "return": total_reward,
+        "duration": duration,
+    }
+
+
+def _run_job(job):
+    key, policy, task, steps, env_kwargs = job
+    return key, evaluate_task(policy, task, steps, env_kwargs)
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key[:2], f"{key}.json")
+
+
+def _read_cache(cache_dir: Optional[str], key: str) -> Optional[dict]:
+    if cache_dir is None:
+        return None
+    try:
+        with open(_cache_path(cache_dir, key)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_cache(cache_dir: Optional[str], key: str, result: dict) -> None:
+    if cache_dir is None:
+        return
+    path = _cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, path)
+
+
+def evaluate_policies(
+    policies: Dict[str, NumpyGaussianMLPPolicy],
+    tasks: Optional[List[dict]] = None,
+    steps: int = DEFAULT_STEPS,
+    env_kwargs: Optional[dict] = None,
+    processes: Optional[int] = None,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+) -> Dict[str, List[dict]]:
+    """
+    Evaluate every policy on every task (by default every trace of the
+    dataset with the pantheon link parameters, see
+    :meth:`~trace_store.TraceStore.link_tasks`) with a process pool.
+
+    Results are cached in ``cache_dir`` under a hash of the policy
+    parameters, the trace content, the link and the evaluation settings,
+    so only new combinations are run. Returns one row per task for each
+    policy name, with ``cached`` telling where it came from.
+    """
+    env_kwargs = env_kwargs or {}
+    if tasks is None:
+        tasks = get_trace_store().link_tasks()
+    rows = {name: [None] * len(tasks) for name in policies}
+    jobs = []
+    where = {}
+    for name, policy in policies.items():
+        digest = policy_hash(policy)
+        for i, task in enumerate(tasks):
+            key = cache_key(digest, task, env_kwargs, steps)
+            cached = _read_cache(cache_dir, key)
+            if cached is not None:
+                rows[name][i] = {"task": task, "cached": True, **cached}
+                continue
+            # 同一策略可能以不同名字出现，相同的 key 只跑一次
+            if key not in where:
+                jobs.append((key, policy, task, steps, env_kwargs))
+            where.setdefault(key, []).append((name, i))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                key, result = future.result()
+                _write_cache(cache_dir, key, result)
+                for name, i in where[key]:
+                    rows[name][i] = {"task": tasks[i], "cached": False, **result}
+    return rows
+
+
+def summarize(rows: List[dict]) -> Dict[str, Dict[str, float]]:
+    """Mean of each metric per trace family and over all tasks."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["task"]["family"], []).append(row)
+    groups["all"] = rows
+    return {
+        group: {
+            metric: float(np.nanmean([row[metric] for row in members]))
+            for metric in METRICS
+        }
+        for group, members in groups.items()
+    }
+
+
+def format_table(rows: List[dict]) -> str:
+    lines = [
+        f"{'task':>28}  {'cap':>7}  {'thr':>7}  {'util':>5}"
+        f"  {'p50 ms':>7}  {'p95 ms':>7}  {'loss %':>6}  {'return':>9}"
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['task']['name']:>28}  {row['capacity_mbps']:7.1f}"
+            f"  {row['throughput_mbps']:7.1f}  {row['utilization']:5.2f}"
+            f"  {row['delay_p50_ms']:7.1f}  {row['delay_p95_ms']:7.1f}"
+            f"  {100 * row['loss_rate']:6.2f}  {row['return']:9.1f}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(summaries: Dict[str, Dict[str, Dict[str, float]]]) -> str:
+    """One line per policy and trace family, for comparing checkpoints."""
+    lines = [
+        f"{'policy':>20}  {'family':>12}  {'thr':>7}  {'util':>5}"
+        f"  {'p50 ms':>7}  {'p95 ms':>7}  {'loss %':>6}  {'return':>9}"
+    ]
+    for name, summary in summaries.items():
+        for family, m in sorted(summary.items()):
+            lines.append(
+                f"{name:>20}  {family:>12}  {m['throughput_mbps']:7.1f}"
+                f"  {m['utilization']:5.2f}  {m['delay_p50_ms']:7.1f}"
+                f"  {m['delay_p95_ms']:7.1f}  {100 * m['loss_rate']:6.2f}"
+                f"  {m['return']:9.1f}"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    import meta_con
+
+    parser = argparse.ArgumentParser(
+        description="Evaluate policies on every trace of the dataset"
+    )
+    parser.add_argument(
+        "policy", help="exported policy (.npz) or train.py snapshot directory"
+    )
+    parser.add_argument(
+        "--itr",
+        nargs="*",
+        default=["last"],
+        help="snapshot epochs to compare (numbers, first, last or best)",
+    )
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS)
+    parser.add_argument("--decision-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--observation-features",
+        nargs="*",
+        choices=meta_con.OBSERVATION_FEATURES,
+        default=[],
+        help="must match the features the policy was trained with",
+    )
+    parser.add_argument("--pacing", choices=meta_con.PACING_MODES, default=None)
+    parser.add_argument("--traces", nargs="*", help="only these uplink traces")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", help="write all rows and summaries as JSON")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.policy):
+        itrs = [int(itr) if itr.isdigit() else itr for itr in args.itr]
+        policies = {f"itr {itr}": load_eval_policy(args.policy, itr) for itr in itrs}
+    else:
+        policies = {os.path.basename(args.policy): load_eval_policy(args.policy)}
+    tasks = get_trace_store().link_tasks()
+    if args.traces:
+        tasks = [task for task in tasks if task["uplink_trace"] in args.traces]
+    env_kwargs = {
+        "decision_interval": args.decision_interval,
+        "observation_features": args.observation_features,
+        "pacing": args.pacing,
+    }
+    rows = evaluate_policies(
+        policies,
+        tasks,
+        steps=args.steps,
+        env_kwargs=env_kwargs,
+        processes=args.processes,
+        cache_dir=None if args.no_cache else args.cache_dir,
+    )
+    summaries = {}
+    for name, policy_rows in rows.items():
+        cached = sum(row["cached"] for row in policy_rows)
+        print(f"== {name} ({cached}/{len(policy_rows)} cached)")
+        print(format_table(policy_rows))
+        summaries[name] = summarize(policy_rows)
+    print()
+    print(format_comparison(summaries))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": rows, "summaries": summaries}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
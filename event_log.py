@@ -0,0 +1,280 @@
+import json
+import struct
+import time
+from typing import Callable, Optional
+
+import numpy as np
+from aioquic.quic.packet import QuicPacketType
+from aioquic.quic.packet_builder import QuicSentPacket
+from aioquic.tls import Epoch
+
+from clock import ManualClock
+
+EVENT_MAGIC = b"MCEVENT1"
+# 事件类型
+SENT = 0
+ACKED = 1
+LOST = 2
+EXPIRED = 3
+RTT = 4
+OBSERVATION = 5
+ACTION = 6
+RESET = 7
+EVENT_NAMES = (
+    "sent",
+    "acked",
+    "lost",
+    "expired",
+    "rtt",
+    "observation",
+    "action",
+    "reset",
+)
+
+# 类型 + 包大小 + 控制器时钟 + 值 + 包序号 + 发送时间
+# 值：acked/lost 时为 aioquic 的 now，rtt 时为 RTT，action 时为动作；
+# action 事件的发送时间字段存 pacing 动作（没有时为 NaN）
+_EVENT = struct.Struct("<B3xIddqd")
+EVENT_DTYPE = np.dtype(
+    [
+        ("kind", "u1"),
+        ("_pad", "V3"),
+        ("size", "<u4"),
+        ("time", "<f8"),
+        ("value", "<f8"),
+        ("packet_number", "<i8"),
+        ("sent_time", "<f8"),
+    ]
+)
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+class EventRecorder:
+    """
+    Binary log of every event seen by one controller: packets sent, acked,
+    lost or expired, RTT samples, observations, applied actions and
+    episode resets, each stamped with the controller's clock.
+
+    The file is an 8-byte magic, a length-prefixed JSON header with the
+    controller configuration (written when the controller attaches) and
+    fixed 40-byte records (see :data:`EVENT_DTYPE`), buffered
+    ``buffer_events`` at a time. Read it with :func:`read_events` and feed
+    it back through a controller with :func:`replay`.
+    """
+
+    def __init__(self, path: str, buffer_events: int = 4096):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(EVENT_MAGIC)
+        self._buf = bytearray(_EVENT.size * buffer_events)
+        self._offset = 0
+        self._clock = None
+
+    def attach(self, controller) -> None:
+        if self._clock is not None:
+            raise RuntimeError("An event recorder logs a single controller")
+        self._clock = controller.clock
+        # 重放时用相同的参数构造控制器
+        header = {
+            "max_datagram_size": controller._max_datagram_size,
+            "decision_mode": controller.decision_mode,
+            "observation_features": list(controller.observer.features),
+            "min_delay_window": controller.observer.min_delay_window,
+            "pacing": None if controller.pacer is None else controller.pacer.mode,
+            "flow": controller.flow_id,
+        }
+        body = json.dumps(header).encode()
+        self._file.write(_HEADER_LENGTH.pack(len(body)))
+        self._file.write(body)
+
+    def record(
+        self,
+        kind: int,
+        value: float = 0.0,
+        packet: Optional[QuicSentPacket] = None,
+        extra: float = 0.0,
+    ) -> None:
+        if packet is not None:
+            size, number = packet.sent_bytes, packet.packet_number
+            extra = packet.sent_time
+        else:
+            size, number = 0, -1
+        _EVENT.pack_into(
+            self._buf, self._offset, kind, size, self._clock(), value, number, extra
+        )
+        self._offset += _EVENT.size
+        if self._offset == len(self._buf):
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.write(memoryview(self._buf)[: self._offset])
+        self._file.flush()
+        self._offset = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+def read_events(path: str):
+    """``(header, events)`` of an :class:`EventRecorder` file."""
+    with open(path, "rb") as f:
+        if f.read(len(EVENT_MAGIC)) != EVENT_MAGIC:
+            raise ValueError(f"Not an event log: {path}")
+        (length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+        header = json.loads(f.read(length))
+        events = np.fromfile(f, dtype=EVENT_DTYPE)
+    return header, events
+
+
+def _packet(number: int, size: int, sent_time: float) -> QuicSentPacket:
+    return QuicSentPacket(
+        epoch=Epoch.ONE_RTT,
+        in_flight=True,
+        is_ack_eliciting=True,
+        is_crypto_packet=False,
+        packet_number=number,
+        packet_type=QuicPacketType.ONE_RTT,
+        sent_time=sent_time,
+        sent_bytes=size,
+    )
+
+
+def replay(
+    path: str,
+    policy: Optional[Callable] = None,
+    **controller_kwargs,
+) -> dict:
+    """
+    Feed a recorded event log through a fresh controller on a
+    :class:`~clock.ManualClock`, as fast as the CPU allows.
+
+    Without ``policy`` the recorded actions are applied, which reproduces
+    the controller state of the live run exactly. With ``policy`` (called
+    with each observation, returning an action or an ``(action, pacing)``
+    pair, e.g. ``NumpyGaussianMLPPolicy.get_action``) its actions are
+    applied instead, at the times the recorded actions took effect. The
+    packet history itself is replayed as recorded: it does not react to
+    the new actions, so the result tells how the policy would have
+    responded to that traffic, not how the traffic would have changed.
+
+    Returns the observations, the applied actions and the windows after
+    each action, with the replay rate.
+    """
+    # 延迟导入：meta_con 也导入本模块
+    from meta_con import MetaConCongestionControl
+
+    header, events = read_events(path)
+    clock = ManualClock()
+    options = {
+        "max_datagram_size": header["max_datagram_size"],
+        "decision_mode": header["decision_mode"],
+        "observation_features": header["observation_features"],
+        "min_delay_window": header["min_delay_window"],
+        "pacing": header["pacing"],
+    }
+    options.update(controller_kwargs)
+    cc = MetaConCongestionControl(clock=clock, auto_decision=False, **options)
+    is_async = cc.decision_mode == "async"
+    packets = {}
+    observations = []
+    actions = []
+    windows = []
+    pending = None
+
+    start = time.perf_counter()
+    for kind, _, size, now, value, number, sent_time in events.tolist():
+        if now > clock.now:
+            clock.now = now
+        if kind == SENT:
+            packet = packets[number] = _packet(number, size, sent_time)
+            cc.on_packet_sent(packet=packet)
+        elif kind == ACKED:
+            packet = packets.pop(number, None) or _packet(number, size, sent_time)
+            cc.on_packet_acked(now=value, packet=packet)
+        elif kind == LOST or kind == EXPIRED:
+            packet = packets.pop(number, None) or _packet(number, size, sent_time)
+            if kind == LOST:
+                cc.on_packets_lost(now=value, packets=[packet])
+            else:
+                cc.on_packets_expired(packets=[packet])
+        elif kind == RTT:
+            cc.on_rtt_measurement(now=now, rtt=value)
+        elif kind == OBSERVATION:
+            observation = cc.get_observation()
+            observations.append(observation)
+            pending = policy(observation) if policy is not None else None
+            if is_async:
+                cc.observer.reset()
+        elif kind == ACTION:
+            pacing = None if np.isnan(sent_time) else sent_time
+            if policy is not None:
+                if pending is None:
+                    continue
+                action = np.atleast_1d(np.asarray(pending, dtype=float))
+                value = float(action[0])
+                pacing = float(action[1]) if len(action) > 1 else None
+                pending = None
+            if is_async:
+                cc._set_window(value, pacing)
+            else:
+                cc.apply_action(value, pacing)
+            actions.append(value)
+            windows.append(cc.congestion_window)
+        elif kind == RESET:
+            cc.reset_episode()
+            pending = None
+    elapsed = time.perf_counter() - start
+
+    return {
+        "header": header,
+        "events": len(events),
+        "events_per_sec": len(events) / elapsed if elapsed > 0 else 0.0,
+        "observations": np.array(observations),
+        "actions": np.array(actions),
+        "windows": np.array(windows),
+        "controller": cc,
+    }
+
+
+def summarize_events(events: np.ndarray) -> dict:
+    counts = np.bincount(events["kind"], minlength=len(EVENT_NAMES))
+    summary = {name: int(count) for name, count in zip(EVENT_NAMES, counts)}
+    summary["duration"] = (
+        float(events["time"][-1] - events["time"][0]) if len(events) else 0.0
+    )
+    return summary
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Replay a client.py event log through the controller"
+    )
+    parser.add_argument("events", help="file written by client.py --record-events")
+    parser.add_argument(
+        "--policy", help="exported policy to evaluate instead of the recorded actions"
+    )
+    args = parser.parse_args()
+    policy = None
+    if args.policy:
+        from embedded_policy import load_policy
+
+        policy = load_policy(args.policy).get_action
+    result = replay(args.events, policy)
+    print(json.dumps(summarize_events(read_events(args.events)[1]), indent=2))
+    print(
+        f"{result['events']} events replayed at "
+        f"{result['events_per_sec']:.0f} events/s, "
+        f"{len(result['actions'])} actions"
+    )
+    if len(result["windows"]):
+        print(
+            f"window mean {result['windows'].mean():.0f}, "
+            f"final {result['windows'][-1]:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
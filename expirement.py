@@ -4,35 +4,125 @@ import time
 from tqdm import tqdm
 from dowel import logger
 
+import zygote
+
+
+def _copy_log_segment(src: str, dst: str, offset: int) -> int:
+    """
+    Copy the complete lines ``src`` got since ``offset`` to ``dst``, behind
+    the ``#`` header lines of ``src``, and return the offset to continue from.
+    """
+    if not os.path.exists(src):
+        return offset
+    with open(src, "rb") as f_in:
+        header = []
+        line = f_in.readline()
+        while line.startswith(b"#"):
+            header.append(line)
+            line = f_in.readline()
+        offset = max(offset, sum(len(line) for line in header))
+        f_in.seek(offset)
+        data = f_in.read()
+    # mm-link 还在写，最后一行可能不完整，留到下一次
+    end = data.rfind(b"\n") + 1
+    with open(dst, "wb") as f_out:
+        f_out.writelines(header)
+        f_out.write(data[:end])
+    return offset + end
+
 
 class MmlinkLimitServer:
+    """
+    mm-link (behind mm-delay) with server.py in its shell and client.py
+    outside of it. client.py's data therefore crosses mm-link's downlink
+    and only the ACKs take the uplink.
+
+    With ``use_zygote`` neither script is started with a fresh interpreter:
+    a :class:`~zygote.Zygote` is exec'd in the mm-link shell to fork
+    server.py, and client.py is forked by this process's
+    :func:`~zygote.local_zygote`, so restarting the client for a new
+    episode takes milliseconds.
+    """
+
     def __init__(
         self,
         uplink_trace_file: str,
         downlink_trace_file: str,
         uplink_log_file: str,
         downlink_log_file: str,
+        delay_ms: int = 0,
+        uplink_queue: str = None,
+        uplink_queue_args: str = None,
+        downlink_queue: str = None,
+        downlink_queue_args: str = None,
+        use_zygote: bool = False,
     ):
         self.uplink_trace_file = uplink_trace_file
         self.downlink_trace_file = downlink_trace_file
         self.uplink_log_file = uplink_log_file
         self.downlink_log_file = downlink_log_file
+        self.delay_ms = delay_ms
+        self.uplink_queue = uplink_queue
+        self.uplink_queue_args = uplink_queue_args
+        self.downlink_queue = downlink_queue
+        self.downlink_queue_args = downlink_queue_args
+        self.use_zygote = use_zygote
 
         self._server = None
+        self._server_worker = None
         self._client = None
+        self._log_offsets = {}
+
+    def command(self) -> list:
+        # 和 pantheon 一样：mm-delay 在外层，mm-link 在内层
+        command = []
+        if self.delay_ms:
+            command += ["mm-delay", str(self.delay_ms)]
+        command += [
+            "mm-link",
+            self.uplink_trace_file,
+            self.downlink_trace_file,
+            "--uplink-log",
+            self.uplink_log_file,
+            "--downlink-log",
+            self.downlink_log_file,
+        ]
+        if self.uplink_queue:
+            command.append(f"--uplink-queue={self.uplink_queue}")
+        if self.uplink_queue_args:
+            command.append(f"--uplink-queue-args={self.uplink_queue_args}")
+        if self.downlink_queue:
+            command.append(f"--downlink-queue={self.downlink_queue}")
+        if self.downlink_queue_args:
+            command.append(f"--downlink-queue-args={self.downlink_queue_args}")
+        return command
+
+    def is_running(self) -> bool:
+        if self._server_worker is not None and self._server_worker.poll() is not None:
+            return False
+        return self._server is not None and self._server.poll() is None
+
+    def is_client_running(self) -> bool:
+        return self._client is not None and self._client.poll() is None
+
+    def rotate_logs(self, uplink_log_file: str, downlink_log_file: str):
+        """
+        Move what mm-link logged since the previous rotation to the given
+        files, without restarting mm-link. Each rotated file starts with the
+        header of the live log so it can be parsed on its own.
+        """
+        for src, dst in (
+            (self.uplink_log_file, uplink_log_file),
+            (self.downlink_log_file, downlink_log_file),
+        ):
+            self._log_offsets[src] = _copy_log_segment(
+                src, dst, self._log_offsets.get(src, 0)
+            )
 
-    def start_server(self, port: int) -> str:
+    def start_server(self, port: int, server_args: list = None) -> str:
         logger.log("??????????????????!!?")
         self._server = subprocess.Popen(
-            [
-                "mm-link",
-                self.uplink_trace_file,
-                self.downlink_trace_file,
-                "--uplink-log",
-                self.uplink_log_file,
-                "--downlink-log",
-                self.downlink_log_file,
-            ],
+            self.command(),
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             preexec_fn=os.setsid,
@@ -55,40 +145,76 @@ class MmlinkLimitServer:
         
         print(f"Server IP: {server_ip}")
 
+        if self.use_zygote:
+            # zygote 替换掉 shell，继承 mm-link 的网络命名空间；mm-link 退出时
+            # 它的 stdin 被关闭，zygote 随之退出
+            zygote_path = f"/tmp/metacon_zygote.{os.getpid()}.{port}"
+            self._server.stdin.write(f"exec python zygote.py {zygote_path}\n".encode())
+            self._server.stdin.flush()
+            zygote.wait_ready(self._server.stdout)
+            self._server_worker = zygote.spawn(
+                zygote_path, "server", [str(port), *(server_args or [])]
+            )
+            return server_ip
+
         # 启动服务器
-        self._server.stdin.write(f"python server.py {port}\n".encode())
+        command = " ".join(["python", "server.py", str(port), *(server_args or [])])
+        self._server.stdin.write(f"{command}\n".encode())
         self._server.stdin.flush()
 
         return server_ip
 
-    def start_client(self, server_ip: str, port: int):
+    def start_client(
+        self,
+        server_ip: str,
+        port: int,
+        drl_socket_path: str = None,
+        client_args: list = None,
+    ):
+        command = ["python", "client.py", server_ip, str(port)]
+        if drl_socket_path is not None:
+            command += ["--drl-socket", drl_socket_path]
+        if client_args:
+            command += client_args
+        if self.use_zygote:
+            self._client = zygote.local_zygote().spawn("client", command[2:])
+            return
         self._client = subprocess.Popen(
-            ["python", "client.py", server_ip, str(port)],
+            command,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             preexec_fn=os.setsid,
         )
         
+    def stop_client(self):
+        if self._client:
+            self._client.terminate()
+            self._client.wait()
+        self._client = None
+
     def print_server_output(self):
-        if self._server:
+        if self._server and self._server_worker is None:
             line = self._server.stdout.readline()
             while line:
                 print(line)
                 line = self._server.stdout.readline()
     
     def print_client_output(self):
-        if self._client:
+        if self._client and self._client.stdout:
             line = self._client.stdout.readline()
             while line:
                 print(line)
                 line = self._client.stdout.readline()
 
     def clear(self):
+        if self._server_worker:
+            self._server_worker.terminate()
         if self._server:
             self._server.terminate()
         if self._client:
             self._client.terminate()
         self._server = None
+        self._server_worker = None
         self._client = None
 
     def __del__(self):
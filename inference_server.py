@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import os
+
+import numpy as np
+
+from drl_comunication import (
+    MAX_FRAME_SIZE,
+    TAG_KEYS,
+    WIRE_JSON,
+    encode_message,
+    negotiate_wire_format,
+    read_message,
+)
+from embedded_policy import NumpyGaussianMLPPolicy, load_policy
+
+
+class _Connection:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.wire_format = WIRE_JSON
+        self.send_buf = bytearray(MAX_FRAME_SIZE)
+
+    def send(self, msg: dict) -> None:
+        size = encode_message(msg, self.wire_format, self.send_buf)
+        self.writer.write(bytes(memoryview(self.send_buf)[:size]))
+
+
+class BatchedInferenceServer:
+    """
+    Serve one policy to many ``MetaConCongestionControl`` flows at once.
+
+    Every controller connects to ``unix_socket_path`` with the usual DRL
+    socket protocol. Observations that arrive within ``batch_window``
+    seconds of the first pending one are evaluated in a single batched
+    forward pass, and each flow gets its action back tagged with the
+    ``flow`` and ``seq`` of its observation. Everything runs on one event
+    loop, without a thread per flow.
+    """
+
+    def __init__(
+        self,
+        unix_socket_path: str,
+        policy: NumpyGaussianMLPPolicy,
+        batch_window: float = 0.002,
+        max_batch_size: int = 1024,
+    ):
+        self.unix_socket_path = unix_socket_path
+        self.policy = policy
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.decisions = 0
+        self._pending = []
+        self._flush_handle = None
+        self._server = None
+        self._writers = set()
+        self._handlers = set()
+
+    async def start(self) -> None:
+        try:
+            os.unlink(self.unix_socket_path)
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(
+            self._handle_client, path=self.unix_socket_path
+        )
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # 关闭连接后各个处理协程读到 EOF 自行退出
+        for writer in self._writers:
+            writer.close()
+
+    async def wait_closed(self) -> None:
+        """Wait until every client handler has returned after :meth:`close`."""
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        conn = _Connection(writer)
+        negotiating = True
+        self._writers.add(writer)
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                msg = await read_message(reader, conn.wire_format)
+                if negotiating:
+                    negotiating = False
+                    wire_format = negotiate_wire_format(msg)
+                    if wire_format is not None:
+                        conn.send({"wire_format": wire_format})
+                        conn.wire_format = wire_format
+                        continue
+                if "observation" in msg:
+                    self._enqueue(conn, msg)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._handlers.discard(task)
+            writer.close()
+
+    def _enqueue(self, conn: _Connection, msg: dict) -> None:
+        self._pending.append((conn, msg))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        observations = np.array([msg["observation"] for _, msg in pending])
+        actions = self.policy.get_actions(observations)
+        self.batches += 1
+        self.decisions += len(pending)
+        for (conn, msg), action in zip(pending, actions):
+            response = {"action": float(action[0])}
+            if len(action) > 1:
+                # 二维动作的策略同时调节发送速率 (pacing="direct")
+                response["pacing"] = float(action[1])
+            for key in TAG_KEYS:
+                if key in msg:
+                    response[key] = msg[key]
+            if not conn.writer.is_closing():
+                conn.send(response)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("policy", help="policy exported by embedded_policy.py")
+    parser.add_argument("--socket", default="/tmp/drl_comunication")
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    server = BatchedInferenceServer(
+        args.socket,
+        load_policy(args.policy),
+        batch_window=args.batch_window_ms / 1000,
+        max_batch_size=args.max_batch_size,
+    )
+    print(f"Serving {args.policy} on {args.socket}")
+    await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,274 @@
+import csv
+import json
+import struct
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 每个 2 的幂区间分成 16 个子桶，相对误差约 6%
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKET_HALF = 1 << (_SUB_BUCKET_BITS - 1)
+_N_BUCKETS = 1024
+
+RECORD_FIELDS = (
+    "time",
+    "flow",
+    "acks",
+    "losses",
+    "rtt_samples",
+    "cwnd",
+    "bytes_in_flight",
+    "obs_build_ns",
+    "ipc_wait_ns",
+    "action_apply_ns",
+)
+_RECORD = struct.Struct("<dIIIIqqqqq")
+RECORD_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("flow", "<u4"),
+        ("acks", "<u4"),
+        ("losses", "<u4"),
+        ("rtt_samples", "<u4"),
+        ("cwnd", "<i8"),
+        ("bytes_in_flight", "<i8"),
+        ("obs_build_ns", "<i8"),
+        ("ipc_wait_ns", "<i8"),
+        ("action_apply_ns", "<i8"),
+    ]
+)
+BINARY_MAGIC = b"MCINSTR1"
+HISTOGRAMS = ("obs_build", "ipc_wait", "action_apply")
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * _SUB_BUCKET_HALF:
+        return value
+    shift = value.bit_length() - _SUB_BUCKET_BITS
+    return shift * _SUB_BUCKET_HALF + (value >> shift)
+
+
+def _bucket_value(index: int) -> int:
+    """Lowest value of a bucket."""
+    if index < 2 * _SUB_BUCKET_HALF:
+        return index
+    shift = index // _SUB_BUCKET_HALF - 1
+    return (index - shift * _SUB_BUCKET_HALF) << shift
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of non-negative integer latencies (nanoseconds).
+
+    Buckets are linear up to 32 and log-linear above, 16 per power of two,
+    so recording is a few integer operations and the memory is fixed.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * _N_BUCKETS))
+        self.reset()
+
+    def reset(self) -> None:
+        for i in range(_N_BUCKETS):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        value = max(int(value), 0)
+        self.counts[min(_bucket_index(value), _N_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> int:
+        if self.count == 0:
+            return 0
+        counts = np.frombuffer(self.counts, dtype=np.int64)
+        index = int(np.searchsorted(np.cumsum(counts), q / 100 * self.count))
+        return min(max(_bucket_value(index), self.min), self.max)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min or 0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+class CsvSink:
+    """One CSV row per decision, histogram summaries in ``<path>.summary.json``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(RECORD_FIELDS)
+        self._sources = []
+
+    def attach(self, source: "DecisionInstrumentation") -> None:
+        self._sources.append(source)
+
+    def write(self, record: tuple) -> None:
+        self._writer.writerow(record)
+
+    def close(self) -> None:
+        _write_summary(self.path, self._sources)
+        self._file.close()
+
+
+class BinarySink:
+    """
+    Fixed-size little-endian records (see :data:`RECORD_DTYPE`) behind an
+    8-byte magic, read back with :func:`read_binary`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(BINARY_MAGIC)
+        self._sources = []
+
+    def attach(self, source: "DecisionInstrumentation") -> None:
+        self._sources.append(source)
+
+    def write(self, record: tuple) -> None:
+        self._file.write(_RECORD.pack(*record))
+
+    def close(self) -> None:
+        _write_summary(self.path, self._sources)
+        self._file.close()
+
+
+class DowelSink:
+    """Records to the dowel tabular of the process, one row per decision."""
+
+    def __init__(self, prefix: str = "MetaCon/"):
+        # 只有用到时才导入 dowel
+        from dowel import logger, tabular
+
+        self.prefix = prefix
+        self._logger = logger
+        self._tabular = tabular
+        self._sources = []
+
+    def attach(self, source: "DecisionInstrumentation") -> None:
+        self._sources.append(source)
+
+    def write(self, record: tuple) -> None:
+        with self._tabular.prefix(self.prefix):
+            for key, value in zip(RECORD_FIELDS, record):
+                self._tabular.record(key, value)
+        self._logger.log(self._tabular)
+        self._logger.dump_all()
+
+    def close(self) -> None:
+        with self._tabular.prefix(self.prefix):
+            for source in self._sources:
+                for name, summary in source.summary().items():
+                    for key, value in summary.items():
+                        self._tabular.record(f"{name}_{key}", value)
+        self._logger.log(self._tabular)
+        self._logger.dump_all()
+
+
+SINKS = {"csv": CsvSink, "binary": BinarySink}
+
+
+def create_sink(path: Optional[str], sink_format: str = "binary"):
+    """Sink for ``path`` in ``sink_format`` ("csv", "binary" or "dowel")."""
+    if sink_format == "dowel":
+        return DowelSink()
+    if path is None:
+        return None
+    return SINKS[sink_format](path)
+
+
+def _write_summary(path: str, sources: List["DecisionInstrumentation"]) -> None:
+    summaries = {str(source.flow_id): source.summary() for source in sources}
+    with open(f"{path}.summary.json", "w") as f:
+        json.dump(summaries, f, indent=2)
+
+
+def read_binary(path: str) -> np.ndarray:
+    """Records of a :class:`BinarySink` file as a structured array."""
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"Not an instrumentation file: {path}")
+        return np.fromfile(f, dtype=RECORD_DTYPE)
+
+
+class DecisionInstrumentation:
+    """
+    Latency histograms and per-decision records of one controller.
+
+    Every decision produces one record with the ACKs, losses and RTT
+    samples of its interval, the window and bytes in flight when the
+    action was applied, and the time spent building the observation,
+    waiting for the DRL side and applying the action. ``-1`` marks a
+    phase that did not happen (e.g. an async decision whose action never
+    arrived).
+    """
+
+    def __init__(self, sink, flow_id: int):
+        self.sink = sink
+        self.flow_id = flow_id
+        self.histograms = {name: LatencyHistogram() for name in HISTOGRAMS}
+        self._pending = None
+        sink.attach(self)
+
+    def begin(
+        self, now: float, acks: int, losses: int, rtt_samples: int, obs_build_ns: int
+    ) -> None:
+        """Start the record of a decision whose observation was just built."""
+        if self._pending is not None:
+            self.finish(-1, -1, None, None)
+        self.histograms["obs_build"].record(obs_build_ns)
+        self._pending = [now, self.flow_id, acks, losses, rtt_samples, obs_build_ns]
+
+    def finish(
+        self,
+        ipc_wait_ns: int,
+        action_apply_ns: int,
+        cwnd: Optional[float],
+        bytes_in_flight: Optional[int],
+    ) -> None:
+        """Complete and write the pending record."""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        if ipc_wait_ns >= 0:
+            self.histograms["ipc_wait"].record(ipc_wait_ns)
+        if action_apply_ns >= 0:
+            self.histograms["action_apply"].record(action_apply_ns)
+        now, flow, acks, losses, rtt_samples, obs_build_ns = pending
+        self.sink.write(
+            (
+                now,
+                flow,
+                acks,
+                losses,
+                rtt_samples,
+                -1 if cwnd is None else int(cwnd),
+                -1 if bytes_in_flight is None else int(bytes_in_flight),
+                obs_build_ns,
+                ipc_wait_ns,
+                action_apply_ns,
+            )
+        )
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: h.summary() for name, h in self.histograms.items()}
@@ -0,0 +1,201 @@
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from aioquic.quic.packet import QuicPacketType
+from aioquic.quic.packet_builder import QuicSentPacket
+from aioquic.tls import Epoch
+
+from meta_con import MetaConCongestionControl
+from trace_store import MTU, get_trace_store
+
+
+def load_trace(trace_file: str) -> np.ndarray:
+    """
+    Load a mahimahi trace as delivery opportunities per millisecond.
+
+    Each line of a trace is a millisecond timestamp at which one MTU-sized
+    packet may leave the queue, and the trace repeats with a period equal to
+    its last timestamp. The returned array has one entry per millisecond of
+    that period, indexed by ``t % period``. Traces are parsed once and
+    cached by :class:`~trace_store.TraceStore`.
+    """
+    return get_trace_store().opportunities(trace_file)
+
+
+class TraceLinkEmulator:
+    """
+    Pure-Python replacement for ``mm-delay <d> mm-link <trace> <trace>`` that
+    runs in simulated time and drives a congestion controller directly.
+
+    The sender is always backlogged and limited only by the congestion
+    window. Packets go through a droptail queue drained by the trace's
+    delivery opportunities, then take ``delay_ms`` to reach the receiver and
+    another ``delay_ms`` for the ACK to come back (the ACK path is not
+    capacity limited). Drops are reported to the controller one base RTT
+    after they happen, roughly when a real sender would notice the gap.
+
+    A controller with a :class:`~meta_con.PolicyPacer` is also limited by
+    its pacing rate, enforced with a token bucket refilled every simulated
+    millisecond. The bucket holds ``max_burst`` packets, or one
+    millisecond of sending when that is more, since sends within a
+    millisecond cannot be spread here. The rate follows an aioquic-style
+    smoothed RTT.
+
+    The sender's own interface runs at ``line_rate_mbps``, so a runaway
+    window (the window has no upper bound) floods the queue at line rate
+    instead of emitting millions of packets per simulated millisecond.
+    """
+
+    def __init__(
+        self,
+        trace_file: str,
+        delay_ms: int = 30,
+        queue_packets: Optional[int] = 200,
+        max_datagram_size: int = 1200,
+        line_rate_mbps: Optional[float] = 1000.0,
+    ):
+        self.trace_file = trace_file
+        self.opportunities = load_trace(trace_file)
+        self.period = len(self.opportunities)
+        # 逐毫秒访问时 list 比 numpy 标量索引快
+        self._opportunity_list = self.opportunities.tolist()
+        self.delay_ms = delay_ms
+        self.queue_packets = queue_packets
+        self.max_datagram_size = max_datagram_size
+        self.line_rate_mbps = line_rate_mbps
+        self.controller = None
+        # 设为列表时记录每批 ACK 的 RTT 样本（秒），供评估统计时延分布
+        self.rtt_samples = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.now_ms = 0
+        self._packet_number = 0
+        self._queue = deque()
+        # 队首包还没投递完的字节数
+        self._head_remaining = 0
+        # (到达发送端的时间 ms, 包)
+        self._acks = deque()
+        self._losses = deque()
+        self.sent_packets = 0
+        self.delivered_bytes = 0
+        self.dropped_packets = 0
+        self.smoothed_rtt = 0.0
+        self._pacing_credit = 0.0
+
+    def clock(self) -> float:
+        return self.now_ms / 1000
+
+    def start(self, controller: MetaConCongestionControl) -> None:
+        """Reset the link and attach ``controller`` as the only flow."""
+        self.reset()
+        self.controller = controller
+
+    def create_controller(self, **kwargs) -> MetaConCongestionControl:
+        """Create a controller on the simulated clock, driven by the caller."""
+        return MetaConCongestionControl(
+            max_datagram_size=self.max_datagram_size,
+            clock=self.clock,
+            auto_decision=False,
+            **kwargs,
+        )
+
+    def run_for(self, duration: float) -> None:
+        """Advance simulated time by ``duration`` seconds."""
+        cc = self.controller
+        queue = self._queue
+        acks = self._acks
+        losses = self._losses
+        opportunities = self._opportunity_list
+        period = self.period
+        queue_packets = self.queue_packets
+        size = self.max_datagram_size
+        rtt_ms = 2 * self.delay_ms
+        end_ms = self.now_ms + int(round(duration * 1000))
+        # 每毫秒最多发出的包数
+        if self.line_rate_mbps is None:
+            line_packets = float("inf")
+        else:
+            line_packets = max(int(self.line_rate_mbps * 125 / size), 1)
+        pacer = cc.pacer
+        credit = self._pacing_credit
+        rtt_samples = self.rtt_samples
+
+        now_ms = self.now_ms
+        while now_ms < end_ms:
+            now = now_ms / 1000
+
+            if acks and acks[0][0] <= now_ms:
+                packet = None
+                while acks and acks[0][0] <= now_ms:
+                    packet = acks.popleft()[1]
+                    cc.on_packet_acked(now=now, packet=packet)
+                rtt = now - packet.sent_time
+                cc.on_rtt_measurement(now=now, rtt=rtt)
+                if rtt_samples is not None:
+                    rtt_samples.append(rtt)
+                if pacer is not None:
+                    # 和 aioquic 的 recovery 一样：srtt 增益 1/8，每个样本更新速率
+                    srtt = self.smoothed_rtt
+                    srtt = rtt if srtt == 0 else 0.875 * srtt + 0.125 * rtt
+                    self.smoothed_rtt = srtt
+                    pacer.update_rate(cc.congestion_window, self.smoothed_rtt)
+
+            if losses and losses[0][0] <= now_ms:
+                lost = []
+                while losses and losses[0][0] <= now_ms:
+                    lost.append(losses.popleft()[1])
+                cc.on_packets_lost(now=now, packets=lost)
+                if pacer is not None:
+                    pacer.update_rate(cc.congestion_window, self.smoothed_rtt)
+
+            paced = pacer is not None and pacer.pacing_rate is not None
+            if paced:
+                refill = pacer.pacing_rate / 1000
+                credit = min(credit + refill, max(pacer.max_burst * size, refill + size))
+            sent_now = 0
+            while (
+                cc.bytes_in_flight + size <= cc.congestion_window
+                and sent_now < line_packets
+            ):
+                sent_now += 1
+                if paced:
+                    if credit < size:
+                        break
+                    credit -= size
+                packet = QuicSentPacket(
+                    epoch=Epoch.ONE_RTT,
+                    in_flight=True,
+                    is_ack_eliciting=True,
+                    is_crypto_packet=False,
+                    packet_number=self._packet_number,
+                    packet_type=QuicPacketType.ONE_RTT,
+                    sent_time=now,
+                    sent_bytes=size,
+                )
+                self._packet_number += 1
+                self.sent_packets += 1
+                cc.on_packet_sent(packet=packet)
+                if queue_packets is not None and len(queue) >= queue_packets:
+                    self.dropped_packets += 1
+                    losses.append((now_ms + rtt_ms, packet))
+                else:
+                    queue.append(packet)
+
+            # 和 mahimahi 一样，每个投递机会可送出 MTU 字节，用不完的作废
+            budget = opportunities[now_ms % period] * MTU
+            while budget and queue:
+                remaining = self._head_remaining or queue[0].sent_bytes
+                if remaining > budget:
+                    self._head_remaining = remaining - budget
+                    break
+                budget -= remaining
+                self._head_remaining = 0
+                packet = queue.popleft()
+                self.delivered_bytes += packet.sent_bytes
+                acks.append((now_ms + rtt_ms, packet))
+
+            now_ms += 1
+        self.now_ms = now_ms
+        self._pacing_credit = credit
@@ -0,0 +1,403 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+# mm-link 日志事件：到达队列、投递机会、离开队列、丢包
+ARRIVAL = 0
+OPPORTUNITY = 1
+DEPARTURE = 2
+DROP = 3
+_EVENT_CODES = bytes.maketrans(b"+#-d", b"0123")
+
+DEFAULT_INTERVAL_MS = 100
+CHUNK_SIZE = 4 * 1024 * 1024
+LOG_FILES = ("uplink_log_file", "downlink_log_file")
+CACHE_FILE = "link_metrics.npz"
+# 缓存格式变化时递增
+CACHE_VERSION = 1
+
+
+class LogEvents(NamedTuple):
+    """Events of a log chunk, one array entry per line."""
+
+    time_ms: np.ndarray
+    kind: np.ndarray
+    size: np.ndarray
+    # 离开队列时为排队时延 (ms)，丢包时为丢弃的包数
+    extra: np.ndarray
+
+
+def parse_events(data: bytes, base_ms: int = 0) -> LogEvents:
+    """
+    Parse complete mm-link log lines (without the ``#`` header) into arrays.
+
+    The lines are ``t + bytes`` (arrival), ``t # bytes`` (delivery
+    opportunity), ``t - bytes delay`` (departure after ``delay`` ms in the
+    queue) and ``t d packets bytes`` (drop). Times are made relative to
+    ``base_ms``. Parsing is vectorized over the whole chunk.
+    """
+    if not data:
+        empty = np.zeros(0, dtype=np.int64)
+        return LogEvents(empty, empty, empty, empty)
+    if not data.endswith(b"\n"):
+        raise ValueError("Log chunk must end with a complete line")
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw == ord("\n"))
+    # 每行的字段数 = 行内空格数 + 1
+    spaces = np.cumsum(raw == ord(" "))[ends]
+    fields = np.diff(spaces, prepend=0) + 1
+    values = np.fromstring(data.translate(_EVENT_CODES), dtype=np.int64, sep=" ")
+    if values.size != fields.sum() or not np.isin(fields, (3, 4)).all():
+        raise ValueError("Malformed mm-link log chunk")
+    starts = np.cumsum(fields) - fields
+    kind = values[starts + 1]
+    third = values[starts + 2]
+    fourth = np.where(fields == 4, values[np.minimum(starts + 3, values.size - 1)], 0)
+    # 丢包行是 "t d 包数 字节数"，统一成 size 为字节数
+    drop = kind == DROP
+    return LogEvents(
+        time_ms=values[starts] - base_ms,
+        kind=kind,
+        size=np.where(drop, fourth, third),
+        extra=np.where(drop, third, fourth),
+    )
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    if len(array) >= size:
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class LinkMetrics:
+    """
+    Link utilization, queueing delay and drops accumulated over log chunks.
+
+    Per-interval totals are kept in NumPy columns of ``interval_ms`` bins
+    starting at the first event, and queueing delays in a 1 ms histogram,
+    so memory does not grow with the number of packets.
+    """
+
+    COLUMNS = (
+        "capacity_bytes",
+        "delivered_bytes",
+        "arrival_bytes",
+        "arrival_packets",
+        "dropped_packets",
+        "dropped_bytes",
+        "delay_sum",
+        "delay_count",
+        "delay_max",
+    )
+
+    def __init__(self, interval_ms: int = DEFAULT_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self.first_interval = None
+        self.n_intervals = 0
+        self.first_ms = None
+        self.last_ms = None
+        self.columns = {name: np.zeros(0, dtype=np.int64) for name in self.COLUMNS}
+        self.delay_histogram = np.zeros(0, dtype=np.int64)
+
+    def update(self, events: LogEvents) -> None:
+        if len(events.time_ms) == 0:
+            return
+        time_ms, kind, size, extra = events
+        if self.first_ms is None:
+            self.first_ms = int(time_ms[0])
+            self.first_interval = self.first_ms // self.interval_ms
+        self.last_ms = int(time_ms[-1])
+        index = np.maximum(time_ms // self.interval_ms - self.first_interval, 0)
+        self.n_intervals = max(self.n_intervals, int(index[-1]) + 1)
+        columns = self.columns
+        for name in self.COLUMNS:
+            columns[name] = _grow(columns[name], self.n_intervals)
+
+        def add(name, mask, weights=None):
+            selected = index[mask]
+            if len(selected) == 0:
+                return
+            values = None if weights is None else weights[mask]
+            counts = np.bincount(selected, weights=values, minlength=self.n_intervals)
+            columns[name][: self.n_intervals] += counts.astype(np.int64)
+
+        opportunity = kind == OPPORTUNITY
+        departure = kind == DEPARTURE
+        arrival = kind == ARRIVAL
+        drop = kind == DROP
+        add("capacity_bytes", opportunity, size)
+        add("delivered_bytes", departure, size)
+        add("arrival_bytes", arrival, size)
+        add("arrival_packets", arrival)
+        add("dropped_packets", drop, extra)
+        add("dropped_bytes", drop, size)
+        add("delay_sum", departure, extra)
+        add("delay_count", departure)
+        delays = extra[departure]
+        if len(delays):
+            np.maximum.at(columns["delay_max"], index[departure], delays)
+            histogram = np.bincount(delays)
+            self.delay_histogram = _grow(self.delay_histogram, len(histogram))
+            self.delay_histogram[: len(histogram)] += histogram
+
+    def intervals(self) -> Dict[str, np.ndarray]:
+        """Per-interval arrays; rates are in Mbps, delays in ms."""
+        n = self.n_intervals
+        result = {name: column[:n].copy() for name, column in self.columns.items()}
+        first = self.first_interval or 0
+        result["time_ms"] = (np.arange(n) + first) * self.interval_ms
+        capacity = result["capacity_bytes"]
+        delivered = result["delivered_bytes"]
+        count = result["delay_count"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result["utilization"] = np.where(capacity > 0, delivered / capacity, 0.0)
+            result["delay_mean_ms"] = np.where(
+                count > 0, result["delay_sum"] / count, 0.0
+            )
+        result["capacity_mbps"] = capacity * 8 / (self.interval_ms * 1000)
+        result["throughput_mbps"] = delivered * 8 / (self.interval_ms * 1000)
+        return result
+
+    def delay_percentile(self, q: float) -> float:
+        histogram = self.delay_histogram
+        total = histogram.sum()
+        if total == 0:
+            return 0.0
+        cumulative = np.cumsum(histogram)
+        return float(np.searchsorted(cumulative, q / 100 * total))
+
+    def summary(self) -> Dict[str, float]:
+        """Totals over everything seen so far."""
+        totals = {name: int(column.sum()) for name, column in self.columns.items()}
+        duration_ms = 0
+        if self.first_ms is not None:
+            duration_ms = self.last_ms - self.first_ms + 1
+        capacity = totals["capacity_bytes"]
+        delivered = totals["delivered_bytes"]
+        arrivals = totals["arrival_packets"]
+        delay_count = totals["delay_count"]
+        return {
+            "duration_ms": float(duration_ms),
+            "capacity_mbps": (
+                capacity * 8 / (duration_ms * 1000) if duration_ms else 0.0
+            ),
+            "throughput_mbps": (
+                delivered * 8 / (duration_ms * 1000) if duration_ms else 0.0
+            ),
+            "utilization": delivered / capacity if capacity else 0.0,
+            "delay_mean_ms": totals["delay_sum"] / delay_count if delay_count else 0.0,
+            "delay_p50_ms": self.delay_percentile(50),
+            "delay_p95_ms": self.delay_percentile(95),
+            "delay_p99_ms": self.delay_percentile(99),
+            "delay_max_ms": float(self.columns["delay_max"].max(initial=0)),
+            "dropped_packets": float(totals["dropped_packets"]),
+            "drop_rate": totals["dropped_packets"] / arrivals if arrivals else 0.0,
+        }
+
+    def to_arrays(self, prefix: str = "") -> Dict[str, np.ndarray]:
+        arrays = {
+            f"{prefix}{name}": column[: self.n_intervals]
+            for name, column in self.columns.items()
+        }
+        arrays[f"{prefix}delay_histogram"] = self.delay_histogram
+        arrays[f"{prefix}range"] = np.array(
+            [
+                -1 if self.first_interval is None else self.first_interval,
+                -1 if self.first_ms is None else self.first_ms,
+                -1 if self.last_ms is None else self.last_ms,
+                self.interval_ms,
+            ]
+        )
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str = "") -> "LinkMetrics":
+        first_interval, first_ms, last_ms, interval_ms = (
+            int(v) for v in arrays[f"{prefix}range"]
+        )
+        metrics = cls(interval_ms)
+        if first_ms >= 0:
+            metrics.first_interval = first_interval
+            metrics.first_ms = first_ms
+            metrics.last_ms = last_ms
+        metrics.columns = {
+            name: np.array(arrays[f"{prefix}{name}"]) for name in cls.COLUMNS
+        }
+        metrics.n_intervals = len(metrics.columns["capacity_bytes"])
+        metrics.delay_histogram = np.array(arrays[f"{prefix}delay_histogram"])
+        return metrics
+
+
+class LogTail:
+    """
+    Incremental reader of an mm-link log that may still be written.
+
+    Every :meth:`poll` parses what was appended since the previous one, in
+    chunks of ``chunk_size`` bytes, and keeps an incomplete last line for
+    the next call.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval_ms: int = DEFAULT_INTERVAL_MS,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.path = path
+        self.interval_ms = interval_ms
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.header = {}
+        self.base_ms = 0
+        self._in_header = True
+        self._partial = b""
+
+    def _strip_header(self, data: bytes) -> bytes:
+        while self._in_header and data:
+            if not data.startswith(b"#"):
+                self._in_header = False
+                break
+            line, _, data = data.partition(b"\n")
+            key, sep, value = line[1:].decode().partition(":")
+            if sep:
+                self.header[key.strip()] = value.strip()
+            else:
+                self.header.setdefault("title", key.strip())
+        if "base timestamp" in self.header:
+            self.base_ms = int(self.header["base timestamp"])
+        return data
+
+    def read_events(self) -> Iterator[LogEvents]:
+        """Parse the complete lines appended since the last call."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.offset += len(chunk)
+                data = self._partial + chunk
+                end = data.rfind(b"\n") + 1
+                data, self._partial = data[:end], data[end:]
+                data = self._strip_header(data)
+                if data:
+                    yield parse_events(data, self.base_ms)
+
+    def poll(self) -> LinkMetrics:
+        """Metrics of the events logged since the previous poll."""
+        metrics = LinkMetrics(self.interval_ms)
+        for events in self.read_events():
+            metrics.update(events)
+        return metrics
+
+
+def parse_log(
+    path: str, interval_ms: int = DEFAULT_INTERVAL_MS, chunk_size: int = CHUNK_SIZE
+) -> LinkMetrics:
+    """Metrics of a whole log file, read in chunks of ``chunk_size`` bytes."""
+    return LogTail(path, interval_ms, chunk_size).poll()
+
+
+def _log_signature(episode_dir: str) -> np.ndarray:
+    signature = []
+    for name in LOG_FILES:
+        path = os.path.join(episode_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            signature += [st.st_mtime_ns, st.st_size]
+        else:
+            signature += [-1, -1]
+    return np.array(signature, dtype=np.int64)
+
+
+def analyze_episode(
+    episode_dir: str, interval_ms: int = DEFAULT_INTERVAL_MS
+) -> Dict[str, LinkMetrics]:
+    """
+    Uplink and downlink metrics of one episode directory written by
+    ``MetaConEnv``. Results are cached in ``<episode_dir>/link_metrics.npz``
+    and recomputed when a log file changes.
+    """
+    cache_path = os.path.join(episode_dir, CACHE_FILE)
+    signature = _log_signature(episode_dir)
+    meta = np.concatenate(([CACHE_VERSION, interval_ms], signature))
+    try:
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached["meta"], meta):
+                return {
+                    name: LinkMetrics.from_arrays(cached, f"{name}-")
+                    for name in LOG_FILES
+                }
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+    result = {
+        name: parse_log(os.path.join(episode_dir, name), interval_ms)
+        for name in LOG_FILES
+    }
+    arrays = {"meta": meta}
+    for name, metrics in result.items():
+        arrays.update(metrics.to_arrays(f"{name}-"))
+    tmp = f"{cache_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, cache_path)
+    return result
+
+
+def _episode_summary(args) -> Dict[str, Dict[str, float]]:
+    episode_dir, interval_ms = args
+    metrics = analyze_episode(episode_dir, interval_ms)
+    return {name: m.summary() for name, m in metrics.items()}
+
+
+def find_episode_dirs(root: str) -> List[str]:
+    """Directories under ``root`` holding the logs of an episode."""
+    return sorted(
+        dirpath
+        for dirpath, _, filenames in os.walk(root)
+        if LOG_FILES[0] in filenames and os.path.basename(dirpath) != "live"
+    )
+
+
+def analyze_episodes(
+    episode_dirs: List[str],
+    interval_ms: int = DEFAULT_INTERVAL_MS,
+    processes: Optional[int] = None,
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Summaries of many episode directories, parsed by a process pool. The
+    per-interval arrays stay in each directory's cache, see
+    :func:`analyze_episode`.
+    """
+    jobs = [(episode_dir, interval_ms) for episode_dir in episode_dirs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        summaries = pool.map(_episode_summary, jobs, chunksize=16)
+        return dict(zip(episode_dirs, summaries))
+
+
+if __name__ == "__main__":
+    # python link_log.py <data_dir> [processes]
+    import sys
+
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <data_dir> [processes]")
+        sys.exit(1)
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    summaries = analyze_episodes(find_episode_dirs(sys.argv[1]), processes=processes)
+    for episode_dir, summary in summaries.items():
+        # 数据从 mm-link 外的客户端流向 shell 内的服务端，走的是 downlink
+        link = summary["downlink_log_file"]
+        print(
+            f"{episode_dir}: utilization {link['utilization']:.2f}"
+            f"  throughput {link['throughput_mbps']:.1f} Mbps"
+            f"  delay p50 {link['delay_p50_ms']:.0f} ms"
+            f"  p95 {link['delay_p95_ms']:.0f} ms"
+            f"  drops {link['dropped_packets']:.0f}"
+        )
@@ -1,12 +1,56 @@
+import asyncio
+import functools
+import itertools
+import os
 import time
-import schedule
-from typing import Iterable
+import weakref
+from array import array
+from typing import Callable, Iterable, Optional
+import numpy as np
 from aioquic.quic.packet_builder import QuicSentPacket
 from aioquic.quic.congestion.base import (
     QuicCongestionControl,
     register_congestion_control,
 )
-from drl_comunication import DrlComunicationClient
+from aioquic.quic.recovery import K_MICRO_SECOND, K_SECOND, QuicPacketPacer
+from clock import WALL_CLOCK
+from drl_comunication import AsyncDrlComunicationClient, DrlComunicationClient
+from embedded_policy import load_policy
+from event_log import ACKED, ACTION, EXPIRED, LOST, OBSERVATION, RESET, RTT, SENT
+from instrumentation import DecisionInstrumentation
+from shm_channel import TRANSPORTS, AsyncShmDrlClient, ShmDrlClient
+
+DECISION_MODES = ("blocking", "async")
+# 每个 rollout worker 通过 METACON_DRL_SOCKET 指定自己的 socket
+DEFAULT_DRL_SOCKET = os.environ.get("METACON_DRL_SOCKET", "/tmp/drl_comunication")
+# "socket" 或 "shm"（共享内存），需要和 env 一致
+DEFAULT_DRL_TRANSPORT = os.environ.get("METACON_DRL_TRANSPORT", "socket")
+# 同一进程内每个连接的流编号，随消息发送给推理服务端
+_flow_ids = itertools.count(1)
+# 按 RTT 倍数决策时的最短间隔，避免 RTT 很小时定时器过于频繁
+MIN_DECISION_INTERVAL = 0.01
+# thr, thr_max, avg_delay, min_delay, loss, srtt, cwnd 之后可以追加的特征
+OBSERVATION_FEATURES = (
+    "rtt_p50",
+    "rtt_p95",
+    "jitter",
+    "delivery_rate",
+    "loss_rate",
+    "pacing_rate",
+)
+SRTT_GAIN = 0.2
+# "window": 按 cwnd/srtt 平滑发送；"direct": 策略的第二维动作直接调节速率
+PACING_MODES = ("window", "direct")
+# 速率上下限 (bytes/s)
+MIN_PACING_RATE = 12 * 1000
+MAX_PACING_RATE = 125 * 1000 * 1000
+
+
+def _fire_decision(ref: "weakref.ref[MetaConCongestionControl]") -> None:
+    # 定时器只持有弱引用，连接被回收后定时器自然停止
+    controller = ref()
+    if controller is not None:
+        controller._on_decision_timer()
 
 
 class OnlineVarianceCalculator:
@@ -58,55 +102,261 @@ class OnlineVarianceCalculator:
         return self.sum / self.n
 
 
+def _ring_view(values: array, count: int) -> np.ndarray:
+    """Samples of a ring buffer, oldest first. Copies only once it wrapped."""
+    data = np.frombuffer(values, dtype=np.float64)
+    capacity = len(data)
+    if count <= capacity:
+        return data[:count]
+    start = count % capacity
+    return np.concatenate((data[start:], data[:start]))
+
+
 class Observer:
-    def __init__(self) -> None:
-        # thr, thr_max, avg_delay, min_delay, loss, srtt, cwnd
-        self.send_count = 0
-        self.send_bytes = 0
-        self.delay_calculator = OnlineVarianceCalculator()
-        self.min_delay = 0
-        self.thr_max = 0
-        self.loss = 0
-        self.srtt = 0
+    """
+    Per-decision statistics of one connection.
+
+    The packet callbacks only store raw samples: RTTs (and, for the
+    ``delivery_rate`` feature, ACK times and sizes) go into preallocated
+    ring buffers of ``capacity`` samples, everything else is a counter.
+    Aggregation happens once per decision in :meth:`get_observation` with
+    NumPy. If more than ``capacity`` samples arrive in one interval, the
+    RTT statistics cover the most recent ``capacity`` of them.
+
+    ``features`` appends optional entries from :data:`OBSERVATION_FEATURES`
+    to the base observation. ``min_delay`` is kept over the whole episode,
+    or, with ``min_delay_window`` seconds set, refreshed once the current
+    minimum is older than the window.
+    """
+
+    __slots__ = (
+        "clock",
+        "features",
+        "min_delay_window",
+        "send_count",
+        "send_bytes",
+        "loss",
+        "cwnd",
+        "pacing_rate",
+        "thr_max",
+        "min_delay",
+        "start_time",
+        "_rtts",
+        "_rtt_count",
+        "_ack_times",
+        "_ack_bytes",
+        "_ack_count",
+        "_srtt",
+        "_min_delay_time",
+    )
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = WALL_CLOCK,
+        features: Iterable[str] = (),
+        capacity: int = 4096,
+        min_delay_window: Optional[float] = None,
+    ) -> None:
+        features = tuple(features)
+        for feature in features:
+            if feature not in OBSERVATION_FEATURES:
+                raise ValueError(f"Unknown observation feature: {feature}")
+        self.clock = clock
+        self.features = features
+        self.min_delay_window = min_delay_window
+        self._rtts = array("d", bytes(8 * capacity))
+        self._ack_times = None
+        self._ack_bytes = None
+        if "delivery_rate" in features:
+            self._ack_times = array("d", bytes(8 * capacity))
+            self._ack_bytes = array("d", bytes(8 * capacity))
         self.cwnd = 0
-        # 设置初始时间为当前时间
-        self.start_time = time.time()
+        self.pacing_rate = 0.0
+        self.reset_episode()
 
     def reset(self) -> None:
+        # srtt 跨决策保留，先把本周期的样本折算进去
+        self._srtt = self.srtt
         self.send_count = 0
         self.send_bytes = 0
         self.loss = 0
-        self.start_time = time.time()
-        self.delay_calculator.reset()
+        self._rtt_count = 0
+        self._ack_count = 0
+        self.start_time = self.clock()
 
-    def on_packet_acked(self, *, packet: QuicSentPacket) -> None:
+    def reset_episode(self) -> None:
+        """Also forget the statistics kept across decisions."""
+        self.min_delay = 0
+        self._min_delay_time = 0.0
+        self.thr_max = 0
+        self._rtt_count = 0
+        self._srtt = 0.0
+        self.reset()
+
+    def on_packet_acked(self, *, now: float, packet: QuicSentPacket) -> None:
         self.send_bytes += packet.sent_bytes
         self.send_count += 1
+        if self._ack_times is not None:
+            i = self._ack_count % len(self._ack_times)
+            self._ack_times[i] = now
+            self._ack_bytes[i] = packet.sent_bytes
+            self._ack_count += 1
 
     def on_packet_lost(self, *, packet: QuicSentPacket) -> None:
         self.loss += 1
 
     def on_rtt_measurement(self, *, rtt: float) -> None:
-        self.srtt = 0.8 * self.srtt + 0.2 * rtt
-        self.delay_calculator.update(rtt)
+        self._rtts[self._rtt_count % len(self._rtts)] = rtt
+        self._rtt_count += 1
+
+    @property
+    def rtt_samples(self) -> int:
+        return self._rtt_count
+
+    @property
+    def srtt(self) -> float:
+        """EWMA (gain 0.2) of all RTT samples, updated lazily."""
+        rtts = _ring_view(self._rtts, self._rtt_count)
+        n = len(rtts)
+        if n == 0:
+            return self._srtt
+        decay = (1 - SRTT_GAIN) ** np.arange(n - 1, -1, -1)
+        return float((1 - SRTT_GAIN) * decay[0] * self._srtt + SRTT_GAIN * decay @ rtts)
 
     def get_observation(self) -> Iterable[float]:
-        end_time = time.time()
-        duration = end_time - self.start_time
-        if self.min_delay == 0 or self.delay_calculator.get_min() < self.min_delay:
-            self.min_delay = self.delay_calculator.get_min()
-        thr = self.send_bytes / duration
+        now = self.clock()
+        duration = now - self.start_time
+        rtts = _ring_view(self._rtts, self._rtt_count)
+        avg_delay = 0.0
+        if len(rtts):
+            avg_delay = float(rtts.mean())
+            interval_min = float(rtts.min())
+            window = self.min_delay_window
+            if (
+                self.min_delay == 0
+                or interval_min <= self.min_delay
+                or (window is not None and now - self._min_delay_time > window)
+            ):
+                self.min_delay = interval_min
+                self._min_delay_time = now
+        thr = self.send_bytes / duration if duration > 0 else 0.0
         if self.thr_max == 0 or thr > self.thr_max:
             self.thr_max = thr
-        return [
+        observation = [
             thr,
             self.thr_max,
-            self.delay_calculator.get_avg(),
+            avg_delay,
             self.min_delay,
             self.loss,
             self.srtt,
             self.cwnd,
         ]
+        if self.features:
+            observation.extend(self._extra_features(rtts))
+        return observation
+
+    def _extra_features(self, rtts: np.ndarray) -> list:
+        values = {}
+        features = self.features
+        if "rtt_p50" in features or "rtt_p95" in features:
+            p50, p95 = np.percentile(rtts, (50, 95)) if len(rtts) else (0.0, 0.0)
+            values["rtt_p50"], values["rtt_p95"] = float(p50), float(p95)
+        if "jitter" in features:
+            # 相邻 RTT 样本差的平均绝对值
+            values["jitter"] = 0.0
+            if len(rtts) > 1:
+                values["jitter"] = float(np.abs(np.diff(rtts)).mean())
+        if "delivery_rate" in features:
+            values["delivery_rate"] = 0.0
+            times = _ring_view(self._ack_times, self._ack_count)
+            if len(times) > 1 and times[-1] > times[0]:
+                sizes = _ring_view(self._ack_bytes, self._ack_count)
+                # 第一个 ACK 只标记区间起点
+                values["delivery_rate"] = float(
+                    (sizes.sum() - sizes[0]) / (times[-1] - times[0])
+                )
+        if "loss_rate" in features:
+            total = self.send_count + self.loss
+            values["loss_rate"] = self.loss / total if total else 0.0
+        if "pacing_rate" in features:
+            values["pacing_rate"] = self.pacing_rate
+        return [values[feature] for feature in features]
+
+
+class PolicyPacer(QuicPacketPacer):
+    """
+    Pacer of a MetaCon connection, installed in place of aioquic's own by
+    :func:`install_pacer`.
+
+    aioquic paces at ``cwnd / srtt`` but lets bursts grow to a quarter of
+    the window (up to 16 packets), which is what fills shallow droptail
+    queues. Here bursts are capped at ``max_burst`` packets. In
+    ``"window"`` mode the rate is ``pacing_gain * cwnd / srtt``, updated
+    whenever aioquic or the controller changes either. In ``"direct"``
+    mode the rate is seeded from ``cwnd / srtt`` and then only changed by
+    the policy through :meth:`scale_rate`.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_datagram_size: int,
+        mode: str = "window",
+        pacing_gain: float = 1.0,
+        max_burst: int = 2,
+    ) -> None:
+        if mode not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode: {mode}")
+        super().__init__(max_datagram_size=max_datagram_size)
+        self.mode = mode
+        self.pacing_gain = pacing_gain
+        self.max_burst = max_burst
+        self.reset()
+
+    def reset(self) -> None:
+        """Back to unpaced until the next RTT sample."""
+        self.pacing_rate = None
+        self.congestion_window = 0
+        self.smoothed_rtt = 0.0
+        self.packet_time = None
+        self.bucket_max = 0.0
+        self.bucket_time = 0.0
+
+    def update_rate(self, congestion_window: int, smoothed_rtt: float) -> None:
+        self.congestion_window = congestion_window
+        if smoothed_rtt > 0:
+            self.smoothed_rtt = smoothed_rtt
+        if self.mode == "direct" and self.pacing_rate is not None:
+            return
+        if self.smoothed_rtt > 0:
+            self.set_rate(self.pacing_gain * congestion_window / self.smoothed_rtt)
+
+    def set_rate(self, pacing_rate: float) -> None:
+        """Pace at ``pacing_rate`` bytes per second."""
+        pacing_rate = min(max(pacing_rate, MIN_PACING_RATE), MAX_PACING_RATE)
+        self.pacing_rate = pacing_rate
+        self.packet_time = max(
+            K_MICRO_SECOND, min(self._max_datagram_size / pacing_rate, K_SECOND)
+        )
+        self.bucket_max = self.max_burst * self._max_datagram_size / pacing_rate
+        if self.bucket_time > self.bucket_max:
+            self.bucket_time = self.bucket_max
+
+    def scale_rate(self, action: float) -> None:
+        """Multiply the rate by ``2**action``, like the window action."""
+        if self.pacing_rate is None:
+            if self.smoothed_rtt <= 0:
+                return
+            self.set_rate(self.congestion_window / self.smoothed_rtt)
+        self.set_rate(self.pacing_rate * pow(2, action))
+
+
+def install_pacer(quic) -> None:
+    """Let the recovery of ``quic`` pace with its MetaCon controller's pacer."""
+    loss = quic._loss
+    pacer = getattr(loss._cc, "pacer", None)
+    if pacer is not None:
+        loss._pacer = pacer
 
 
 class MetaConCongestionControl(QuicCongestionControl):
@@ -114,59 +364,388 @@ class MetaConCongestionControl(QuicCongestionControl):
     MetaCon congestion control algorithm based on MAMLPPO
     """
 
-    def __init__(self, *, max_datagram_size: int) -> None:
+    def __init__(
+        self,
+        *,
+        max_datagram_size: int,
+        clock: Callable[[], float] = WALL_CLOCK,
+        auto_decision: bool = True,
+        decision_mode: str = "blocking",
+        decision_deadline: float = 0.5,
+        decision_interval: float = 1.0,
+        decision_rtt_multiple: Optional[float] = None,
+        drl_socket_path: str = None,
+        drl_transport: Optional[str] = None,
+        observation_features: Iterable[str] = (),
+        min_delay_window: Optional[float] = None,
+        metrics_sink=None,
+        pacing: Optional[str] = None,
+        pacing_gain: float = 1.0,
+        max_burst: int = 2,
+        event_recorder=None,
+        drl_channel=None,
+    ) -> None:
+        """
+        Decisions are driven by a per-connection timer on the running event
+        loop, every ``decision_interval`` seconds or, when
+        ``decision_rtt_multiple`` is set, every that many smoothed RTTs once
+        an RTT sample exists. The packet callbacks do no scheduling work.
+
+        With ``auto_decision=False`` no decision timer and no DRL socket are
+        created; the caller drives decisions through ``get_observation`` and
+        ``apply_action`` (used by the in-process link emulator).
+
+        In ``"async"`` decision mode the observation is written to the DRL
+        socket without waiting and the action is applied by the reader task
+        when it arrives; the current window stays in use meanwhile. Actions
+        arriving after ``decision_deadline`` seconds, or after a newer
+        observation was sent, are dropped and counted in
+        ``stale_decisions``; decisions that never got an action applied are
+        counted in ``missed_decisions``.
+
+        ``drl_transport`` selects the unix socket (``"socket"``) or the
+        shared-memory channel of :mod:`shm_channel` (``"shm"``) to reach
+        the environment at ``drl_socket_path``; it defaults to the
+        ``METACON_DRL_TRANSPORT`` environment variable.
+
+        ``observation_features`` and ``min_delay_window`` configure the
+        :class:`Observer`. With a ``metrics_sink`` from
+        :mod:`instrumentation`, every decision is timed and recorded there.
+
+        With ``pacing`` set to one of :data:`PACING_MODES` the controller
+        owns a :class:`PolicyPacer` (``pacer``) that the connection must
+        use, see :func:`install_pacer`. In ``"direct"`` mode an action
+        message may carry a second value, ``pacing``, that scales the
+        pacing rate by ``2**pacing``.
+
+        ``clock`` is any callable returning seconds, e.g. a
+        :class:`~clock.WallClock` or a :class:`~clock.ManualClock`. An
+        ``event_recorder`` (:class:`~event_log.EventRecorder`) logs every
+        packet, RTT and decision event for :func:`~event_log.replay`.
+
+        With a ``drl_channel``
+        (:class:`~drl_comunication.MultiplexedDrlChannel`) the controller
+        talks to the DRL side over that shared connection instead of
+        opening its own; this requires ``"async"`` decisions, since a
+        blocking wait would stall every other flow on the event loop.
+        """
         super().__init__(max_datagram_size=max_datagram_size)
+        if decision_mode not in DECISION_MODES:
+            raise ValueError(f"Unknown decision mode: {decision_mode}")
+        if drl_channel is not None and decision_mode != "async":
+            raise ValueError("A shared DRL channel needs async decisions")
         self._max_datagram_size = max_datagram_size
         self.initial_window = max_datagram_size * 10
         self.congestion_window = self.initial_window
-        self.observer = Observer()
+        self.clock = clock
+        self.observer = Observer(
+            clock=clock,
+            features=observation_features,
+            min_delay_window=min_delay_window,
+        )
+        self.observer.cwnd = self.initial_window
+        self.pacer = None
+        if pacing is not None:
+            self.pacer = PolicyPacer(
+                max_datagram_size=max_datagram_size,
+                mode=pacing,
+                pacing_gain=pacing_gain,
+                max_burst=max_burst,
+            )
+        self.flow_id = next(_flow_ids)
+        self.decision_mode = decision_mode
+        self.decision_deadline = decision_deadline
+        self.missed_decisions = 0
+        self.stale_decisions = 0
+        self._decision_seq = 0
+        self._pending_seq = None
+        self._pending_deadline = 0.0
+        self._connect_task = None
+        self.decision_interval = decision_interval
+        self.decision_rtt_multiple = decision_rtt_multiple
+        self.drl_socket_path = drl_socket_path or DEFAULT_DRL_SOCKET
+        self.drl_transport = drl_transport or DEFAULT_DRL_TRANSPORT
+        if self.drl_transport not in TRANSPORTS:
+            raise ValueError(f"Unknown DRL transport: {self.drl_transport}")
+        self._loop = None
+        self._decision_handle = None
+        self.drl_channel = drl_channel
+        self.drl_comunication_client = None
+        self.delivered_bytes = 0
+        self.instrumentation = None
+        if metrics_sink is not None:
+            self.instrumentation = DecisionInstrumentation(metrics_sink, self.flow_id)
+        self._sent_ns = 0
+        self.event_recorder = event_recorder
+        if event_recorder is not None:
+            event_recorder.attach(self)
+        if auto_decision:
+            self.drl_comunication_client = self._create_drl_client()
+            # aioquic 在事件循环中创建连接，这里总能拿到正在运行的循环
+            self._loop = asyncio.get_running_loop()
+            self._arm_decision_timer()
+
+    def next_decision_delay(self) -> float:
+        srtt = self.observer.srtt
+        if self.decision_rtt_multiple is not None and srtt > 0:
+            return max(self.decision_rtt_multiple * srtt, MIN_DECISION_INTERVAL)
+        return self.decision_interval
+
+    def _arm_decision_timer(self) -> None:
+        self._decision_handle = self._loop.call_later(
+            self.next_decision_delay(), _fire_decision, weakref.ref(self)
+        )
+
+    def _on_decision_timer(self) -> None:
+        try:
+            self.perform_decision()
+        finally:
+            self._arm_decision_timer()
+
+    def close(self) -> None:
+        """Stop the decision timer and release the DRL connection."""
+        if self._decision_handle is not None:
+            self._decision_handle.cancel()
+            self._decision_handle = None
+        client = self.drl_comunication_client
+        if client is not None:
+            # 共享通道上的流即使没连上也要注销
+            if self.drl_channel is not None or client.is_connected():
+                client.close()
+
+    def _create_drl_client(self):
+        if self.drl_channel is not None:
+            return self.drl_channel.open_flow(self.flow_id, self._on_action_message)
+        shm = self.drl_transport == "shm"
+        if self.decision_mode == "async":
+            client_class = AsyncShmDrlClient if shm else AsyncDrlComunicationClient
+            return client_class(
+                self.drl_socket_path, on_message=self._on_action_message
+            )
+        if shm:
+            return ShmDrlClient(self.drl_socket_path)
+        return DrlComunicationClient(self.drl_socket_path)
+
+    def get_observation(self) -> Iterable[float]:
+        if self.pacer is not None:
+            self.observer.pacing_rate = self.pacer.pacing_rate or 0.0
+        return self.observer.get_observation()
+
+    def _build_observation(self) -> Iterable[float]:
+        if self.event_recorder is not None:
+            self.event_recorder.record(OBSERVATION)
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self.get_observation()
+        start = time.perf_counter_ns()
+        observation = self.get_observation()
+        elapsed = time.perf_counter_ns() - start
+        observer = self.observer
+        instrumentation.begin(
+            self.clock(),
+            observer.send_count,
+            observer.loss,
+            observer.rtt_samples,
+            elapsed,
+        )
+        return observation
+
+    def _finish_decision(self, ipc_wait_ns: int, action_apply_ns: int) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.finish(
+                ipc_wait_ns,
+                action_apply_ns,
+                self.congestion_window,
+                self.bytes_in_flight,
+            )
+
+    def _set_window(self, action: float, pacing: Optional[float] = None) -> None:
+        if self.event_recorder is not None:
+            self.event_recorder.record(
+                ACTION, action, extra=float("nan") if pacing is None else pacing
+            )
+        new_cwnd = self.congestion_window * pow(2, action)
+        self.congestion_window = max(self.initial_window, new_cwnd)
+        self.observer.cwnd = self.congestion_window
+        pacer = self.pacer
+        if pacer is not None:
+            if pacing is not None and pacer.mode == "direct":
+                pacer.scale_rate(pacing)
+            else:
+                # 新窗口立即生效，不用等下一个 RTT 样本
+                pacer.update_rate(self.congestion_window, pacer.smoothed_rtt)
+
+    def apply_action(self, action: float, pacing: Optional[float] = None) -> None:
+        self._set_window(action, pacing)
+        self.observer.reset()
+
+    def reset_episode(self) -> None:
+        """
+        Start a new episode on the running connection: the window goes back
+        to ``initial_window`` and all observer statistics are cleared. Sent
+        by the environment as a ``{"reset": true}`` message in place of an
+        action, so the QUIC connection does not have to be re-established.
+        The controller answers it right away with the observation of the
+        new episode instead of waiting for the next decision timer.
+        """
+        if self.event_recorder is not None:
+            self.event_recorder.record(RESET)
+        self.congestion_window = self.initial_window
         self.observer.cwnd = self.initial_window
-        self.job = schedule.every(1).seconds.do(self.perform_decision)
-        self.drl_comunication_client = DrlComunicationClient("/tmp/drl_comunication")
+        self.observer.reset_episode()
+        if self.pacer is not None:
+            self.pacer.reset()
+        self._pending_seq = None
 
     def perform_decision(self) -> float:
-        observation = self.observer.get_observation()
-        if not self.drl_comunication_client.is_connected():
-            self.drl_comunication_client.connect()
-        # 发送观测值到模型
-        self.drl_comunication_client.send(
+        if self.decision_mode == "async":
+            self._send_observation_nowait()
+            return
+        while True:
+            observation = self._build_observation()
+            if not self.drl_comunication_client.is_connected():
+                self.drl_comunication_client.connect()
+            sent = time.perf_counter_ns()
+            # 发送观测值到模型
+            self.drl_comunication_client.send(
+                {
+                    "observation": observation,
+                    "window": self.congestion_window,
+                    "flow": self.flow_id,
+                }
+            )
+            # 从模型接收决策
+            action_data = self.drl_comunication_client.receive()
+            received = time.perf_counter_ns()
+            if not action_data.get("reset"):
+                break
+            # 软重置后立即发送新回合的第一个观测值，不等下一次定时器
+            self.reset_episode()
+            self._finish_decision(received - sent, -1)
+        self.apply_action(action_data.get("action", 0), action_data.get("pacing"))
+        self._finish_decision(received - sent, time.perf_counter_ns() - received)
+
+    def _send_observation_nowait(self) -> None:
+        if self._pending_seq is not None:
+            # 上一次决策没有在下一个周期前生效
+            self.missed_decisions += 1
+            self._pending_seq = None
+        client = self.drl_comunication_client
+        if not client.is_connected():
+            self.missed_decisions += 1
+            if self._connect_task is None or self._connect_task.done():
+                self._connect_task = asyncio.ensure_future(client.connect())
+            return
+        observation = self._build_observation()
+        self._decision_seq += 1
+        self._pending_seq = self._decision_seq
+        self._pending_deadline = self.clock() + self.decision_deadline
+        client.send_nowait(
             {
                 "observation": observation,
-                "window": self.congestion_window
+                "window": self.congestion_window,
+                "flow": self.flow_id,
+                "seq": self._decision_seq,
             }
         )
-        # 从模型接收决策
-        action_data = self.drl_comunication_client.receive()
-        action = action_data.get("action", 0)
-        new_cwnd = self.congestion_window * pow(2, action)
-        print(f"action: {action}, new_cwnd: {new_cwnd}")
-        self.congestion_window = max(self.initial_window, new_cwnd)
-        self.observer.cwnd = self.congestion_window
+        self._sent_ns = time.perf_counter_ns()
+        # 下一个观测周期从发送时刻开始，而不是动作到达时刻
         self.observer.reset()
 
+    def _on_action_message(self, msg: dict) -> None:
+        received = time.perf_counter_ns()
+        if msg.get("reset"):
+            self.reset_episode()
+            self._finish_decision(received - self._sent_ns, -1)
+            # 软重置后立即发送新回合的第一个观测值，决策周期从此刻重新计时
+            if self._decision_handle is not None:
+                self._decision_handle.cancel()
+            self._send_observation_nowait()
+            if self._loop is not None:
+                self._arm_decision_timer()
+            return
+        if msg.get("seq") != self._pending_seq or self.clock() > self._pending_deadline:
+            self.stale_decisions += 1
+            return
+        self._pending_seq = None
+        self._set_window(msg.get("action", 0), msg.get("pacing"))
+        self._finish_decision(
+            received - self._sent_ns, time.perf_counter_ns() - received
+        )
+
     def on_packet_acked(self, *, now: float, packet: QuicSentPacket) -> None:
         self.bytes_in_flight -= packet.sent_bytes
-        self.observer.on_packet_acked(packet=packet)
-        schedule.run_pending()
+        self.delivered_bytes += packet.sent_bytes
+        self.observer.on_packet_acked(now=now, packet=packet)
+        if self.event_recorder is not None:
+            self.event_recorder.record(ACKED, now, packet)
 
     def on_packet_sent(self, *, packet: QuicSentPacket) -> None:
         self.bytes_in_flight += packet.sent_bytes
-        schedule.run_pending()
+        if self.event_recorder is not None:
+            self.event_recorder.record(SENT, packet=packet)
 
     def on_packets_expired(self, *, packets: Iterable[QuicSentPacket]) -> None:
         for packet in packets:
             self.bytes_in_flight -= packet.sent_bytes
             self.observer.on_packet_lost(packet=packet)
+            if self.event_recorder is not None:
+                self.event_recorder.record(EXPIRED, packet=packet)
 
     def on_packets_lost(self, *, now: float, packets: Iterable[QuicSentPacket]) -> None:
         for packet in packets:
             self.bytes_in_flight -= packet.sent_bytes
             self.observer.on_packet_lost(packet=packet)
-        schedule.run_pending()
+            if self.event_recorder is not None:
+                self.event_recorder.record(LOST, now, packet)
+
+    def on_persistent_congestion(self) -> None:
+        # 窗口完全由策略决定，持续拥塞不单独处理
+        pass
 
     def on_rtt_measurement(self, *, now: float, rtt: float) -> None:
         self.observer.on_rtt_measurement(rtt=rtt)
-        schedule.run_pending()
+        if self.event_recorder is not None:
+            self.event_recorder.record(RTT, rtt)
+
+
+class EmbeddedMetaConCongestionControl(MetaConCongestionControl):
+    """
+    MetaCon with the policy evaluated in-process by NumPy instead of the
+    DRL trainer. The exported policy is read from ``policy_path`` or the
+    ``METACON_POLICY`` environment variable.
+    """
+
+    def __init__(self, *, policy_path: str = None, **kwargs) -> None:
+        if policy_path is None:
+            policy_path = os.environ.get("METACON_POLICY")
+        if policy_path is None:
+            raise ValueError("meta_con_embedded needs METACON_POLICY or policy_path")
+        self.policy = load_policy(policy_path)
+        super().__init__(**kwargs)
+
+    def _create_drl_client(self):
+        return None
+
+    def perform_decision(self) -> float:
+        observation = self._build_observation()
+        start = time.perf_counter_ns()
+        action = self.policy.get_action(observation)
+        inferred = time.perf_counter_ns()
+        self.apply_action(
+            float(action[0]), float(action[1]) if len(action) > 1 else None
+        )
+        # 推理时间记在 ipc_wait 中，和 DRL 端的等待时间对应
+        self._finish_decision(inferred - start, time.perf_counter_ns() - inferred)
+
+
+def register_meta_con(
+    name: str = "meta_con", factory=MetaConCongestionControl, **options
+) -> None:
+    """Register MetaCon under ``name`` with constructor ``options`` bound."""
+    register_congestion_control(name, functools.partial(factory, **options))
 
 
-register_congestion_control("meta_con", MetaConCongestionControl)
+register_meta_con("meta_con")
+register_meta_con("meta_con_async", decision_mode="async")
+register_meta_con("meta_con_embedded", EmbeddedMetaConCongestionControl)
@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import functools
+import json
+import signal
+from typing import Optional
+
+from aioquic.asyncio import connect
+from aioquic.quic.configuration import QuicConfiguration
+
+import meta_con
+from client import DEFAULT_CHUNK_SIZE, TRAFFIC_PATTERNS, EchoClientProtocol
+from drl_comunication import MultiplexedDrlChannel
+from instrumentation import create_sink
+
+MULTI_CC = "meta_con_multi"
+
+
+def jain_fairness(values) -> float:
+    """Jain's fairness index, 1 when every flow gets the same share."""
+    values = list(values)
+    square_sum = sum(v * v for v in values)
+    if not square_sum:
+        return 1.0
+    return sum(values) ** 2 / (len(values) * square_sum)
+
+
+async def _run_flow(
+    index: int,
+    host: str,
+    port: int,
+    duration: float,
+    start_delay: float,
+    traffic_options: dict,
+) -> dict:
+    await asyncio.sleep(start_delay)
+    loop = asyncio.get_running_loop()
+    configuration = QuicConfiguration(is_client=True)
+    configuration.verify_mode = False
+    configuration.congestion_control_algorithm = MULTI_CC
+    started = loop.time()
+    async with connect(
+        host,
+        port,
+        configuration=configuration,
+        create_protocol=functools.partial(
+            EchoClientProtocol, traffic_options=traffic_options
+        ),
+    ) as protocol:
+        cc = protocol._quic._loss._cc
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            if protocol.traffic_task is not None:
+                protocol.traffic_task.cancel()
+            cc.close()
+        elapsed = loop.time() - started
+        generator = protocol.traffic_generator
+        return {
+            "index": index,
+            "flow": cc.flow_id,
+            "start": start_delay,
+            "duration": elapsed,
+            "delivered_bytes": cc.delivered_bytes,
+            "goodput_mbps": cc.delivered_bytes * 8 / elapsed / 1e6,
+            "offered_bytes": generator.bytes_offered if generator else 0,
+            "congestion_window": cc.congestion_window,
+            "missed_decisions": cc.missed_decisions,
+            "stale_decisions": cc.stale_decisions,
+        }
+
+
+async def run_flows(
+    host: str,
+    port: int,
+    n_flows: int,
+    drl_socket_path: str,
+    duration: float = 30.0,
+    stagger: float = 0.0,
+    traffic_options: Optional[dict] = None,
+    policy_path: Optional[str] = None,
+    batch_window: float = 0.002,
+    **controller_options,
+) -> dict:
+    """
+    Run ``n_flows`` QUIC connections to ``host:port`` from this event loop.
+
+    Flow ``i`` starts ``i * stagger`` seconds in and sends for
+    ``duration`` seconds. Every flow has its own controller (observer,
+    window, decision timer, pacer) and all of them share one
+    :class:`~drl_comunication.MultiplexedDrlChannel` to
+    ``drl_socket_path``, so decisions are async. With ``policy_path``, a
+    :class:`~inference_server.BatchedInferenceServer` for that exported
+    policy is started on the same loop to answer them.
+
+    Returns the per-flow results with the aggregate goodput and Jain's
+    fairness index over the flows' goodputs.
+    """
+    server = None
+    if policy_path is not None:
+        # 延迟导入：只有本地推理时需要
+        from embedded_policy import load_policy
+        from inference_server import BatchedInferenceServer
+
+        server = BatchedInferenceServer(
+            drl_socket_path, load_policy(policy_path), batch_window=batch_window
+        )
+        await server.start()
+    channel = MultiplexedDrlChannel(drl_socket_path)
+    meta_con.register_meta_con(
+        MULTI_CC, decision_mode="async", drl_channel=channel, **controller_options
+    )
+    try:
+        flows = await asyncio.gather(
+            *(
+                _run_flow(
+                    i, host, port, duration, i * stagger, traffic_options or {}
+                )
+                for i in range(n_flows)
+            )
+        )
+    finally:
+        channel.close()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+    goodputs = [flow["goodput_mbps"] for flow in flows]
+    result = {
+        "flows": flows,
+        "goodput_mbps": sum(goodputs),
+        "jain_fairness": jain_fairness(goodputs),
+        "unroutable_replies": channel.unroutable,
+    }
+    if server is not None:
+        result["inference_batches"] = server.batches
+        result["inference_decisions"] = server.decisions
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Run several MetaCon flows from one process"
+    )
+    parser.add_argument("ip")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--flows", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument(
+        "--stagger", type=float, default=0.0, help="seconds between flow starts"
+    )
+    parser.add_argument(
+        "--drl-socket",
+        default=meta_con.DEFAULT_DRL_SOCKET,
+        help="unix socket of the DRL side shared by all flows",
+    )
+    parser.add_argument(
+        "--policy",
+        help="serve this exported policy in-process on --drl-socket",
+    )
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    parser.add_argument("--decision-deadline", type=float, default=0.5)
+    parser.add_argument("--decision-interval", type=float, default=1.0)
+    parser.add_argument("--decision-rtt-multiple", type=float, default=None)
+    parser.add_argument(
+        "--observation-features",
+        nargs="*",
+        choices=meta_con.OBSERVATION_FEATURES,
+        default=[],
+    )
+    parser.add_argument("--pacing", choices=meta_con.PACING_MODES, default=None)
+    parser.add_argument(
+        "--metrics", help="per-decision records of every flow, tagged by flow id"
+    )
+    parser.add_argument(
+        "--metrics-format", choices=("binary", "csv", "dowel"), default="binary"
+    )
+    parser.add_argument("--traffic", choices=TRAFFIC_PATTERNS, default="bulk")
+    parser.add_argument("--streams", type=int, default=1)
+    parser.add_argument("--rate-mbps", type=float, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--flow-size", type=int, default=100 * 1000)
+    parser.add_argument("--on-time", type=float, default=1.0)
+    parser.add_argument("--off-time", type=float, default=1.0)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    metrics_sink = create_sink(args.metrics, args.metrics_format)
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    try:
+        result = await run_flows(
+            args.ip,
+            args.port,
+            args.flows,
+            args.drl_socket,
+            duration=args.duration,
+            stagger=args.stagger,
+            traffic_options={
+                "pattern": args.traffic,
+                "streams": args.streams,
+                "rate_mbps": args.rate_mbps,
+                "chunk_size": args.chunk_size,
+                "flow_size": args.flow_size,
+                "on_time": args.on_time,
+                "off_time": args.off_time,
+            },
+            policy_path=args.policy,
+            batch_window=args.batch_window_ms / 1000,
+            decision_deadline=args.decision_deadline,
+            decision_interval=args.decision_interval,
+            decision_rtt_multiple=args.decision_rtt_multiple,
+            observation_features=args.observation_features,
+            pacing=args.pacing,
+            metrics_sink=metrics_sink,
+        )
+    finally:
+        if metrics_sink is not None:
+            metrics_sink.close()
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+import os
+import socket
+import struct
+import time
+from typing import Optional
+
+import numpy as np
+
+# 客户端在每个流中每隔 STAMP_SPACING 字节写入发送时间 (time.time())
+STAMP = struct.Struct("<d")
+STAMP_SPACING = 1024
+# 超出这个范围的时延来自没有时间戳的数据，忽略
+MAX_DELAY = 60.0
+
+RECORD_FIELDS = (
+    "time",
+    "duration",
+    "bytes",
+    "arrivals",
+    "max_gap",
+    "delay_mean",
+    "delay_min",
+    "delay_max",
+    "delay_samples",
+)
+_RECORD = struct.Struct("<ddQIddddI")
+RECORD_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("duration", "<f8"),
+        ("bytes", "<u8"),
+        ("arrivals", "<u4"),
+        ("max_gap", "<f8"),
+        ("delay_mean", "<f8"),
+        ("delay_min", "<f8"),
+        ("delay_max", "<f8"),
+        ("delay_samples", "<u4"),
+    ]
+)
+METRICS_MAGIC = b"MCRECV01"
+
+
+def stamp_payload(payload: bytearray, size: int, now: float) -> None:
+    """Write ``now`` at every stamp position of a write of ``size`` bytes."""
+    for offset in range(0, size - STAMP.size + 1, STAMP_SPACING):
+        STAMP.pack_into(payload, offset, now)
+
+
+class StampReader:
+    """
+    Recover the send times stamped by :func:`stamp_payload` from the
+    in-order data of one stream, whatever the chunking on the way.
+    """
+
+    __slots__ = ("offset", "_partial")
+
+    def __init__(self):
+        self.offset = 0
+        self._partial = b""
+
+    def feed(self, data: bytes) -> list:
+        stamps = []
+        n = len(data)
+        if self._partial:
+            # 上一段数据结束在时间戳中间
+            need = STAMP.size - len(self._partial)
+            self._partial += data[:need]
+            if len(self._partial) == STAMP.size:
+                stamps.append(STAMP.unpack(self._partial)[0])
+                self._partial = b""
+        start = self.offset
+        first = -(-start // STAMP_SPACING) * STAMP_SPACING
+        for position in range(first, start + n, STAMP_SPACING):
+            i = position - start
+            if i + STAMP.size <= n:
+                stamps.append(STAMP.unpack_from(data, i)[0])
+            else:
+                self._partial = bytes(data[i:])
+        self.offset += n
+        return stamps
+
+
+class ReceiverStats:
+    """
+    Per-interval goodput, arrival timing and one-way delay at the receiver.
+
+    The delay of a stamp is its arrival time minus the time the client
+    wrote it into the stream, so it includes the sender's stream buffer.
+    Sender and receiver must share a clock (true for mm-link on one host).
+    """
+
+    def __init__(self, interval: float = 0.1, clock=time.time):
+        self.interval = interval
+        self.clock = clock
+        self.total_bytes = 0
+        self._reset(clock())
+
+    def _reset(self, now: float) -> None:
+        self.start_time = now
+        self.bytes = 0
+        self.arrivals = 0
+        self.max_gap = 0.0
+        self._last_arrival = None
+        self._delay_sum = 0.0
+        self._delay_count = 0
+        self._delay_min = 0.0
+        self._delay_max = 0.0
+
+    def on_data(self, now: float, size: int, stamps: list) -> None:
+        self.bytes += size
+        self.total_bytes += size
+        self.arrivals += 1
+        if self._last_arrival is not None and now - self._last_arrival > self.max_gap:
+            self.max_gap = now - self._last_arrival
+        self._last_arrival = now
+        for stamp in stamps:
+            delay = now - stamp
+            if not 0 <= delay < MAX_DELAY:
+                continue
+            if self._delay_count == 0 or delay < self._delay_min:
+                self._delay_min = delay
+            if delay > self._delay_max:
+                self._delay_max = delay
+            self._delay_sum += delay
+            self._delay_count += 1
+
+    def flush(self, now: Optional[float] = None) -> tuple:
+        """Close the current interval and return its record."""
+        now = self.clock() if now is None else now
+        count = self._delay_count
+        record = (
+            self.start_time,
+            now - self.start_time,
+            self.bytes,
+            self.arrivals,
+            self.max_gap,
+            self._delay_sum / count if count else 0.0,
+            self._delay_min,
+            self._delay_max,
+            count,
+        )
+        self._reset(now)
+        return record
+
+
+class MetricsFile:
+    """Fixed-size records behind an 8-byte magic, see :func:`read_metrics`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(METRICS_MAGIC)
+
+    def write(self, record: tuple) -> None:
+        self._file.write(_RECORD.pack(*record))
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class DatagramChannel:
+    """
+    Send every record as one unix datagram to ``path``. Records are dropped
+    while nobody listens, the receiver never blocks on the environment.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+
+    def write(self, record: tuple) -> None:
+        try:
+            self._sock.sendto(_RECORD.pack(*record), self.path)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+class ReceiverMetricsListener:
+    """Environment side of :class:`DatagramChannel`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(path)
+        self._sock.setblocking(False)
+
+    def drain(self) -> np.ndarray:
+        """Records received since the previous call."""
+        records = []
+        while True:
+            try:
+                records.append(self._sock.recv(_RECORD.size))
+            except BlockingIOError:
+                break
+        return np.frombuffer(b"".join(records), dtype=RECORD_DTYPE)
+
+    def close(self) -> None:
+        self._sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def read_metrics(path: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        if f.read(len(METRICS_MAGIC)) != METRICS_MAGIC:
+            raise ValueError(f"Not a receiver metrics file: {path}")
+        return np.fromfile(f, dtype=RECORD_DTYPE)
+
+
+def summarize(records: np.ndarray) -> dict:
+    """Goodput (Mbps) and delay (s) over a set of interval records."""
+    duration = float(records["duration"].sum())
+    samples = records["delay_samples"]
+    n_samples = int(samples.sum())
+    has_delay = samples > 0
+    return {
+        "goodput_mbps": (
+            float(records["bytes"].sum()) * 8 / duration / 1e6 if duration else 0.0
+        ),
+        "delay_mean": (
+            float((records["delay_mean"] * samples).sum()) / n_samples
+            if n_samples
+            else 0.0
+        ),
+        "delay_max": float(records["delay_max"][has_delay].max(initial=0.0)),
+        "max_gap": float(records["max_gap"].max(initial=0.0)),
+    }
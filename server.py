@@ -1,28 +1,55 @@
-import sys
+import argparse
 import asyncio
+import functools
+import os
 import time
 from aioquic.asyncio import QuicConnectionProtocol, serve
 from aioquic.quic.configuration import QuicConfiguration
 from aioquic.quic.events import HandshakeCompleted, StreamDataReceived
+from receiver_stats import (
+    DatagramChannel,
+    MetricsFile,
+    ReceiverStats,
+    StampReader,
+)
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CERTIFICATE = os.path.join(_REPO_DIR, "cert.pem")
+DEFAULT_PRIVATE_KEY = os.path.join(_REPO_DIR, "key.pem")
 
 
 class EchoServerProtocol(QuicConnectionProtocol):
-    def __init__(self, *args, **kwargs):
+    """
+    Receiver of client.py's traffic. By default it is a sink: payloads are
+    only counted and their send-time stamps read into ``stats``, never
+    decoded. With ``verbose`` every chunk is decoded and printed.
+    """
+
+    def __init__(self, *args, stats: ReceiverStats = None, verbose=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.total_bytes_received = 0
         self.last_time = time.time()
         self.last_bytes_received = 0
-
-        # # 启动传输速率统计任务
-        # asyncio.create_task(self.print_transfer_rate())
+        self.stats = stats
+        self.verbose = verbose
+        self._stamp_readers = {}
 
     def quic_event_received(self, event):
         if isinstance(event, HandshakeCompleted):
             print("Handshake completed!")
 
         elif isinstance(event, StreamDataReceived):
-            self.total_bytes_received += len(event.data)
-            print(f"Server received: {event.data.decode()}")
+            data = event.data
+            self.total_bytes_received += len(data)
+            if self.stats is not None:
+                reader = self._stamp_readers.get(event.stream_id)
+                if reader is None:
+                    reader = self._stamp_readers[event.stream_id] = StampReader()
+                self.stats.on_data(time.time(), len(data), reader.feed(data))
+                if event.end_stream:
+                    del self._stamp_readers[event.stream_id]
+            if self.verbose:
+                print(f"Server received: {data.decode(errors='replace')}")
 
     async def print_transfer_rate(self):
         while True:
@@ -38,22 +65,78 @@ class EchoServerProtocol(QuicConnectionProtocol):
                 self.last_bytes_received = self.total_bytes_received
 
 
-async def main():
-    # 解析命令行参数，支持指定端口
-    if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} <port>")
-        return
-    port = int(sys.argv[1])
+async def report_stats(stats: ReceiverStats, sinks: list, print_rate: bool):
+    """Close an interval of ``stats`` every ``stats.interval`` seconds."""
+    while True:
+        await asyncio.sleep(stats.interval)
+        record = stats.flush()
+        for sink in sinks:
+            sink.write(record)
+        if print_rate:
+            _, duration, size = record[:3]
+            print(f"Current transfer rate: {size * 8 / duration / 1e6} Mbps")
 
+
+def load_configuration(
+    certificate: str = DEFAULT_CERTIFICATE, private_key: str = DEFAULT_PRIVATE_KEY
+) -> QuicConfiguration:
+    """Server-side QUIC configuration with the TLS certificate loaded."""
     configuration = QuicConfiguration(is_client=False)
-    configuration.load_cert_chain(certfile="/home/baihe/code/pyquic/cert.pem", keyfile="/home/baihe/code/pyquic/key.pem")
+    configuration.load_cert_chain(certfile=certificate, keyfile=private_key)
     configuration.congestion_control_algorithm = "cubic"
+    return configuration
+
+
+async def main(configuration: QuicConfiguration = None):
+    """
+    Run the server from the command line. ``configuration`` replaces the
+    one loaded from ``--certificate``/``--private-key``, so a
+    :mod:`zygote` can hand over a preloaded one.
+    """
+    # 解析命令行参数，支持指定端口
+    parser = argparse.ArgumentParser()
+    parser.add_argument("port", type=int)
+    parser.add_argument(
+        "--verbose", action="store_true", help="decode and print every chunk"
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=0.1,
+        help="seconds per goodput/delay record",
+    )
+    parser.add_argument("--metrics-file", help="write interval records to this file")
+    parser.add_argument(
+        "--metrics-socket", help="send interval records to this unix datagram socket"
+    )
+    parser.add_argument(
+        "--print-rate", action="store_true", help="print goodput every interval"
+    )
+    parser.add_argument("--certificate", default=DEFAULT_CERTIFICATE)
+    parser.add_argument("--private-key", default=DEFAULT_PRIVATE_KEY)
+    args = parser.parse_args()
+    port = args.port
+
+    sinks = []
+    if args.metrics_file:
+        sinks.append(MetricsFile(args.metrics_file))
+    if args.metrics_socket:
+        sinks.append(DatagramChannel(args.metrics_socket))
+    stats = None
+    if sinks or args.print_rate:
+        stats = ReceiverStats(args.stats_interval)
+        asyncio.ensure_future(report_stats(stats, sinks, args.print_rate))
+
+    if configuration is None:
+        configuration = load_configuration(args.certificate, args.private_key)
 
     server = await serve(
         "0.0.0.0",
         port,
         configuration=configuration,
-        create_protocol=EchoServerProtocol,
+        create_protocol=functools.partial(
+            EchoServerProtocol, stats=stats, verbose=args.verbose
+        ),
     )
 
     try:
@@ -62,7 +145,8 @@ async def main():
         pass
     finally:
         server.close()
-        await server.wait_closed()
+        for sink in sinks:
+            sink.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,493 @@
+import asyncio
+import hashlib
+import os
+import select
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Optional
+
+from drl_comunication import KIND_ACTION, KIND_OBSERVATION, TAG_KEYS
+
+TRANSPORTS = ("socket", "shm")
+KIND_RESET = 3
+
+_MAGIC = b"MCSHM001"
+# 控制块：magic、控制器进程号、两端是否在等待唤醒
+_CONTROL = struct.Struct("<8sIII")
+_ENV_WAITING = 12
+_CONTROLLER_WAITING = 16
+_CONTROL_FIELD = struct.Struct("<I")
+# 槽位：序号(seqlock) + 类型 + 流编号 + 序号标签 + float64 个数
+_SEQ = struct.Struct("<Q")
+_SLOT_HEAD = struct.Struct("<QBxxxIII")
+MAX_VALUES = 64
+_SLOT_SIZE = 576
+_OBSERVATION_SLOT = 64
+_ACTION_SLOT = _OBSERVATION_SLOT + _SLOT_SIZE
+SEGMENT_SIZE = _ACTION_SLOT + _SLOT_SIZE
+_float_structs = {}
+# 本进程创建的共享内存，挂载时不必从 resource_tracker 注销
+_created = set()
+
+
+def _floats(count: int) -> struct.Struct:
+    layout = _float_structs.get(count)
+    if layout is None:
+        layout = _float_structs[count] = struct.Struct(f"<{count}d")
+    return layout
+
+
+def segment_name(path: str) -> str:
+    """Shared memory name of the channel that replaces socket ``path``."""
+    return "metacon_" + hashlib.sha1(path.encode()).hexdigest()[:16]
+
+
+def default_spin_us() -> float:
+    # 单核机器上自旋只会占用对端需要的 CPU
+    return 50.0 if len(os.sched_getaffinity(0)) > 1 else 0.0
+
+
+def _open_fifo(path: str) -> int:
+    # O_RDWR 打开 FIFO 不会阻塞，也不会因为对端关闭而读到 EOF
+    return os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+
+def _drain_fifo(fd: int) -> None:
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+class _Endpoint:
+    """One side of the channel: writes one slot, reads the other."""
+
+    def __init__(
+        self,
+        shm: shared_memory.SharedMemory,
+        write_slot: int,
+        read_slot: int,
+        my_waiting: int,
+        peer_waiting: int,
+        wait_fd: int,
+        notify_fd: int,
+        spin_us: float,
+    ):
+        self._shm = shm
+        self._buf = shm.buf
+        self._write_slot = write_slot
+        self._read_slot = read_slot
+        self._my_waiting = my_waiting
+        self._peer_waiting = peer_waiting
+        self._wait_fd = wait_fd
+        self._notify_fd = notify_fd
+        self._spin = spin_us / 1e6
+        self._write_seq = _SEQ.unpack_from(self._buf, write_slot)[0]
+        self._read_seq = _SEQ.unpack_from(self._buf, read_slot)[0]
+
+    def write(self, kind: int, values, flow: int = 0, tag: int = 0) -> None:
+        buf = self._buf
+        slot = self._write_slot
+        count = len(values)
+        if count > MAX_VALUES:
+            raise ValueError(f"At most {MAX_VALUES} values per message")
+        seq = self._write_seq
+        # seqlock：写入期间序号为奇数（和槽头一起写入）
+        _SLOT_HEAD.pack_into(buf, slot, seq + 1, kind, flow, tag, count)
+        _floats(count).pack_into(buf, slot + _SLOT_HEAD.size, *values)
+        self._write_seq = seq + 2
+        _SEQ.pack_into(buf, slot, seq + 2)
+        # 只有对端在睡眠时才需要系统调用去唤醒它
+        if _CONTROL_FIELD.unpack_from(buf, self._peer_waiting)[0]:
+            try:
+                os.write(self._notify_fd, b"\0")
+            except BlockingIOError:
+                pass
+
+    def try_read(self):
+        """Return ``(kind, flow, tag, values)`` of a new message, or None."""
+        buf = self._buf
+        slot = self._read_slot
+        seq = _SEQ.unpack_from(buf, slot)[0]
+        if seq == self._read_seq or seq & 1:
+            return None
+        _, kind, flow, tag, count = _SLOT_HEAD.unpack_from(buf, slot)
+        values = _floats(count).unpack_from(buf, slot + _SLOT_HEAD.size)
+        if _SEQ.unpack_from(buf, slot)[0] != seq:
+            # 读的同时被改写了，下次重读
+            return None
+        self._read_seq = seq
+        return kind, flow, tag, values
+
+    def read(self, timeout: Optional[float] = None):
+        """Wait for a new message: spin first, then sleep on the FIFO."""
+        message = self.try_read()
+        if message is not None:
+            return message
+        now = time.perf_counter()
+        spin_end = now + self._spin
+        while now < spin_end:
+            message = self.try_read()
+            if message is not None:
+                return message
+            now = time.perf_counter()
+        deadline = None if timeout is None else now + timeout
+        buf = self._buf
+        _CONTROL_FIELD.pack_into(buf, self._my_waiting, 1)
+        try:
+            while True:
+                message = self.try_read()
+                if message is not None:
+                    return message
+                wait = 0.01
+                if deadline is not None:
+                    wait = min(wait, deadline - time.perf_counter())
+                    if wait <= 0:
+                        return None
+                # 带超时等待，错过唤醒时也能继续
+                if select.select([self._wait_fd], [], [], wait)[0]:
+                    _drain_fifo(self._wait_fd)
+        finally:
+            _CONTROL_FIELD.pack_into(buf, self._my_waiting, 0)
+
+    def set_waiting(self, waiting: bool) -> None:
+        _CONTROL_FIELD.pack_into(self._buf, self._my_waiting, int(waiting))
+
+    def release(self) -> None:
+        self._buf = None
+
+
+def _encode(msg: dict):
+    flow = int(msg.get("flow", 0))
+    tag = int(msg.get("seq", 0))
+    if msg.get("reset"):
+        return KIND_RESET, (), flow, tag
+    if "observation" in msg:
+        return KIND_OBSERVATION, [*msg["observation"], msg["window"]], flow, tag
+    if "action" in msg:
+        if "pacing" in msg:
+            return KIND_ACTION, (msg["action"], msg["pacing"]), flow, tag
+        return KIND_ACTION, (msg["action"],), flow, tag
+    raise ValueError(f"Unsupported message on the shm transport: {msg}")
+
+
+def _decode(message) -> dict:
+    kind, flow, tag, values = message
+    if kind == KIND_OBSERVATION:
+        return {
+            "observation": list(values[:-1]),
+            "window": values[-1],
+            "flow": flow,
+            "seq": tag,
+        }
+    if kind == KIND_ACTION:
+        msg = {"action": values[0], "flow": flow, "seq": tag}
+        if len(values) > 1:
+            msg["pacing"] = values[1]
+        return msg
+    if kind == KIND_RESET:
+        return {"reset": True, "flow": flow, "seq": tag}
+    raise ValueError(f"Unknown message kind: {kind}")
+
+
+class ShmDrlServer:
+    """
+    Environment side of the shared-memory transport, a drop-in replacement
+    for :class:`~drl_comunication.DrlComunicationServer`.
+
+    Observations and actions live in two seqlock-protected slots of a
+    ``multiprocessing.shared_memory`` segment named after
+    ``unix_socket_path``. A waiting reader spins for ``spin_us``
+    microseconds (none on a single CPU), then sleeps on a FIFO next to the
+    socket path. The
+    writer only touches the FIFO while the peer sleeps, so a round trip
+    with a spinning peer makes no system calls.
+    """
+
+    def __init__(
+        self,
+        unix_socket_path: str,
+        verbose: bool = False,
+        spin_us: Optional[float] = None,
+    ):
+        self.unix_socket_path = unix_socket_path
+        self.verbose = verbose
+        self.spin_us = default_spin_us() if spin_us is None else spin_us
+        self._shm = None
+        self._endpoint = None
+        self._fds = []
+        self._tags = {}
+
+    def _fifo_paths(self):
+        return (
+            f"{self.unix_socket_path}.obs.fifo",
+            f"{self.unix_socket_path}.act.fifo",
+        )
+
+    def start_server(self):
+        if self._shm is not None:
+            return
+        self._cleanup_files()
+        for path in self._fifo_paths():
+            os.mkfifo(path)
+        self._shm = shared_memory.SharedMemory(
+            name=segment_name(self.unix_socket_path), create=True, size=SEGMENT_SIZE
+        )
+        _created.add(self._shm.name)
+        self._shm.buf[:SEGMENT_SIZE] = bytes(SEGMENT_SIZE)
+        _CONTROL.pack_into(self._shm.buf, 0, _MAGIC, 0, 0, 0)
+        observation_fifo, action_fifo = (_open_fifo(p) for p in self._fifo_paths())
+        self._fds = [observation_fifo, action_fifo]
+        self._endpoint = _Endpoint(
+            self._shm,
+            write_slot=_ACTION_SLOT,
+            read_slot=_OBSERVATION_SLOT,
+            my_waiting=_ENV_WAITING,
+            peer_waiting=_CONTROLLER_WAITING,
+            wait_fd=observation_fifo,
+            notify_fd=action_fifo,
+            spin_us=self.spin_us,
+        )
+
+    def is_connected(self) -> bool:
+        if self._shm is None:
+            return False
+        pid = _CONTROL.unpack_from(self._shm.buf, 0)[1]
+        if pid == 0:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def receive(self) -> dict:
+        msg = _decode(self._endpoint.read())
+        self._tags = {key: msg[key] for key in TAG_KEYS}
+        if self.verbose:
+            print(f"Server received: {msg}")
+        return msg
+
+    def send(self, msg: dict):
+        # 和 socket 服务端一样回显流编号和序号
+        self._endpoint.write(*_encode({**self._tags, **msg}))
+
+    def _cleanup_files(self):
+        for path in self._fifo_paths():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        try:
+            stale = shared_memory.SharedMemory(name=segment_name(self.unix_socket_path))
+        except FileNotFoundError:
+            return
+        stale.close()
+        stale.unlink()
+
+    def stop_server(self):
+        if self._shm is None:
+            return
+        self._endpoint.release()
+        self._endpoint = None
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._shm.close()
+        self._shm.unlink()
+        _created.discard(self._shm.name)
+        self._shm = None
+        for path in self._fifo_paths():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    # 只是挂载，不能让本进程的 resource_tracker 在退出时删除共享内存
+    if shm.name not in _created:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class ShmDrlClient:
+    """
+    Controller side of the shared-memory transport, with the API of
+    :class:`~drl_comunication.DrlComunicationClient`.
+    """
+
+    def __init__(self, unix_socket_path: str, spin_us: Optional[float] = None):
+        self.unix_socket_path = unix_socket_path
+        self.spin_us = default_spin_us() if spin_us is None else spin_us
+        self._shm = None
+        self._endpoint = None
+        self._fds = []
+
+    def is_connected(self):
+        return self._shm is not None
+
+    def _connect(self):
+        shm = _attach(segment_name(self.unix_socket_path))
+        magic, _, _, _ = _CONTROL.unpack_from(shm.buf, 0)
+        if magic != _MAGIC:
+            shm.close()
+            raise ConnectionError(f"No shm channel at {self.unix_socket_path}")
+        observation_fifo = _open_fifo(f"{self.unix_socket_path}.obs.fifo")
+        action_fifo = _open_fifo(f"{self.unix_socket_path}.act.fifo")
+        self._fds = [observation_fifo, action_fifo]
+        self._shm = shm
+        _CONTROL_FIELD.pack_into(shm.buf, 8, os.getpid())
+        self._endpoint = _Endpoint(
+            shm,
+            write_slot=_OBSERVATION_SLOT,
+            read_slot=_ACTION_SLOT,
+            my_waiting=_CONTROLLER_WAITING,
+            peer_waiting=_ENV_WAITING,
+            wait_fd=action_fifo,
+            notify_fd=observation_fifo,
+            spin_us=self.spin_us,
+        )
+
+    def connect(self):
+        self._connect()
+
+    def send(self, msg):
+        self._endpoint.write(*_encode(msg))
+
+    def receive(self):
+        return _decode(self._endpoint.read())
+
+    def close(self):
+        if self._shm is None:
+            return
+        _CONTROL_FIELD.pack_into(self._shm.buf, 8, 0)
+        self._endpoint.release()
+        self._endpoint = None
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._shm.close()
+        self._shm = None
+
+
+class AsyncShmDrlClient(ShmDrlClient):
+    """
+    Event-loop version with the API of
+    :class:`~drl_comunication.AsyncDrlComunicationClient`: the action FIFO
+    is watched by the loop and every new action goes to ``on_message``.
+    """
+
+    def __init__(
+        self,
+        unix_socket_path: str,
+        on_message: Callable[[dict], None],
+        spin_us: float = 0.0,
+    ):
+        super().__init__(unix_socket_path, spin_us=spin_us)
+        self.on_message = on_message
+        self._loop = None
+
+    async def connect(self):
+        self._connect()
+        self._loop = asyncio.get_running_loop()
+        # 事件循环不会自旋，始终请求唤醒
+        self._endpoint.set_waiting(True)
+        self._loop.add_reader(self._fds[1], self._on_readable)
+
+    def send_nowait(self, msg: dict):
+        self.send(msg)
+
+    def _on_readable(self):
+        _drain_fifo(self._fds[1])
+        message = self._endpoint.try_read()
+        if message is not None:
+            self.on_message(_decode(message))
+
+    def close(self):
+        if self._loop is not None and self._fds:
+            self._loop.remove_reader(self._fds[1])
+        self._loop = None
+        super().close()
+
+
+def _echo_controller(
+    unix_socket_path: str, n_messages: int, spin_us: Optional[float] = None
+) -> None:
+    client = ShmDrlClient(unix_socket_path, spin_us=spin_us)
+    client.connect()
+    observation = [12345678.0, 23456789.0, 0.061, 0.06, 0, 0.0605, 120000.0]
+    for _ in range(n_messages):
+        client.send({"observation": observation, "window": 120000.0})
+        client.receive()
+    client.close()
+
+
+def benchmark_shm_round_trip(
+    n_messages: int = 10000, spin_us: Optional[float] = None
+) -> dict:
+    """
+    Round trips between this process (environment side) and a controller
+    process over the shared-memory transport. Latency is measured from one
+    observation to the next, i.e. including the controller's turn.
+    """
+    import subprocess
+    import sys
+
+    unix_socket_path = f"/tmp/drl_comunication_shm_bench.{os.getpid()}"
+    server = ShmDrlServer(unix_socket_path, spin_us=spin_us)
+    server.start_server()
+    # 独立的进程（和 mm-shell 里的客户端一样），不共享 resource_tracker
+    controller = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys, shm_channel; "
+            "shm_channel._echo_controller("
+            "sys.argv[1], int(sys.argv[2]), float(sys.argv[3]))",
+            unix_socket_path,
+            str(n_messages + 1),
+            str(server.spin_us),
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    server.receive()
+    latencies = []
+    begin = time.perf_counter()
+    for _ in range(n_messages):
+        start = time.perf_counter()
+        server.send({"action": 0.1})
+        server.receive()
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - begin
+    server.send({"action": 0.1})
+    controller.wait()
+    server.stop_server()
+    latencies.sort()
+    return {
+        "transport": "shm",
+        "messages": n_messages,
+        "spin_us": server.spin_us,
+        "p50_us": latencies[len(latencies) // 2] * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "round_trips_per_sec": n_messages / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    # python shm_channel.py [n_messages]
+    import sys
+
+    n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for spin_us in sorted({default_spin_us(), 0.0}):
+        result = benchmark_shm_round_trip(n_messages, spin_us)
+        print(
+            f"shm spin {spin_us:.0f} us: p50 {result['p50_us']:.1f} us, "
+            f"p99 {result['p99_us']:.1f} us, "
+            f"{result['round_trips_per_sec']:.0f} round trips/s"
+        )
@@ -0,0 +1,389 @@
+import copy
+import json
+import os
+import threading
+from queue import Queue
+from typing import Optional
+
+import numpy as np
+
+from embedded_policy import (
+    NumpyGaussianMLPPolicy,
+    nonlinearity_name,
+    normalization_kwargs,
+    policy_from_state_dict,
+)
+from transition_store import write_json
+
+INDEX_FILE = "snapshots.json"
+INDEX_VERSION = 1
+# garage 记录的每轮平均回报（MAML 的 log_multitask_performance）
+DEFAULT_RETURN_KEY = "Average/AverageReturn"
+# MAML 及其内层算法上可能存在的优化器
+_OPTIMIZER_ATTRS = ("_meta_optimizer", "_policy_optimizer", "_vf_optimizer")
+
+
+def _numpy_state(module) -> dict:
+    """Detached copy of ``module.state_dict()`` as NumPy arrays."""
+    return {
+        key: value.detach().cpu().numpy().copy()
+        for key, value in module.state_dict().items()
+    }
+
+
+def _optimizers(algo) -> dict:
+    found = {}
+    owners = [("", algo)]
+    inner = getattr(algo, "_inner_algo", None)
+    if inner is not None:
+        owners.append(("inner", inner))
+    for prefix, owner in owners:
+        for attr in _OPTIMIZER_ATTRS:
+            optimizer = getattr(owner, attr, None)
+            # garage 的 OptimizerWrapper 把 torch 优化器放在 _optimizer
+            optimizer = getattr(optimizer, "_optimizer", optimizer)
+            if hasattr(optimizer, "state_dict"):
+                name = attr.lstrip("_")
+                found[f"{prefix}.{name}" if prefix else name] = optimizer
+    return found
+
+
+def _value_function(algo):
+    value_function = getattr(algo, "_value_function", None)
+    if value_function is None:
+        inner = getattr(algo, "_inner_algo", None)
+        value_function = getattr(inner, "_value_function", None)
+    return value_function
+
+
+def _policy_meta(policy, env) -> dict:
+    module = policy._module
+    meta = {
+        "hidden_nonlinearity": nonlinearity_name(module._hidden_nonlinearity),
+        "output_nonlinearity": nonlinearity_name(module._output_nonlinearity),
+    }
+    meta.update(
+        {
+            key: value.tolist() if isinstance(value, np.ndarray) else value
+            for key, value in normalization_kwargs(env).items()
+        }
+    )
+    return meta
+
+
+class AsyncSnapshotter:
+    """
+    Drop-in for garage's ``Snapshotter`` that keeps the training loop
+    from blocking on snapshots.
+
+    At each epoch only the policy and value function ``state_dict``\\ s
+    are copied (detached NumPy arrays, a few hundred KB) on the training
+    thread; a background thread writes them to ``itr_<N>.npz`` and keeps
+    ``snapshots.json`` up to date. The algorithm, env and sampler are not
+    pickled.
+
+    Retention: a snapshot is kept if it is one of the ``keep_last`` most
+    recent, if its epoch is a multiple of ``keep_every``, or if its return
+    (``return_key`` of dowel's tabular, recorded before the trainer saves)
+    is among the ``keep_best`` highest. With all three unset every
+    snapshot is kept.
+
+    Optimizer state is only needed to resume training, so it is copied
+    every ``optimizer_every`` epochs and when the snapshotter is closed
+    (``optimizer_every=0`` never stores it), and only the latest copy is
+    kept (``optimizer_itr_<N>.pt``), next to a retained snapshot of the same
+    epoch. :func:`restore_algo` loads it back.
+
+    If the writer falls more than ``max_pending`` snapshots behind,
+    :meth:`save_itr_params` waits for it.
+    """
+
+    def __init__(
+        self,
+        snapshot_dir: str,
+        keep_last: Optional[int] = None,
+        keep_every: Optional[int] = None,
+        keep_best: Optional[int] = None,
+        optimizer_every: Optional[int] = None,
+        return_key: str = DEFAULT_RETURN_KEY,
+        max_pending: int = 2,
+    ):
+        self._snapshot_dir = snapshot_dir
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.keep_best = keep_best
+        self.optimizer_every = optimizer_every
+        self.return_key = return_key
+        os.makedirs(snapshot_dir, exist_ok=True)
+        index_path = os.path.join(snapshot_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+            if self.index.get("version") != INDEX_VERSION:
+                raise ValueError(f"Unsupported snapshot index: {index_path}")
+        else:
+            self.index = {"version": INDEX_VERSION, "snapshots": []}
+        self._queue = Queue(max_pending)
+        self._last = None
+        self._error = None
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    # garage 的 Trainer 会读取这些属性
+    @property
+    def snapshot_dir(self) -> str:
+        return self._snapshot_dir
+
+    @property
+    def snapshot_mode(self) -> str:
+        return "async"
+
+    @property
+    def snapshot_gap(self) -> int:
+        return 1
+
+    def _epoch_return(self) -> Optional[float]:
+        from dowel import tabular
+
+        value = tabular.as_dict.get(self.return_key)
+        if value is None or not np.isfinite(value):
+            return None
+        return float(value)
+
+    def _optimizer_state(self, algo) -> dict:
+        return {
+            name: copy.deepcopy(optimizer.state_dict())
+            for name, optimizer in _optimizers(algo).items()
+        }
+
+    def save_itr_params(self, itr: int, params: dict) -> None:
+        """Queue a snapshot of the ``Trainer.save`` ``params`` of epoch ``itr``."""
+        if self._error is not None:
+            raise RuntimeError("Snapshot writer failed") from self._error
+        algo = params["algo"]
+        env = params.get("env")
+        value_function = _value_function(algo)
+        job = {
+            "itr": itr,
+            "return": self._epoch_return(),
+            "policy": _numpy_state(algo.policy),
+            "value_function": (
+                None if value_function is None else _numpy_state(value_function)
+            ),
+            "meta": _policy_meta(algo.policy, env),
+            "optimizers": None,
+        }
+        if self.optimizer_every and itr % self.optimizer_every == 0:
+            job["optimizers"] = self._optimizer_state(algo)
+        # close() 时补存最后一轮的优化器状态
+        self._last = (itr, algo)
+        self._queue.put(job)
+
+    def _write_loop(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            if "done" in job:
+                job["done"].set()
+                continue
+            try:
+                self._write(job)
+            except Exception as e:  # pylint: disable=broad-except
+                self._error = e
+
+    def _write(self, job: dict) -> None:
+        itr = job["itr"]
+        if job["policy"] is not None:
+            arrays = {f"policy/{k}": v for k, v in job["policy"].items()}
+            if job["value_function"] is not None:
+                arrays.update(
+                    {f"value_function/{k}": v for k, v in job["value_function"].items()}
+                )
+            meta = {"itr": itr, "return": job["return"], **job["meta"]}
+            arrays["meta"] = np.array(json.dumps(meta))
+            file_name = f"itr_{itr}.npz"
+            tmp = os.path.join(self._snapshot_dir, f"{file_name}.tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, os.path.join(self._snapshot_dir, file_name))
+            snapshots = [s for s in self.index["snapshots"] if s["itr"] != itr]
+            snapshots.append(
+                {
+                    "itr": itr,
+                    "file": file_name,
+                    "return": job["return"],
+                    "optimizer": None,
+                }
+            )
+            self.index["snapshots"] = sorted(snapshots, key=lambda s: s["itr"])
+        if job["optimizers"] is not None:
+            self._write_optimizers(itr, job["optimizers"])
+        self._apply_retention()
+        write_json(os.path.join(self._snapshot_dir, INDEX_FILE), self.index)
+
+    def _write_optimizers(self, itr: int, state: dict) -> None:
+        if not any(s["itr"] == itr for s in self.index["snapshots"]):
+            # 这一轮的快照已被保留策略删除，没有参数可配，留着之前那份
+            return
+        import torch
+
+        file_name = f"optimizer_itr_{itr}.pt"
+        tmp = os.path.join(self._snapshot_dir, f"{file_name}.tmp")
+        torch.save(state, tmp)
+        os.replace(tmp, os.path.join(self._snapshot_dir, file_name))
+        # 只保留最新的优化器状态，旧文件由 _apply_retention 清理
+        for snapshot in self.index["snapshots"]:
+            snapshot["optimizer"] = file_name if snapshot["itr"] == itr else None
+
+    def _remove(self, file_name: str) -> None:
+        try:
+            os.unlink(os.path.join(self._snapshot_dir, file_name))
+        except FileNotFoundError:
+            pass
+
+    def retained(self, snapshots) -> set:
+        """Epochs of ``snapshots`` (index entries) kept by the retention policy."""
+        itrs = [s["itr"] for s in snapshots]
+        if not (self.keep_last or self.keep_every or self.keep_best):
+            return set(itrs)
+        keep = set()
+        if self.keep_last:
+            keep.update(sorted(itrs)[-self.keep_last :])
+        if self.keep_every:
+            keep.update(itr for itr in itrs if itr % self.keep_every == 0)
+        if self.keep_best:
+            scored = [s for s in snapshots if s["return"] is not None]
+            scored.sort(key=lambda s: s["return"], reverse=True)
+            keep.update(s["itr"] for s in scored[: self.keep_best])
+        # 恢复训练需要带优化器状态的那份
+        keep.update(s["itr"] for s in snapshots if s.get("optimizer"))
+        return keep
+
+    def _apply_retention(self) -> None:
+        snapshots = self.index["snapshots"]
+        keep = self.retained(snapshots)
+        for snapshot in snapshots:
+            if snapshot["itr"] not in keep:
+                self._remove(snapshot["file"])
+        self.index["snapshots"] = [s for s in snapshots if s["itr"] in keep]
+        # 没有被索引引用的优化器文件（被替换的、或中断时留下的）一并删除
+        referenced = {s["optimizer"] for s in self.index["snapshots"]}
+        for file_name in os.listdir(self._snapshot_dir):
+            if (
+                file_name.startswith("optimizer_itr_")
+                and file_name.endswith(".pt")
+                and file_name not in referenced
+            ):
+                self._remove(file_name)
+
+    def flush(self) -> None:
+        """Wait until every queued snapshot is on disk."""
+        done = threading.Event()
+        # 队列按顺序处理，哨兵之前的快照都已写完
+        self._queue.put({"done": done})
+        done.wait()
+
+    def close(self) -> None:
+        """Write the pending snapshots and the final optimizer state."""
+        if self._thread is None:
+            return
+        if self._last is not None and self.optimizer_every != 0:
+            itr, algo = self._last
+            self._queue.put(
+                {
+                    "itr": itr,
+                    "policy": None,
+                    "optimizers": self._optimizer_state(algo),
+                }
+            )
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise RuntimeError("Snapshot writer failed") from self._error
+
+
+def is_snapshot_dir(path: str) -> bool:
+    return os.path.exists(os.path.join(path, INDEX_FILE))
+
+
+def _select(snapshots, itr) -> dict:
+    if not snapshots:
+        raise FileNotFoundError("No snapshot has been written")
+    if itr == "last":
+        return snapshots[-1]
+    if itr == "first":
+        return snapshots[0]
+    if itr == "best":
+        scored = [s for s in snapshots if s["return"] is not None]
+        if not scored:
+            raise ValueError("No snapshot has a recorded return")
+        return max(scored, key=lambda s: s["return"])
+    for snapshot in snapshots:
+        if snapshot["itr"] == int(itr):
+            return snapshot
+    raise FileNotFoundError(f"No snapshot for epoch {itr} (not retained?)")
+
+
+def load_snapshot(snapshot_dir: str, itr="last") -> dict:
+    """
+    Snapshot ``itr`` (an epoch, ``"first"``, ``"last"`` or ``"best"``) of an
+    :class:`AsyncSnapshotter` directory: ``policy`` and ``value_function``
+    state dicts of NumPy arrays, ``meta`` and, when stored with it,
+    ``optimizers``.
+    """
+    with open(os.path.join(snapshot_dir, INDEX_FILE)) as f:
+        index = json.load(f)
+    entry = _select(index["snapshots"], itr)
+    result = {"policy": {}, "value_function": {}}
+    with np.load(os.path.join(snapshot_dir, entry["file"])) as data:
+        for key in data.files:
+            if key == "meta":
+                result["meta"] = json.loads(str(data[key]))
+            else:
+                group, name = key.split("/", 1)
+                result[group][name] = data[key]
+    if entry.get("optimizer"):
+        import torch
+
+        result["optimizers"] = torch.load(
+            os.path.join(snapshot_dir, entry["optimizer"])
+        )
+    return result
+
+
+def load_policy(snapshot_dir: str, itr="last") -> NumpyGaussianMLPPolicy:
+    """NumPy policy of an :class:`AsyncSnapshotter` snapshot."""
+    saved = load_snapshot(snapshot_dir, itr)
+    meta = dict(saved["meta"])
+    meta.pop("itr")
+    meta.pop("return")
+    for key in ("obs_mean", "obs_var", "action_low", "action_high"):
+        if key in meta:
+            meta[key] = np.array(meta[key])
+    return policy_from_state_dict(saved["policy"], **meta)
+
+
+def restore_algo(algo, snapshot_dir: str, itr="last") -> dict:
+    """
+    Load a snapshot into a freshly built algorithm (e.g. the ``MAMLPPO`` of
+    ``train.py``), optimizer state included when the snapshot has it.
+    Returns the snapshot.
+    """
+    import torch
+
+    saved = load_snapshot(snapshot_dir, itr)
+
+    def tensors(state):
+        return {k: torch.as_tensor(v) for k, v in state.items()}
+
+    algo.policy.load_state_dict(tensors(saved["policy"]))
+    value_function = _value_function(algo)
+    if value_function is not None and saved["value_function"]:
+        value_function.load_state_dict(tensors(saved["value_function"]))
+    optimizers = _optimizers(algo)
+    for name, state in saved.get("optimizers", {}).items():
+        if name in optimizers:
+            optimizers[name].load_state_dict(state)
+    return saved
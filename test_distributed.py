@@ -0,0 +1,107 @@
+import socket
+
+import numpy as np
+import pytest
+
+from distributed import (
+    KIND_PARAMS,
+    KIND_TRAJECTORY,
+    _recv_frame,
+    _send_frame,
+    decode_params,
+    decode_trajectory,
+    encode_params,
+    encode_trajectory,
+    parse_address,
+)
+from embedded_policy import NumpyGaussianMLPPolicy
+
+
+def _trajectory(steps, env_info_keys=("throughput", "delay")):
+    rng = np.random.default_rng(0)
+    step_types = np.ones(steps, dtype=np.uint8)
+    step_types[0], step_types[-1] = 0, 2
+    return {
+        "observations": rng.normal(size=(steps, 7)).astype(np.float32),
+        "last_observation": rng.normal(size=7).astype(np.float32),
+        "actions": rng.normal(size=(steps, 1)).astype(np.float32),
+        "rewards": rng.normal(size=steps).astype(np.float32),
+        "mean": rng.normal(size=(steps, 1)).astype(np.float32),
+        "log_std": np.full(1, -0.5, dtype=np.float32),
+        "env_infos": {
+            key: rng.normal(size=steps).astype(np.float32) for key in env_info_keys
+        },
+        "step_types": step_types,
+    }
+
+
+def _assert_same(decoded, trajectory):
+    assert set(decoded) == set(trajectory)
+    for key, value in trajectory.items():
+        if key == "env_infos":
+            assert set(decoded[key]) == set(value)
+            for name, column in value.items():
+                np.testing.assert_array_equal(decoded[key][name], column)
+        else:
+            np.testing.assert_array_equal(decoded[key], value)
+
+
+@pytest.mark.parametrize("env_info_keys", [("throughput", "delay"), ()])
+def test_trajectory_round_trip(env_info_keys):
+    trajectory = _trajectory(50, env_info_keys)
+    decoded = decode_trajectory(memoryview(encode_trajectory(trajectory)))
+    _assert_same(decoded, trajectory)
+    assert decoded["step_types"].dtype == np.uint8
+
+
+def test_trajectory_is_float32_columns():
+    trajectory = _trajectory(10)
+    body = encode_trajectory(trajectory)
+    names = len("delay\nthroughput")
+    # 观测、最后观测、动作、奖励、均值、log_std、两列 env_info，再加 step_type
+    floats = 10 * 7 + 7 + 10 + 10 + 10 + 1 + 2 * 10
+    assert len(body) == 12 + names + 4 * floats + 10
+
+
+def test_params_round_trip():
+    rng = np.random.default_rng(1)
+    policy = NumpyGaussianMLPPolicy(
+        weights=[rng.normal(size=(32, 7)), rng.normal(size=(1, 32))],
+        biases=[rng.normal(size=32), rng.normal(size=1)],
+        log_std=np.full(1, -0.5),
+        hidden_nonlinearity="relu",
+    )
+    task = {"name": "12mbps.trace-20ms-None", "delay_ms": 20}
+    decoded, decoded_task = decode_params(memoryview(encode_params(policy, task)))
+    assert decoded_task == task
+    assert decoded.hidden_nonlinearity == "relu"
+    assert decoded.output_nonlinearity is None
+    # 参数以 float32 传输
+    for got, expected in zip(decoded.weights, policy.weights):
+        np.testing.assert_allclose(got, expected, rtol=1e-6)
+    np.testing.assert_allclose(decoded.log_std, policy.log_std)
+    observation = rng.normal(size=7)
+    np.testing.assert_allclose(
+        decoded.get_mean_actions(observation),
+        policy.get_mean_actions(observation),
+        rtol=1e-5,
+    )
+
+
+def test_frames_over_socket():
+    body = encode_trajectory(_trajectory(20))
+    a, b = socket.socketpair()
+    with a, b:
+        _send_frame(a, KIND_TRAJECTORY, 3, body)
+        _send_frame(a, KIND_PARAMS, 4)
+        kind, version, payload = _recv_frame(b)
+        assert (kind, version, bytes(payload)) == (KIND_TRAJECTORY, 3, body)
+        kind, version, payload = _recv_frame(b)
+        assert (kind, version, len(payload)) == (KIND_PARAMS, 4, 0)
+        a.close()
+        assert _recv_frame(b) is None
+
+
+def test_parse_address():
+    assert parse_address("10.0.0.2:6000") == ("10.0.0.2", 6000)
+    assert parse_address("learner") == ("learner", 5960)
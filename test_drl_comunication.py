@@ -0,0 +1,92 @@
+import socket
+
+import pytest
+
+from drl_comunication import (
+    MAX_FRAME_SIZE,
+    WIRE_BINARY,
+    WIRE_JSON,
+    decode_message,
+    encode_message,
+    negotiate_wire_format,
+    recv_frame,
+)
+
+OBSERVATION = [12345678.0, 23456789.0, 0.061, 0.06, 0.0, 0.0605, 120000.0]
+
+
+def _round_trip(msg, wire_format):
+    buf = bytearray(MAX_FRAME_SIZE)
+    size = encode_message(msg, wire_format, buf)
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(buf[:size])
+        payload = recv_frame(b, bytearray(MAX_FRAME_SIZE))
+        return decode_message(payload, wire_format)
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_JSON, WIRE_BINARY])
+def test_observation_round_trip(wire_format):
+    msg = {"observation": OBSERVATION, "window": 14400.0, "flow": 3, "seq": 7}
+    decoded = _round_trip(msg, wire_format)
+    assert decoded["observation"] == OBSERVATION
+    assert decoded["window"] == 14400.0
+    assert decoded["flow"] == 3
+    assert decoded["seq"] == 7
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_JSON, WIRE_BINARY])
+def test_action_round_trip(wire_format):
+    assert _round_trip({"action": -0.25}, wire_format)["action"] == -0.25
+    decoded = _round_trip({"action": 0.5, "pacing": 0.125, "seq": 2}, wire_format)
+    assert decoded["action"] == 0.5
+    assert decoded["pacing"] == 0.125
+    assert decoded["seq"] == 2
+
+
+def test_binary_frame_is_fixed_layout():
+    buf = bytearray(MAX_FRAME_SIZE)
+    size = encode_message({"observation": OBSERVATION, "window": 1.0}, WIRE_BINARY, buf)
+    # 长度(4B) + 帧头(11B) + 8 个 float64
+    assert size == 4 + 11 + 8 * 8
+
+
+@pytest.mark.parametrize(
+    "msg",
+    [
+        {"reset": True},
+        {"hello": {"wire_format": WIRE_BINARY}},
+        # 带额外字段的观测值不能用定长格式表示，退回 JSON
+        {"observation": OBSERVATION, "window": 1.0, "extra": "x"},
+        {"observation": OBSERVATION},
+    ],
+)
+def test_binary_falls_back_to_json(msg):
+    buf = bytearray(MAX_FRAME_SIZE)
+    encode_message(msg, WIRE_BINARY, buf)
+    assert buf[4] == 0
+    assert _round_trip(msg, WIRE_BINARY) == msg
+
+
+def test_recv_frame_returns_none_when_closed():
+    a, b = socket.socketpair()
+    with b:
+        a.close()
+        assert recv_frame(b, bytearray(MAX_FRAME_SIZE)) is None
+
+
+def test_recv_frame_rejects_oversized_frame():
+    buf = bytearray(MAX_FRAME_SIZE)
+    size = encode_message({"observation": OBSERVATION, "window": 1.0}, WIRE_JSON, buf)
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(buf[:size])
+        with pytest.raises(ValueError):
+            recv_frame(b, bytearray(16))
+
+
+def test_negotiate_wire_format():
+    assert negotiate_wire_format({"observation": OBSERVATION}) is None
+    assert negotiate_wire_format({"hello": {"wire_format": WIRE_BINARY}}) == WIRE_BINARY
+    assert negotiate_wire_format({"hello": {}}) == WIRE_JSON
+    assert negotiate_wire_format({"hello": {"wire_format": "msgpack"}}) == WIRE_JSON
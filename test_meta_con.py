@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+from aioquic.quic.packet import QuicPacketType
+from aioquic.quic.recovery import QuicSentPacket
+from aioquic.tls import Epoch
+
+from meta_con import SRTT_GAIN, Observer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class ListObserver:
+    """The list-based Observer the ring buffers replaced, as a reference."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.srtt = 0.0
+        self.min_delay = 0
+        self.rtts = []
+        self.acks = []
+        self.loss = 0
+
+    def reset(self):
+        self.rtts = []
+        self.acks = []
+        self.loss = 0
+
+    def on_rtt_measurement(self, rtt):
+        self.srtt = (1 - SRTT_GAIN) * self.srtt + SRTT_GAIN * rtt
+        self.rtts.append(rtt)
+
+    def observation(self, duration, cwnd):
+        rtts = self.rtts[-self.capacity:]
+        avg_delay = sum(rtts) / len(rtts) if rtts else 0.0
+        if rtts and (self.min_delay == 0 or min(rtts) < self.min_delay):
+            self.min_delay = min(rtts)
+        thr = sum(size for _, size in self.acks) / duration
+        return [thr, avg_delay, self.min_delay, self.loss, self.srtt, cwnd]
+
+
+def _packet(sent_bytes):
+    return QuicSentPacket(
+        epoch=Epoch.ONE_RTT,
+        in_flight=True,
+        is_ack_eliciting=True,
+        is_crypto_packet=False,
+        packet_number=0,
+        packet_type=QuicPacketType.ONE_RTT,
+        sent_bytes=sent_bytes,
+    )
+
+
+def _run_intervals(capacity, sizes, features=()):
+    rng = np.random.default_rng(0)
+    clock = Clock()
+    observer = Observer(clock=clock, features=features, capacity=capacity)
+    observer.cwnd = 14400
+    reference = ListObserver(capacity)
+    for n in sizes:
+        for rtt in rng.uniform(0.02, 0.2, n):
+            observer.on_rtt_measurement(rtt=float(rtt))
+            reference.on_rtt_measurement(float(rtt))
+            clock.now += 0.001
+            observer.on_packet_acked(now=clock.now, packet=_packet(1200))
+            reference.acks.append((clock.now, 1200))
+        observer.on_packet_lost(packet=_packet(1200))
+        reference.loss += 1
+        clock.now += 0.5
+        duration = 0.5 + 0.001 * n
+        observation = observer.get_observation()
+        expected = reference.observation(duration, 14400)
+        assert observation[0] == pytest.approx(expected[0])
+        assert observation[2:7] == pytest.approx(expected[1:])
+        yield observation, reference
+        observer.reset()
+        reference.reset()
+
+
+def test_matches_list_implementation():
+    for _ in _run_intervals(4096, [50, 0, 7, 300, 1]):
+        pass
+
+
+def test_wrap_around_keeps_most_recent_samples():
+    # 每个周期的样本数超过容量；被覆盖的旧样本在 srtt 中的权重可以忽略
+    for _ in _run_intervals(128, [300, 129, 128, 1000]):
+        pass
+
+
+def test_extra_features_match_lists():
+    features = ("rtt_p50", "rtt_p95", "jitter", "delivery_rate", "loss_rate")
+    for observation, reference in _run_intervals(64, [40, 200], features):
+        rtts = reference.rtts[-64:]
+        times, sizes = zip(*reference.acks[-64:])
+        expected = [
+            np.percentile(rtts, 50),
+            np.percentile(rtts, 95),
+            np.mean(np.abs(np.diff(rtts))),
+            sum(sizes[1:]) / (times[-1] - times[0]),
+            1 / (len(reference.acks) + 1),
+        ]
+        assert observation[7:] == pytest.approx(expected)
+
+
+def test_empty_interval():
+    clock = Clock()
+    observer = Observer(clock=clock, features=("rtt_p50", "jitter", "delivery_rate"))
+    clock.now += 1.0
+    assert observer.get_observation() == [0.0, 0.0, 0.0, 0, 0, 0.0, 0, 0.0, 0.0, 0.0]
+
+
+def test_reset_episode_forgets_cross_decision_state():
+    clock = Clock()
+    observer = Observer(clock=clock)
+    observer.on_rtt_measurement(rtt=0.05)
+    clock.now += 1.0
+    observer.get_observation()
+    observer.reset()
+    assert observer.srtt == pytest.approx(SRTT_GAIN * 0.05)
+    assert observer.min_delay == 0.05
+    observer.reset_episode()
+    assert observer.srtt == 0.0
+    assert observer.min_delay == 0
+    assert observer.thr_max == 0
+
+
+def test_unknown_feature():
+    with pytest.raises(ValueError):
+        Observer(features=("bandwidth",))
@@ -0,0 +1,99 @@
+import os
+from multiprocessing import shared_memory
+
+import pytest
+
+from drl_comunication import KIND_ACTION, KIND_OBSERVATION
+from shm_channel import (
+    _ACTION_SLOT,
+    _CONTROLLER_WAITING,
+    _ENV_WAITING,
+    _OBSERVATION_SLOT,
+    _SEQ,
+    KIND_RESET,
+    MAX_VALUES,
+    SEGMENT_SIZE,
+    _decode,
+    _encode,
+    _Endpoint,
+)
+
+OBSERVATION = [12345678.0, 23456789.0, 0.061, 0.06, 0.0, 0.0605, 120000.0]
+
+
+@pytest.mark.parametrize(
+    "msg",
+    [
+        {"observation": OBSERVATION, "window": 14400.0, "flow": 2, "seq": 9},
+        {"action": -0.25, "flow": 0, "seq": 0},
+        {"action": 0.5, "pacing": 0.125, "flow": 1, "seq": 3},
+        {"reset": True, "flow": 4, "seq": 1},
+    ],
+)
+def test_encode_decode_round_trip(msg):
+    kind, values, flow, tag = _encode(msg)
+    assert _decode((kind, flow, tag, tuple(values))) == msg
+
+
+def test_encode_defaults_and_kinds():
+    assert _encode({"reset": True}) == (KIND_RESET, (), 0, 0)
+    assert _encode({"action": 1.0})[0] == KIND_ACTION
+    kind, values, _, _ = _encode({"observation": [1.0, 2.0], "window": 3.0})
+    assert kind == KIND_OBSERVATION
+    assert values == [1.0, 2.0, 3.0]
+
+
+def test_unsupported_messages():
+    with pytest.raises(ValueError):
+        _encode({"hello": {}})
+    with pytest.raises(ValueError):
+        _decode((99, 0, 0, ()))
+
+
+@pytest.fixture
+def endpoints():
+    shm = shared_memory.SharedMemory(create=True, size=SEGMENT_SIZE)
+    env_r, env_w = os.pipe()
+    controller_r, controller_w = os.pipe()
+    slots = (_OBSERVATION_SLOT, _ACTION_SLOT)
+    waiting = (_ENV_WAITING, _CONTROLLER_WAITING)
+    env = _Endpoint(shm, *slots, *waiting, env_r, controller_w, 0.0)
+    controller = _Endpoint(shm, *slots[::-1], *waiting[::-1], controller_r, env_w, 0.0)
+    yield env, controller, shm
+    env.release()
+    controller.release()
+    shm.close()
+    shm.unlink()
+    for fd in (env_r, env_w, controller_r, controller_w):
+        os.close(fd)
+
+
+def test_endpoint_round_trip(endpoints):
+    env, controller, _ = endpoints
+    assert controller.try_read() is None
+    msg = {"observation": OBSERVATION, "window": 14400.0, "flow": 1, "seq": 5}
+    env.write(*_encode(msg))
+    assert _decode(controller.read(timeout=1.0)) == msg
+    # 同一条消息只读一次
+    assert controller.try_read() is None
+    reply = {"action": 0.5, "pacing": 0.25, "flow": 1, "seq": 5}
+    controller.write(*_encode(reply))
+    assert _decode(env.read(timeout=1.0)) == reply
+    assert env.read(timeout=0.01) is None
+
+
+def test_endpoint_skips_slot_being_written(endpoints):
+    env, controller, shm = endpoints
+    env.write(*_encode({"action": 1.0}))
+    # 序号为奇数：写入尚未完成
+    seq = _SEQ.unpack_from(shm.buf, _OBSERVATION_SLOT)[0]
+    _SEQ.pack_into(shm.buf, _OBSERVATION_SLOT, seq + 1)
+    assert controller.try_read() is None
+    _SEQ.pack_into(shm.buf, _OBSERVATION_SLOT, seq)
+    assert _decode(controller.try_read())["action"] == 1.0
+
+
+def test_endpoint_rejects_too_many_values(endpoints):
+    env, _, _ = endpoints
+    with pytest.raises(ValueError):
+        env.write(KIND_OBSERVATION, [0.0] * (MAX_VALUES + 1))
@@ -0,0 +1,177 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from dowel import tabular
+
+from embedded_policy import NumpyGaussianMLPPolicy
+from snapshot import (
+    DEFAULT_RETURN_KEY,
+    INDEX_FILE,
+    AsyncSnapshotter,
+    load_policy,
+    load_snapshot,
+)
+
+# 测试里没有 dowel 的输出，记录的回报不会被写出
+pytestmark = pytest.mark.filterwarnings("ignore:.*TabularInput")
+
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def detach(self):
+        return self
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeModule:
+    """Just enough of a torch module for :class:`AsyncSnapshotter`."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def state_dict(self):
+        return {key: FakeTensor(value) for key, value in self.state.items()}
+
+
+class FakeAlgo:
+    pass
+
+
+def _algo(scale=1.0):
+    rng = np.random.default_rng(0)
+    prefix = "_module._mean_module."
+    policy = FakeModule(
+        {
+            f"{prefix}_layers.0.linear.weight": scale * rng.normal(size=(8, 7)),
+            f"{prefix}_layers.0.linear.bias": np.zeros(8),
+            f"{prefix}_output_layers.0.linear.weight": rng.normal(size=(1, 8)),
+            f"{prefix}_output_layers.0.linear.bias": np.zeros(1),
+            "_module._init_std": np.full(1, -0.5),
+        }
+    )
+    policy._module = FakeAlgo()
+    policy._module._hidden_nonlinearity = np.tanh
+    policy._module._output_nonlinearity = None
+    algo = FakeAlgo()
+    algo.policy = policy
+    algo._value_function = FakeModule({"w": np.ones(3)})
+    return algo
+
+
+def _save_epochs(snapshotter, returns, algo=None, start=0):
+    algo = algo or _algo()
+    for itr, value in enumerate(returns, start):
+        if value is not None:
+            tabular.record(DEFAULT_RETURN_KEY, value)
+        snapshotter.save_itr_params(itr, {"algo": algo, "env": None})
+        tabular.clear()
+
+
+def _index(path):
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def test_retention(tmp_path):
+    snapshotter = AsyncSnapshotter(
+        str(tmp_path), keep_last=2, keep_every=5, keep_best=2, optimizer_every=0
+    )
+    _save_epochs(snapshotter, [1, 9, 3, 8, 2, 0, 1, 0, 4, 0, 0, 1])
+    snapshotter.close()
+    # 最近两个 (10, 11)、5 的倍数 (0, 5, 10)、回报最高的两个 (1, 3)
+    kept = [0, 1, 3, 5, 10, 11]
+    assert [s["itr"] for s in _index(tmp_path)["snapshots"]] == kept
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [INDEX_FILE] + [f"itr_{itr}.npz" for itr in kept]
+    )
+    assert not any(s["optimizer"] for s in _index(tmp_path)["snapshots"])
+
+
+def test_keeps_everything_by_default(tmp_path):
+    snapshotter = AsyncSnapshotter(str(tmp_path), optimizer_every=0)
+    _save_epochs(snapshotter, [None] * 4)
+    snapshotter.flush()
+    assert [s["itr"] for s in _index(tmp_path)["snapshots"]] == [0, 1, 2, 3]
+    assert all(s["return"] is None for s in _index(tmp_path)["snapshots"])
+    snapshotter.close()
+
+
+def test_sweeps_orphan_optimizer_files(tmp_path):
+    # 中断的训练留下的、索引没有引用的优化器文件
+    (tmp_path / "optimizer_itr_99.pt").write_bytes(b"")
+    snapshotter = AsyncSnapshotter(str(tmp_path), keep_last=1, optimizer_every=0)
+    _save_epochs(snapshotter, [1.0])
+    snapshotter.close()
+    assert sorted(os.listdir(tmp_path)) == sorted([INDEX_FILE, "itr_0.npz"])
+
+
+def test_load_snapshot_and_policy(tmp_path):
+    snapshotter = AsyncSnapshotter(str(tmp_path), optimizer_every=0)
+    _save_epochs(snapshotter, [1.0, 5.0], algo=_algo(1.0))
+    _save_epochs(snapshotter, [2.0], algo=_algo(2.0), start=2)
+    snapshotter.close()
+    saved = load_snapshot(str(tmp_path), "best")
+    assert saved["meta"]["itr"] == 1
+    assert saved["meta"]["return"] == 5.0
+    assert saved["meta"]["hidden_nonlinearity"] == "tanh"
+    np.testing.assert_array_equal(saved["value_function"]["w"], np.ones(3))
+    assert "optimizers" not in saved
+    assert load_snapshot(str(tmp_path), 2)["meta"]["return"] == 2.0
+    with pytest.raises(FileNotFoundError):
+        load_snapshot(str(tmp_path), 7)
+
+    state = _algo(2.0).policy.state
+    prefix = "_module._mean_module."
+    expected = NumpyGaussianMLPPolicy(
+        [
+            state[f"{prefix}_layers.0.linear.weight"],
+            state[f"{prefix}_output_layers.0.linear.weight"],
+        ],
+        [np.zeros(8), np.zeros(1)],
+        state["_module._init_std"],
+    )
+    policy = load_policy(str(tmp_path), "last")
+    observation = np.linspace(-1, 1, 7)
+    np.testing.assert_allclose(
+        policy.get_mean_actions(observation), expected.get_mean_actions(observation)
+    )
+
+
+def test_reopen_appends_to_index(tmp_path):
+    snapshotter = AsyncSnapshotter(str(tmp_path), optimizer_every=0)
+    _save_epochs(snapshotter, [1.0, 2.0])
+    snapshotter.close()
+    snapshotter = AsyncSnapshotter(str(tmp_path), keep_last=1, optimizer_every=0)
+    snapshotter.save_itr_params(2, {"algo": _algo(), "env": None})
+    snapshotter.close()
+    assert [s["itr"] for s in _index(tmp_path)["snapshots"]] == [2]
+    assert sorted(os.listdir(tmp_path)) == sorted([INDEX_FILE, "itr_2.npz"])
+
+
+def test_keeps_only_latest_optimizer_state(tmp_path):
+    torch = pytest.importorskip("torch")
+    algo = _algo()
+    parameter = torch.zeros(1, requires_grad=True)
+    algo._policy_optimizer = torch.optim.Adam([parameter])
+    snapshotter = AsyncSnapshotter(str(tmp_path), keep_every=5, optimizer_every=5)
+    _save_epochs(snapshotter, [None] * 12, algo=algo)
+    snapshotter.close()
+    # 第 11 轮的快照被删除，优化器状态留在第 10 轮
+    files = sorted(os.listdir(tmp_path))
+    assert [f for f in files if f.startswith("optimizer_")] == ["optimizer_itr_10.pt"]
+    snapshots = _index(tmp_path)["snapshots"]
+    assert [(s["itr"], s["optimizer"]) for s in snapshots] == [
+        (0, None),
+        (5, None),
+        (10, "optimizer_itr_10.pt"),
+    ]
+    assert "policy_optimizer" in load_snapshot(str(tmp_path), 10)["optimizers"]
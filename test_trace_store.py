@@ -0,0 +1,116 @@
+import json
+
+import numpy as np
+import pytest
+
+from trace_store import (
+    MTU,
+    TraceStore,
+    parse_metadata,
+    trace_family,
+    trace_opportunities,
+    trace_stats,
+)
+
+
+def _write_scenario(path, **metadata):
+    path.mkdir()
+    with open(path / "pantheon_metadata.json", "w") as f:
+        json.dump(metadata, f)
+    return str(path / "pantheon_metadata.json")
+
+
+def _write_trace(path, timestamps):
+    path.write_text("".join(f"{t}\n" for t in timestamps))
+    return str(path)
+
+
+def test_trace_family():
+    assert trace_family("12mbps.trace") == "constant"
+    assert trace_family("trace-3114405-bus") == "bus"
+    assert trace_family("trace-1552767958-taxi1.trace") == "taxi"
+    assert trace_family("something") == "other"
+
+
+def test_parse_metadata_adds_nested_delays(tmp_path):
+    path = _write_scenario(
+        tmp_path / "scenario",
+        prepend_mm_cmds="mm-delay 30",
+        append_mm_cmds="mm-delay 20 mm-loss uplink 0.01",
+        uplink_trace="up.trace",
+        downlink_trace="down.trace",
+        extra_mm_link_args="--uplink-queue=droptail --uplink-queue-args=packets=150",
+    )
+    scenario = parse_metadata(path)
+    assert scenario["delay_ms"] == 50
+    assert scenario["uplink_trace"] == "up.trace"
+    assert scenario["downlink_trace"] == "down.trace"
+    assert scenario["uplink_queue"] == "droptail"
+    assert scenario["queue_packets"] == 150
+    assert scenario["flows"] == 1
+
+
+def test_parse_metadata_defaults(tmp_path):
+    path = _write_scenario(tmp_path / "bare", append_mm_cmds=None)
+    scenario = parse_metadata(path)
+    assert scenario["delay_ms"] == 0
+    assert scenario["queue_packets"] is None
+    assert scenario["uplink_queue"] is None
+
+
+def test_trace_opportunities_wrap_around():
+    # 周期 4 ms：第 4 ms 的机会落在下标 0
+    opportunities = trace_opportunities(np.array([1, 1, 2, 4], dtype=np.uint32))
+    assert opportunities.tolist() == [1, 2, 1, 0]
+
+
+def test_constant_trace_stats():
+    # 每毫秒一个机会：MTU * 8 bit / 1 ms
+    stats = trace_stats(np.arange(1, 1001, dtype=np.uint32))
+    expected = MTU * 8 / 1000
+    assert stats["period_ms"] == 1000
+    assert stats["opportunities"] == 1000
+    assert stats["mean_mbps"] == pytest.approx(expected)
+    assert stats["p5_mbps"] == pytest.approx(expected)
+    assert stats["p95_mbps"] == pytest.approx(expected)
+    assert stats["burstiness"] == 0.0
+
+
+def test_short_period_is_repeated_to_a_window():
+    # 周期 10 ms、每周期 5 个机会，短于统计窗口
+    stats = trace_stats(np.array([2, 4, 6, 8, 10], dtype=np.uint32), window_ms=100)
+    assert stats["mean_mbps"] == pytest.approx(0.5 * MTU * 8 / 1000)
+
+
+def test_bursty_trace_stats():
+    # 前 100 ms 每毫秒两个机会，后 100 ms 没有
+    timestamps = np.sort(np.concatenate([np.arange(1, 101)] * 2 + [[200]]))
+    stats = trace_stats(timestamps.astype(np.uint32), window_ms=100)
+    assert stats["p95_mbps"] > stats["p5_mbps"]
+    assert stats["burstiness"] > 0.9
+
+
+def test_store_caches_and_rebuilds(tmp_path):
+    dataset = tmp_path / "dataset"
+    dataset.mkdir()
+    _write_trace(dataset / "1mbps.trace", range(1, 101))
+    _write_scenario(
+        dataset / "scenario",
+        prepend_mm_cmds="mm-delay 10",
+        append_mm_cmds="mm-delay 5",
+        uplink_trace="1mbps.trace",
+        downlink_trace="1mbps.trace",
+    )
+    store = TraceStore(str(dataset))
+    assert store.load("1mbps.trace").tolist() == list(range(1, 101))
+    assert store.scenario("scenario")["delay_ms"] == 15
+    assert store.scenario("scenario")["available"]
+
+    # 新的 store 直接读缓存；源文件改变后重建
+    store = TraceStore(str(dataset))
+    assert store.stats("1mbps.trace")["opportunities"] == 100
+    _write_trace(dataset / "1mbps.trace", range(1, 51))
+    assert store.stats("1mbps.trace")["opportunities"] == 50
+
+    tasks = store.link_tasks()
+    assert [task["name"] for task in tasks] == ["scenario", "1mbps.trace-15ms-None"]
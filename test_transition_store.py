@@ -0,0 +1,134 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from transition_store import (
+    MANIFEST_FILE,
+    TransitionDataset,
+    TransitionRecorder,
+    find_manifests,
+)
+
+TASK_A = {"name": "12mbps.trace-20ms-None", "delay_ms": 20}
+TASK_B = {"name": "trace-3114405-bus", "delay_ms": 40}
+
+
+def _record(root, episodes, chunk_rows=4):
+    """Record ``episodes`` as ``(task, length)``; return the expected rows."""
+    recorder = TransitionRecorder(str(root), chunk_rows=chunk_rows)
+    rows = []
+    for task, length in episodes:
+        recorder.begin_episode(task)
+        for step in range(length):
+            value = float(len(rows))
+            observation = np.full(7, value)
+            env_info = {"throughput": value}
+            if step % 2:
+                # 缺失的键应记为 NaN
+                env_info = {}
+            recorder.record(
+                observation,
+                np.array([value / 10]),
+                value,
+                observation + 1,
+                2 if step == length - 1 else 1,
+                env_info,
+            )
+            rows.append((value, task, step))
+    recorder.close()
+    return rows
+
+
+def test_round_trip(tmp_path):
+    rows = _record(tmp_path, [(TASK_A, 5), (TASK_B, 3), (None, 2)])
+    dataset = TransitionDataset(str(tmp_path))
+    assert len(dataset) == 10
+    assert dataset.n_episodes == 3
+    assert dataset.tasks == [TASK_A, TASK_B, None]
+    # chunk_rows=4：两个满块加一个两行的块
+    with open(tmp_path / MANIFEST_FILE) as f:
+        assert [chunk["rows"] for chunk in json.load(f)["chunks"]] == [4, 4, 2]
+
+    values = np.array([value for value, _, _ in rows])
+    np.testing.assert_array_equal(dataset.column("reward"), values)
+    np.testing.assert_array_equal(dataset.column("observation")[:, 0], values)
+    np.testing.assert_array_equal(dataset.column("next_observation")[:, 0], values + 1)
+    np.testing.assert_allclose(dataset.column("action")[:, 0], values / 10, rtol=1e-6)
+    assert dataset.column("episode").tolist() == [0] * 5 + [1] * 3 + [2] * 2
+    assert dataset.column("step").tolist() == [step for _, _, step in rows]
+    assert dataset.column("task").tolist() == [0] * 5 + [1] * 3 + [2] * 2
+    assert dataset.column("step_type").tolist().count(2) == 3
+    missing = np.array([step % 2 == 1 for _, _, step in rows])
+    throughput = dataset.column("info_throughput")
+    np.testing.assert_array_equal(throughput[~missing], values[~missing])
+    assert np.isnan(throughput[missing]).all()
+
+
+def test_take_across_chunks(tmp_path):
+    _record(tmp_path, [(TASK_A, 10)])
+    dataset = TransitionDataset(str(tmp_path))
+    batch = dataset.take([9, 0, 5, 4, 1], ["reward", "episode"])
+    assert set(batch) == {"reward", "episode"}
+    assert batch["reward"].tolist() == [9, 0, 5, 4, 1]
+    assert batch["episode"].tolist() == [0] * 5
+
+
+def test_minibatches_cover_every_row(tmp_path):
+    _record(tmp_path, [(TASK_A, 6), (TASK_B, 5)])
+    dataset = TransitionDataset(str(tmp_path))
+    batches = list(dataset.minibatches(4, ["reward"], epochs=2, seed=0))
+    assert [len(batch["reward"]) for batch in batches] == [4, 4, 3] * 2
+    rewards = np.concatenate([batch["reward"] for batch in batches[:3]])
+    assert sorted(rewards.tolist()) == list(range(11))
+    batches = list(dataset.minibatches(4, ["reward"], shuffle=False, drop_last=True))
+    assert [batch["reward"].tolist() for batch in batches] == [
+        [0, 1, 2, 3],
+        [4, 5, 6, 7],
+    ]
+
+
+def test_recorders_are_merged(tmp_path):
+    _record(tmp_path / "worker-0", [(TASK_A, 3), (TASK_B, 2)])
+    _record(tmp_path / "worker-1", [(TASK_B, 4)])
+    assert find_manifests(str(tmp_path)) == [
+        str(tmp_path / "worker-0"),
+        str(tmp_path / "worker-1"),
+    ]
+    dataset = TransitionDataset(str(tmp_path))
+    assert dataset.n_episodes == 3
+    assert dataset.tasks == [TASK_A, TASK_B]
+    # 第二个 recorder 的任务 0 是全局的任务 1
+    assert dataset.column("task").tolist() == [0] * 3 + [1] * 6
+    episodes = list(dataset.episodes(["episode", "step"]))
+    assert [episode["episode"][0] for episode in episodes] == [0, 1, 2]
+    assert [episode["step"].tolist() for episode in episodes] == [
+        [0, 1, 2],
+        [0, 1],
+        [0, 1, 2, 3],
+    ]
+
+
+def test_reopened_recorder_appends(tmp_path):
+    _record(tmp_path, [(TASK_A, 3)])
+    _record(tmp_path, [(TASK_A, 2), (TASK_B, 1)])
+    dataset = TransitionDataset(str(tmp_path))
+    assert len(dataset) == 6
+    assert dataset.n_episodes == 3
+    assert dataset.tasks == [TASK_A, TASK_B]
+    assert dataset.column("episode").tolist() == [0, 0, 0, 1, 1, 2]
+
+
+def test_rejects_unknown_manifest_version(tmp_path):
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+        json.dump({"version": 0}, f)
+    with pytest.raises(ValueError):
+        TransitionRecorder(str(tmp_path))
+
+
+def test_empty_dataset(tmp_path):
+    dataset = TransitionDataset(str(tmp_path))
+    assert len(dataset) == 0
+    assert dataset.column_names == []
+    assert list(dataset.episodes()) == []
@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset")
+# mahimahi 中每个投递机会可以发送一个 MTU 大小的包
+MTU = 1500
+METADATA_FILE = "pantheon_metadata.json"
+INDEX_FILE = "index.json"
+# parse_metadata 的结果变化时递增，索引中的旧场景条目随之重建
+METADATA_VERSION = 2
+# 统计容量时的时间窗口
+STATS_WINDOW_MS = 100
+
+_DELAY_RE = re.compile(r"mm-delay\s+(\d+)")
+_FAMILY_RE = re.compile(r"^trace-\d+-([a-z]+?)\d*$")
+
+
+def resolve_trace_path(trace_file: str, dataset_dir: str = DATASET_DIR) -> str:
+    if os.path.isabs(trace_file) or os.path.exists(trace_file):
+        return trace_file
+    return os.path.join(dataset_dir, trace_file)
+
+
+def trace_family(name: str) -> str:
+    """``12mbps`` -> ``constant``, ``trace-3114405-bus`` -> ``bus``."""
+    name = os.path.basename(name)
+    if name.endswith(".trace"):
+        name = name[: -len(".trace")]
+    match = _FAMILY_RE.match(name)
+    if match:
+        return match.group(1)
+    if name.endswith("mbps"):
+        return "constant"
+    return "other"
+
+
+def parse_trace(path: str) -> np.ndarray:
+    """Parse a text mahimahi trace into an array of millisecond timestamps."""
+    timestamps = np.fromfile(path, dtype=np.int64, sep=" ")
+    if timestamps.size == 0:
+        raise ValueError(f"Empty trace file: {path}")
+    if timestamps.max() > np.iinfo(np.uint32).max:
+        raise ValueError(f"Trace timestamps out of range: {path}")
+    return timestamps.astype(np.uint32)
+
+
+def trace_opportunities(timestamps: np.ndarray) -> np.ndarray:
+    """
+    Delivery opportunities per millisecond over one trace period. The trace
+    repeats every ``timestamps[-1]`` ms, so entry ``t % period`` holds the
+    opportunities of millisecond ``t``.
+    """
+    period = int(timestamps[-1])
+    return np.bincount(timestamps % period, minlength=period)
+
+
+def trace_stats(timestamps: np.ndarray, window_ms: int = STATS_WINDOW_MS) -> dict:
+    """Capacity statistics of a trace in Mbps over ``window_ms`` windows."""
+    opportunities = trace_opportunities(timestamps)
+    period = len(opportunities)
+    # 周期比统计窗口短时先重复到至少一个窗口
+    repeat = -(-window_ms // period)
+    per_ms = np.tile(opportunities, repeat) if repeat > 1 else opportunities
+    n_windows = max(len(per_ms) // window_ms, 1)
+    per_window = per_ms[: n_windows * window_ms].reshape(n_windows, -1).sum(axis=1)
+    capacity = per_window * MTU * 8 / (window_ms * 1000)
+    mean = float(capacity.mean())
+    return {
+        "period_ms": period,
+        "opportunities": int(len(timestamps)),
+        "mean_mbps": mean,
+        "p5_mbps": float(np.percentile(capacity, 5)),
+        "p50_mbps": float(np.percentile(capacity, 50)),
+        "p95_mbps": float(np.percentile(capacity, 95)),
+        # 容量的变异系数，0 表示恒定速率
+        "burstiness": float(capacity.std() / mean) if mean > 0 else 0.0,
+    }
+
+
+def parse_metadata(path: str) -> dict:
+    """Extract the link parameters of a pantheon scenario."""
+    with open(path) as f:
+        metadata = json.load(f)
+    mm_cmds = " ".join(
+        metadata.get(key) or "" for key in ("prepend_mm_cmds", "append_mm_cmds")
+    )
+    delays = [int(d) for d in _DELAY_RE.findall(mm_cmds)]
+    link_args = {}
+    for arg in (metadata.get("extra_mm_link_args") or "").split():
+        key, _, value = arg.lstrip("-").partition("=")
+        link_args[key] = value
+    queue_args = dict(
+        item.split("=", 1)
+        for item in link_args.get("uplink-queue-args", "").split(",")
+        if "=" in item
+    )
+    name = os.path.basename(os.path.dirname(path))
+    return {
+        "name": name,
+        "family": trace_family(name),
+        "uplink_trace": metadata.get("uplink_trace"),
+        "downlink_trace": metadata.get("downlink_trace"),
+        # prepend 在 mm-link 外层、append 在内层，两层 shell 嵌套，时延相加
+        "delay_ms": sum(delays),
+        "uplink_queue": link_args.get("uplink-queue"),
+        "uplink_queue_args": link_args.get("uplink-queue-args"),
+        "queue_packets": (
+            int(queue_args["packets"]) if "packets" in queue_args else None
+        ),
+        "flows": metadata.get("flows", 1),
+        "runtime": metadata.get("runtime"),
+    }
+
+
+def _source_signature(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _atomic_save(path: str, array: np.ndarray) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+class TraceStore:
+    """
+    Compact, memory-mapped view of the trace dataset.
+
+    Each text trace is parsed once into ``<cache_dir>/<name>.npy`` (uint32
+    timestamps) and memory-mapped on every later load. ``index.json`` in the
+    cache directory records, per trace, the source file signature and its
+    capacity statistics, and the link parameters of every pantheon scenario
+    (``<dataset>/<scenario>/pantheon_metadata.json``). Entries are rebuilt
+    when the source file changes.
+    """
+
+    def __init__(self, dataset_dir: str = DATASET_DIR, cache_dir: Optional[str] = None):
+        self.dataset_dir = dataset_dir
+        self.cache_dir = cache_dir or os.path.join(dataset_dir, ".cache")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index = None
+        self._arrays = {}
+        self._opportunities = {}
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _load_index(self) -> dict:
+        if self._index is None:
+            try:
+                with open(self._index_path()) as f:
+                    self._index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._index = {}
+            self._index.setdefault("traces", {})
+            self._index.setdefault("scenarios", {})
+        return self._index
+
+    def _save_index(self) -> None:
+        tmp = f"{self._index_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._index_path())
+
+    def _cache_name(self, path: str) -> str:
+        path = os.path.abspath(path)
+        dataset_dir = os.path.abspath(self.dataset_dir)
+        if os.path.dirname(path) == dataset_dir:
+            return os.path.basename(path)
+        digest = hashlib.sha1(path.encode()).hexdigest()[:16]
+        return f"{os.path.basename(path)}-{digest}"
+
+    def trace_names(self) -> List[str]:
+        """Trace files directly under the dataset directory."""
+        return sorted(
+            name
+            for name in os.listdir(self.dataset_dir)
+            if not name.startswith(".")
+            and os.path.isfile(os.path.join(self.dataset_dir, name))
+            and not name.endswith(".json")
+        )
+
+    def scenario_names(self) -> List[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.dataset_dir)
+            if os.path.isfile(os.path.join(self.dataset_dir, name, METADATA_FILE))
+        )
+
+    def has_trace(self, trace_file: str) -> bool:
+        return os.path.isfile(resolve_trace_path(trace_file, self.dataset_dir))
+
+    def _entry(self, trace_file: str):
+        path = resolve_trace_path(trace_file, self.dataset_dir)
+        name = self._cache_name(path)
+        index = self._load_index()
+        signature = _source_signature(path)
+        entry = index["traces"].get(name)
+        npy_path = os.path.join(self.cache_dir, f"{name}.npy")
+        if (
+            entry is None
+            or entry["signature"] != signature
+            or not os.path.exists(npy_path)
+        ):
+            timestamps = parse_trace(path)
+            _atomic_save(npy_path, timestamps)
+            entry = index["traces"][name] = {
+                "cache_name": name,
+                "path": os.path.abspath(path),
+                "family": trace_family(name),
+                "signature": signature,
+                "stats": trace_stats(timestamps),
+            }
+            self._arrays.pop(name, None)
+            self._opportunities.pop(name, None)
+            self._save_index()
+        return entry
+
+    def load(self, trace_file: str) -> np.ndarray:
+        """Memory-mapped uint32 timestamps of a trace."""
+        name = self._entry(trace_file)["cache_name"]
+        array = self._arrays.get(name)
+        if array is None:
+            npy_path = os.path.join(self.cache_dir, f"{name}.npy")
+            array = self._arrays[name] = np.load(npy_path, mmap_mode="r")
+        return array
+
+    def opportunities(self, trace_file: str) -> np.ndarray:
+        """Delivery opportunities per millisecond, see :func:`trace_opportunities`."""
+        name = self._entry(trace_file)["cache_name"]
+        opportunities = self._opportunities.get(name)
+        if opportunities is None:
+            opportunities = self._opportunities[name] = trace_opportunities(
+                self.load(trace_file)
+            )
+        return opportunities
+
+    def stats(self, trace_file: str) -> dict:
+        return self._entry(trace_file)["stats"]
+
+    def scenario(self, name: str) -> dict:
+        path = os.path.join(self.dataset_dir, name, METADATA_FILE)
+        index = self._load_index()
+        signature = _source_signature(path)
+        entry = index["scenarios"].get(name)
+        if (
+            entry is None
+            or entry["signature"] != signature
+            or entry.get("version") != METADATA_VERSION
+        ):
+            entry = index["scenarios"][name] = {
+                "signature": signature,
+                "version": METADATA_VERSION,
+                **parse_metadata(path),
+            }
+            self._save_index()
+        entry = dict(entry)
+        del entry["signature"], entry["version"]
+        entry["available"] = all(
+            entry[key] is not None and self.has_trace(entry[key])
+            for key in ("uplink_trace", "downlink_trace")
+        )
+        return entry
+
+    def scenarios(self) -> Dict[str, dict]:
+        return {name: self.scenario(name) for name in self.scenario_names()}
+
+    def link_tasks(self, delay_ms: int = 30, queue_packets: Optional[int] = 200):
+        """
+        Every link configuration that can be emulated with the files on disk.
+
+        Pantheon scenarios whose traces are available are used as they are.
+        Every trace file is also paired with each distinct delay/queue
+        setting found in the scenarios (or ``delay_ms``/``queue_packets`` if
+        there are none) and replayed in both directions.
+        """
+        tasks = []
+        link_params = set()
+        for scenario in self.scenarios().values():
+            link_params.add((scenario["delay_ms"], scenario["queue_packets"]))
+            if scenario["available"]:
+                tasks.append(
+                    {
+                        "name": scenario["name"],
+                        "family": scenario["family"],
+                        "uplink_trace": scenario["uplink_trace"],
+                        "downlink_trace": scenario["downlink_trace"],
+                        "delay_ms": scenario["delay_ms"],
+                        "queue_packets": scenario["queue_packets"],
+                    }
+                )
+        if not link_params:
+            link_params.add((delay_ms, queue_packets))
+        for trace in self.trace_names():
+            for task_delay_ms, task_queue_packets in sorted(
+                link_params, key=lambda p: (p[0], p[1] or 0)
+            ):
+                tasks.append(
+                    {
+                        "name": f"{trace}-{task_delay_ms}ms-{task_queue_packets}",
+                        "family": trace_family(trace),
+                        "uplink_trace": trace,
+                        "downlink_trace": trace,
+                        "delay_ms": task_delay_ms,
+                        "queue_packets": task_queue_packets,
+                    }
+                )
+        return tasks
+
+    def build_index(self) -> dict:
+        """Parse everything that is not cached yet and return the index."""
+        for name in self.trace_names():
+            self._entry(name)
+        self.scenarios()
+        return self._load_index()
+
+
+_default_store = None
+
+
+def get_trace_store() -> TraceStore:
+    """Process-wide store over the repository dataset."""
+    global _default_store
+    if _default_store is None:
+        _default_store = TraceStore()
+    return _default_store
+
+
+if __name__ == "__main__":
+    # python trace_store.py  预先解析整个数据集并打印统计
+    store = get_trace_store()
+    index = store.build_index()
+    for name, entry in sorted(index["traces"].items()):
+        stats = entry["stats"]
+        print(
+            f"{name:>28}  {entry['family']:>10}  mean {stats['mean_mbps']:7.1f} Mbps"
+            f"  p5 {stats['p5_mbps']:7.1f}  p95 {stats['p95_mbps']:7.1f}"
+            f"  burstiness {stats['burstiness']:.2f}"
+        )
+    for name, scenario in store.scenarios().items():
+        print(
+            f"{name:>28}  delay {scenario['delay_ms']} ms"
+            f"  queue {scenario['uplink_queue']} {scenario['uplink_queue_args']}"
+            f"  flows {scenario['flows']}  available {scenario['available']}"
+        )
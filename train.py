@@ -6,7 +6,9 @@ import click
 
 print("22")
 import torch
+from distributed import DistributedSampler
 from env import MetaConEnv
+from snapshot import AsyncSnapshotter
 
 print("33")
 from garage import wrap_experiment
@@ -14,13 +16,22 @@ from garage.envs import GymEnv, normalize
 from garage.experiment import MetaEvaluator
 from garage.experiment.deterministic import set_seed
 from garage.experiment.task_sampler import SetTaskSampler
-from garage.sampler import LocalSampler
+from garage.sampler import LocalSampler, MultiprocessingSampler
 from garage.torch.algos import MAMLPPO, PPO
 from garage.torch.policies import GaussianMLPPolicy
 from garage.torch.value_functions import GaussianMLPValueFunction
 from garage.trainer import Trainer
 
 
+class AsyncSnapshotTrainer(Trainer):
+    """garage ``Trainer`` that saves its epochs with an :class:`AsyncSnapshotter`."""
+
+    def __init__(self, snapshot_config, snapshotter: AsyncSnapshotter):
+        super().__init__(snapshot_config)
+        # Trainer.save/train 都通过 _snapshotter 访问快照器
+        self._snapshotter = snapshotter
+
+
 @click.command()
 @click.option("--id", default="default")
 @click.option("--data_dir", default="data")
@@ -29,9 +40,34 @@ from garage.trainer import Trainer
 @click.option("--epochs", default=3000)
 @click.option("--episodes_per_task", default=40)
 @click.option("--meta_batch_size", default=20)
-@wrap_experiment(snapshot_mode="all")
+@click.option("--n_workers", default=1)
+@click.option("--backend", default="mahimahi")
+@click.option("--use_zygote", is_flag=True)
+@click.option("--learner_port", default=None, type=int)
+@click.option("--rollout_workers", default=0)
+@click.option("--snapshot_keep_last", default=5)
+@click.option("--snapshot_every", default=100)
+@click.option("--snapshot_keep_best", default=3)
+@click.option("--snapshot_optimizer_every", default=100)
+@wrap_experiment(snapshot_mode="none")
 def maml_ppo_half_cheetah_dir(
-    ctxt, id, data_dir, target_step, seed, epochs, episodes_per_task, meta_batch_size
+    ctxt,
+    id,
+    data_dir,
+    target_step,
+    seed,
+    epochs,
+    episodes_per_task,
+    meta_batch_size,
+    n_workers,
+    backend,
+    use_zygote,
+    learner_port,
+    rollout_workers,
+    snapshot_keep_last,
+    snapshot_every,
+    snapshot_keep_best,
+    snapshot_optimizer_every,
 ):
     """Set up environment and algorithm and run the task.
 
@@ -44,19 +80,35 @@ def maml_ppo_half_cheetah_dir(
         episodes_per_task (int): Number of episodes per epoch per task
             for training.
         meta_batch_size (int): Number of tasks sampled per batch.
+        n_workers (int): Number of rollout worker processes. Each worker
+            gets its own DRL socket, QUIC port, mm-link and log directory.
+        backend (str): MetaConEnv backend, "mahimahi" or "emulator".
+        use_zygote (bool): Fork the per-episode server.py and client.py
+            from pre-imported zygote processes (mahimahi backend).
+        learner_port (int): Sample with remote rollout workers instead:
+            listen on this TCP port for ``distributed.py worker`` processes,
+            which run their own emulator-backed MetaConEnv.
+        rollout_workers (int): Number of such workers to start on this
+            machine when ``learner_port`` is set.
+        snapshot_keep_last (int): Keep the snapshots of the last epochs.
+        snapshot_every (int): Also keep every snapshot_every-th epoch.
+        snapshot_keep_best (int): Also keep the epochs with the highest
+            average return.
+        snapshot_optimizer_every (int): Epochs between copies of the
+            optimizer state (only the latest is kept, to resume training).
 
     """
     # set_seed(seed)
     max_episode_length = 100
-    env = normalize(
-        MetaConEnv(
-            expirement_id=id,
-            data_dir=data_dir,
-            target_step=target_step,
-            max_episode_length=max_episode_length,
-        ),
-        normalize_obs=True,
+    meta_con_env = MetaConEnv(
+        expirement_id=id,
+        data_dir=data_dir,
+        target_step=target_step,
+        max_episode_length=max_episode_length,
+        backend=backend,
+        use_zygote=use_zygote,
     )
+    env = normalize(meta_con_env, normalize_obs=True)
 
     policy = GaussianMLPPolicy(
         env_spec=env.spec,
@@ -72,8 +124,10 @@ def maml_ppo_half_cheetah_dir(
         output_nonlinearity=None,
     )
 
+    # 用已配置的 env 采样任务，避免按默认参数再构造一个
     task_sampler = SetTaskSampler(
         MetaConEnv,
+        env=meta_con_env,
         wrapper=lambda env, _: normalize(
             GymEnv(env, max_episode_length=max_episode_length),
             expected_action_scale=10.0,
@@ -84,12 +138,43 @@ def maml_ppo_half_cheetah_dir(
         test_task_sampler=task_sampler, n_test_tasks=2, n_test_episodes=10
     )
 
-    trainer = Trainer(ctxt)
-
-    trainer.train(n_epochs=100, batch_size=10000)
-    sampler = LocalSampler(
-        agents=policy, envs=env, max_episode_length=env.spec.max_episode_length
+    # 后台线程只写策略和值函数的参数，代替 garage 每轮同步 pickle 整个算法
+    snapshotter = AsyncSnapshotter(
+        ctxt.snapshot_dir,
+        keep_last=snapshot_keep_last,
+        keep_every=snapshot_every,
+        keep_best=snapshot_keep_best,
+        optimizer_every=snapshot_optimizer_every,
     )
+    trainer = AsyncSnapshotTrainer(ctxt, snapshotter)
+
+    if learner_port is not None:
+        sampler = DistributedSampler(
+            agents=policy,
+            envs=env,
+            max_episode_length=env.spec.max_episode_length,
+            port=learner_port,
+            env_kwargs={
+                "expirement_id": id,
+                "data_dir": data_dir,
+                "target_step": target_step,
+            },
+            # 和 task_sampler 的 wrapper 一致
+            wrapper_kwargs={"expected_action_scale": 10.0},
+            n_local_workers=rollout_workers,
+            seed=seed,
+        )
+    elif n_workers > 1:
+        sampler = MultiprocessingSampler(
+            agents=policy,
+            envs=env,
+            max_episode_length=env.spec.max_episode_length,
+            n_workers=n_workers,
+        )
+    else:
+        sampler = LocalSampler(
+            agents=policy, envs=env, max_episode_length=env.spec.max_episode_length
+        )
 
     algo = MAMLPPO(
         env=env,
@@ -106,9 +191,13 @@ def maml_ppo_half_cheetah_dir(
     )
 
     trainer.setup(algo, env)
-    trainer.train(
-        n_epochs=epochs, batch_size=episodes_per_task * env.spec.max_episode_length
-    )
+    try:
+        trainer.train(
+            n_epochs=epochs,
+            batch_size=episodes_per_task * env.spec.max_episode_length,
+        )
+    finally:
+        snapshotter.close()
 
 
 maml_ppo_half_cheetah_dir()
@@ -0,0 +1,310 @@
+import glob
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+DEFAULT_CHUNK_ROWS = 4096
+
+
+def _task_key(task: Optional[dict]) -> str:
+    return json.dumps(task, sort_keys=True, default=str)
+
+
+def write_json(path: str, data) -> None:
+    """Write ``data`` to ``path`` through a temporary file and a rename."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class TransitionRecorder:
+    """
+    Append-only columnar log of environment transitions.
+
+    Rows are buffered in preallocated NumPy columns and written every
+    ``chunk_rows`` transitions as one ``.npy`` file per column under
+    ``<root>/chunk-NNNNNN/``. ``manifest.json`` lists the finished chunks,
+    the column dtypes and shapes, and the task table that the ``task``
+    column indexes; it is replaced atomically after every chunk, so a
+    crashed recorder loses at most its last partial chunk.
+
+    Only one recorder may write a ``root``; parallel workers use one
+    directory each and :class:`TransitionDataset` reads them together.
+    """
+
+    def __init__(self, root: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        os.makedirs(root, exist_ok=True)
+        manifest_path = os.path.join(root, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+            if self.manifest.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported transition manifest: {manifest_path}")
+        else:
+            self.manifest = {
+                "version": MANIFEST_VERSION,
+                "columns": None,
+                "chunks": [],
+                "tasks": [],
+                "episodes": 0,
+            }
+        self._task_ids = {
+            _task_key(task): i for i, task in enumerate(self.manifest["tasks"])
+        }
+        self._buffers = None
+        self._rows = 0
+        self._episode = self.manifest["episodes"] - 1
+        self._step = 0
+        self._task = -1
+
+    def begin_episode(self, task: Optional[dict] = None) -> None:
+        """Start a new episode on ``task`` (``None`` for the default link)."""
+        key = _task_key(task)
+        task_id = self._task_ids.get(key)
+        if task_id is None:
+            task_id = self._task_ids[key] = len(self.manifest["tasks"])
+            self.manifest["tasks"].append(task)
+        self._task = task_id
+        self._episode += 1
+        self._step = 0
+
+    def _allocate(self, observation, action, env_info: dict) -> None:
+        columns = self.manifest["columns"]
+        if columns is None:
+            # 固定列之外，env_info 的每个键存成一列 info_<key>
+            obs_shape = list(np.shape(observation))
+            columns = {
+                "observation": {"dtype": "<f4", "shape": obs_shape},
+                "action": {"dtype": "<f4", "shape": list(np.shape(action))},
+                "reward": {"dtype": "<f4", "shape": []},
+                "next_observation": {"dtype": "<f4", "shape": obs_shape},
+                "step_type": {"dtype": "u1", "shape": []},
+                "episode": {"dtype": "<i8", "shape": []},
+                "step": {"dtype": "<i4", "shape": []},
+                "task": {"dtype": "<i4", "shape": []},
+            }
+            for key in sorted(env_info):
+                columns[f"info_{key}"] = {"dtype": "<f8", "shape": []}
+            self.manifest["columns"] = columns
+        self._buffers = {
+            name: np.zeros(
+                (self.chunk_rows, *spec["shape"]), dtype=np.dtype(spec["dtype"])
+            )
+            for name, spec in columns.items()
+        }
+
+    def record(
+        self,
+        observation,
+        action,
+        reward: float,
+        next_observation,
+        step_type: int,
+        env_info: Optional[dict] = None,
+    ) -> None:
+        """Append one transition of the current episode."""
+        env_info = env_info or {}
+        if self._buffers is None:
+            self._allocate(observation, action, env_info)
+        if self._episode < 0:
+            self.begin_episode()
+        buffers = self._buffers
+        i = self._rows
+        buffers["observation"][i] = observation
+        buffers["action"][i] = action
+        buffers["reward"][i] = reward
+        buffers["next_observation"][i] = next_observation
+        buffers["step_type"][i] = int(step_type)
+        buffers["episode"][i] = self._episode
+        buffers["step"][i] = self._step
+        buffers["task"][i] = self._task
+        for name, column in buffers.items():
+            if name.startswith("info_"):
+                # 缺失的 env_info 键记为 NaN
+                column[i] = env_info.get(name[len("info_") :], np.nan)
+        self._step += 1
+        self._rows += 1
+        if self._rows == self.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows as a new chunk."""
+        if not self._rows:
+            return
+        chunk = f"chunk-{len(self.manifest['chunks']):06d}"
+        chunk_dir = os.path.join(self.root, chunk)
+        os.makedirs(chunk_dir, exist_ok=True)
+        for name, column in self._buffers.items():
+            np.save(os.path.join(chunk_dir, f"{name}.npy"), column[: self._rows])
+        self.manifest["chunks"].append({"name": chunk, "rows": self._rows})
+        self.manifest["episodes"] = self._episode + 1
+        write_json(os.path.join(self.root, MANIFEST_FILE), self.manifest)
+        self._rows = 0
+
+    def close(self) -> None:
+        self.flush()
+
+
+def find_manifests(root: str) -> List[str]:
+    """Recorder directories under ``root`` (including ``root`` itself)."""
+    paths = glob.glob(os.path.join(root, "**", MANIFEST_FILE), recursive=True)
+    return sorted(os.path.dirname(path) for path in paths)
+
+
+class TransitionDataset:
+    """
+    Read-only view of every :class:`TransitionRecorder` directory under
+    ``root``. Chunks are memory-mapped, so only the rows that are used are
+    read from disk.
+
+    ``episode`` and ``task`` values are made global: episodes are numbered
+    across recorders and ``task`` indexes :attr:`tasks`.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tasks = []
+        self.columns = None
+        self._chunks = []
+        task_ids = {}
+        episode_offset = 0
+        for directory in find_manifests(root):
+            with open(os.path.join(directory, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+            if not manifest["chunks"]:
+                continue
+            if self.columns is None:
+                self.columns = manifest["columns"]
+            elif manifest["columns"] != self.columns:
+                raise ValueError(f"Incompatible columns in {directory}")
+            # 各个 recorder 的任务编号映射到全局任务表
+            task_map = np.empty(len(manifest["tasks"]), dtype=np.int32)
+            for i, task in enumerate(manifest["tasks"]):
+                key = _task_key(task)
+                if key not in task_ids:
+                    task_ids[key] = len(self.tasks)
+                    self.tasks.append(task)
+                task_map[i] = task_ids[key]
+            for chunk in manifest["chunks"]:
+                self._chunks.append(
+                    (
+                        os.path.join(directory, chunk["name"]),
+                        chunk["rows"],
+                        episode_offset,
+                        task_map,
+                    )
+                )
+            episode_offset += manifest["episodes"]
+        self.n_episodes = episode_offset
+        self._offsets = np.cumsum([0] + [rows for _, rows, _, _ in self._chunks])
+        self._mapped = {}
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns or ())
+
+    def _column(self, chunk: int, name: str) -> np.ndarray:
+        key = (chunk, name)
+        data = self._mapped.get(key)
+        if data is None:
+            path = os.path.join(self._chunks[chunk][0], f"{name}.npy")
+            data = self._mapped[key] = np.load(path, mmap_mode="r")
+        return data
+
+    def _fix(self, chunk: int, name: str, values: np.ndarray) -> np.ndarray:
+        _, _, episode_offset, task_map = self._chunks[chunk]
+        if name == "episode":
+            return values + episode_offset
+        if name == "task":
+            return task_map[values]
+        return values
+
+    def column(self, name: str) -> np.ndarray:
+        """A whole column, concatenated in memory."""
+        if not self._chunks:
+            return np.empty(0)
+        return np.concatenate(
+            [
+                self._fix(i, name, np.asarray(self._column(i, name)))
+                for i in range(len(self._chunks))
+            ]
+        )
+
+    def take(self, indices, columns: Optional[Iterable[str]] = None) -> dict:
+        """Rows at global ``indices`` as a dict of arrays."""
+        indices = np.asarray(indices, dtype=np.int64)
+        names = list(columns or self.columns)
+        chunk_ids = np.searchsorted(self._offsets, indices, side="right") - 1
+        # 按块排序后读取，每块只访问一次
+        order = np.argsort(chunk_ids, kind="stable")
+        sorted_chunks = chunk_ids[order]
+        bounds = np.flatnonzero(np.diff(sorted_chunks)) + 1
+        batch = {}
+        for name in names:
+            spec = self.columns[name]
+            out = np.empty(
+                (len(indices), *spec["shape"]), dtype=np.dtype(spec["dtype"])
+            )
+            for group in np.split(order, bounds):
+                if not len(group):
+                    continue
+                chunk = int(chunk_ids[group[0]])
+                rows = indices[group] - self._offsets[chunk]
+                out[group] = self._fix(chunk, name, self._column(chunk, name)[rows])
+            batch[name] = out
+        return batch
+
+    def minibatches(
+        self,
+        batch_size: int,
+        columns: Optional[Iterable[str]] = None,
+        shuffle: bool = True,
+        epochs: int = 1,
+        seed: Optional[int] = None,
+        drop_last: bool = False,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """Stream ``epochs`` passes over the rows in minibatches."""
+        rng = np.random.default_rng(seed)
+        n = len(self)
+        for _ in range(epochs):
+            indices = rng.permutation(n) if shuffle else np.arange(n)
+            stop = n - n % batch_size if drop_last else n
+            for start in range(0, stop, batch_size):
+                yield self.take(indices[start : start + batch_size], columns)
+
+    def episodes(
+        self, columns: Optional[Iterable[str]] = None
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """Every episode in order, e.g. to rebuild garage ``EpisodeBatch``es."""
+        episode = self.column("episode")
+        if not len(episode):
+            return
+        order = np.argsort(episode, kind="stable")
+        bounds = np.flatnonzero(np.diff(episode[order])) + 1
+        for group in np.split(order, bounds):
+            yield self.take(group, columns)
+
+
+if __name__ == "__main__":
+    # python transition_store.py <record_dir>
+    import sys
+
+    dataset = TransitionDataset(sys.argv[1])
+    print(f"{len(dataset)} transitions, {dataset.n_episodes} episodes")
+    print(f"{len(dataset.tasks)} tasks, columns: {', '.join(dataset.column_names)}")
+    if len(dataset):
+        reward = dataset.column("reward")
+        print(
+            f"reward mean {reward.mean():.3f}, min {reward.min():.3f}, "
+            f"max {reward.max():.3f}"
+        )
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import atexit
+import functools
+import gc
+import json
+import os
+import select
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import traceback
+from typing import Optional, Sequence
+
+READY = b"zygote ready\n"
+_SCRIPT = os.path.abspath(__file__)
+
+
+def _recv_line(sock: socket.socket, buffer: bytearray) -> Optional[bytes]:
+    """Read from ``sock`` up to a newline; None if it was closed first."""
+    while b"\n" not in buffer:
+        data = sock.recv(4096)
+        if not data:
+            return None
+        buffer += data
+    end = buffer.index(b"\n") + 1
+    line = bytes(buffer[:end])
+    del buffer[:end]
+    return line
+
+
+class Zygote:
+    """
+    Fork server for the per-episode QUIC processes of the mahimahi backend.
+
+    aioquic, cryptography, :mod:`client` and :mod:`server` are imported
+    once and the server's TLS certificate is loaded once, then every
+    request on the unix socket ``socket_path`` forks a worker that runs
+    ``client.main()`` or ``server.main()`` with the given arguments. The
+    worker inherits the zygote's network namespace, so a zygote started
+    in the mm-link shell forks servers behind the emulated link.
+
+    A request is one JSON line ``{"target", "argv", "output"}``. The zygote
+    answers ``{"pid"}`` and, once the worker exits, ``{"returncode"}`` on
+    the same connection. A byte sent back is delivered to the worker as
+    that signal; closing the connection terminates it. The zygote exits,
+    terminating its workers, on SIGTERM or when its stdin is closed.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        certificate: Optional[str] = None,
+        private_key: Optional[str] = None,
+    ):
+        # 预先导入：fork 出来的进程直接复用，不再冷启动解释器
+        import client
+        import server
+
+        configuration = server.load_configuration(
+            certificate or server.DEFAULT_CERTIFICATE,
+            private_key or server.DEFAULT_PRIVATE_KEY,
+        )
+        self._targets = {
+            "server": functools.partial(server.main, configuration=configuration),
+            "client": client.main,
+        }
+        self.socket_path = socket_path
+        self._workers = {}
+        self._selector = None
+        self._wakeup_w = None
+        self._stopping = False
+
+    def serve(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.listen(16)
+        wakeup_r, self._wakeup_w = socket.socketpair()
+        wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        # SIGCHLD 只用来唤醒 select，回收在主循环里做
+        signal.signal(signal.SIGCHLD, lambda *_: None)
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        signal.set_wakeup_fd(self._wakeup_w.fileno())
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(listener, selectors.EVENT_READ, "accept")
+        self._selector.register(wakeup_r, selectors.EVENT_READ, "signal")
+        self._selector.register(sys.stdin, selectors.EVENT_READ, "stdin")
+        # 导入完成后的对象不再参与 GC，fork 出的进程和 zygote 共享这些页
+        gc.freeze()
+        sys.stdout.buffer.write(READY)
+        sys.stdout.flush()
+        try:
+            while not self._stopping:
+                for key, _ in self._selector.select():
+                    if key.data == "accept":
+                        self._spawn(listener.accept()[0])
+                    elif key.data == "signal":
+                        while True:
+                            try:
+                                if not wakeup_r.recv(4096):
+                                    break
+                            except BlockingIOError:
+                                break
+                    elif key.data == "stdin":
+                        if not os.read(sys.stdin.fileno(), 4096):
+                            self._stopping = True
+                    else:
+                        self._on_owner_data(key.fileobj, key.data)
+                self._reap()
+        finally:
+            signal.set_wakeup_fd(-1)
+            for pid in self._workers:
+                self._kill(pid, signal.SIGTERM)
+            self._selector.close()
+            listener.close()
+            wakeup_r.close()
+            self._wakeup_w.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _on_sigterm(self, signum, frame):
+        self._stopping = True
+
+    @staticmethod
+    def _kill(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _spawn(self, conn: socket.socket) -> None:
+        conn.settimeout(1.0)
+        try:
+            line = _recv_line(conn, bytearray())
+            request = json.loads(line or b"null")
+            target = self._targets[request["target"]]
+            argv = [str(arg) for arg in request.get("argv", ())]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            try:
+                conn.sendall(json.dumps({"error": repr(e)}).encode() + b"\n")
+            except OSError:
+                pass
+            conn.close()
+            return
+        conn.settimeout(None)
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(conn, target, request["target"], argv, request)
+        self._workers[pid] = conn
+        conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+        self._selector.register(conn, selectors.EVENT_READ, pid)
+
+    def _run_worker(self, conn, target, name, argv, request) -> None:
+        """Body of the forked worker; never returns."""
+        code = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            for key in list(self._selector.get_map().values()):
+                if key.fileobj is not sys.stdin:
+                    key.fileobj.close()
+            self._selector.close()
+            self._wakeup_w.close()
+            conn.close()
+            # 和 Popen(preexec_fn=os.setsid) 一样，每个进程单独一个会话
+            os.setsid()
+            stdin = os.open(os.devnull, os.O_RDONLY)
+            output = request.get("output") or os.devnull
+            out = os.open(output, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            os.dup2(stdin, 0)
+            os.dup2(out, 1)
+            os.dup2(out, 2)
+            os.close(stdin)
+            os.close(out)
+            gc.unfreeze()
+            sys.argv = [f"{name}.py", *argv]
+            asyncio.run(target())
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    def _on_owner_data(self, conn: socket.socket, pid: int) -> None:
+        try:
+            data = conn.recv(64)
+        except OSError:
+            data = b""
+        if data:
+            for signum in data:
+                self._kill(pid, signum)
+            return
+        # 调用方已经退出或关闭了句柄
+        self._selector.unregister(conn)
+        self._kill(pid, signal.SIGTERM)
+
+    def _reap(self) -> None:
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = self._workers.pop(pid, None)
+            if conn is None:
+                continue
+            if conn in (key.fileobj for key in self._selector.get_map().values()):
+                self._selector.unregister(conn)
+            try:
+                reply = {"returncode": os.waitstatus_to_exitcode(status)}
+                conn.sendall(json.dumps(reply).encode() + b"\n")
+            except OSError:
+                pass
+            conn.close()
+
+
+class ZygoteProcess:
+    """
+    ``subprocess.Popen``-like handle of a worker forked by a :class:`Zygote`:
+    ``poll``, ``wait``, ``send_signal``, ``terminate`` and ``kill``. Its
+    output goes to the file given to :func:`spawn`, so ``stdout`` is None.
+    """
+
+    stdout = None
+
+    def __init__(self, sock: socket.socket, pid: int, buffer: bytearray):
+        self._sock = sock
+        self._buffer = buffer
+        self.pid = pid
+        self.returncode = None
+
+    def _read_status(self, timeout: Optional[float]) -> None:
+        if self.returncode is not None:
+            return
+        if not self._buffer:
+            readable, _, _ = select.select([self._sock], [], [], timeout)
+            if not readable:
+                return
+        try:
+            line = _recv_line(self._sock, self._buffer)
+        except OSError:
+            line = None
+        # 没有退出码就断开：zygote 本身已经退出
+        self.returncode = json.loads(line)["returncode"] if line else -1
+        self._sock.close()
+
+    def poll(self) -> Optional[int]:
+        self._read_status(0)
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        self._read_status(timeout)
+        if self.returncode is None:
+            raise subprocess.TimeoutExpired(f"zygote worker {self.pid}", timeout)
+        return self.returncode
+
+    def send_signal(self, signum: int) -> None:
+        if self.returncode is None:
+            try:
+                self._sock.sendall(bytes([signum]))
+            except OSError:
+                pass
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+def spawn(
+    socket_path: str,
+    target: str,
+    argv: Sequence[str] = (),
+    output: Optional[str] = None,
+) -> ZygoteProcess:
+    """
+    Fork a ``target`` ("server" or "client") worker from the zygote at
+    ``socket_path``, as if ``python <target>.py *argv`` was run. Its
+    stdout and stderr are appended to ``output`` (discarded by default).
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    request = {"target": target, "argv": list(argv), "output": output}
+    sock.sendall(json.dumps(request).encode() + b"\n")
+    buffer = bytearray()
+    line = _recv_line(sock, buffer)
+    reply = json.loads(line) if line else {"error": "connection closed"}
+    if "error" in reply:
+        sock.close()
+        raise RuntimeError(f"Zygote could not start {target}: {reply['error']}")
+    return ZygoteProcess(sock, reply["pid"], buffer)
+
+
+def wait_ready(stream) -> None:
+    """Read the output of a starting zygote up to its ready line."""
+    line = stream.readline()
+    while line != READY:
+        if not line:
+            raise RuntimeError("Zygote exited before it was ready")
+        line = stream.readline()
+
+
+class LocalZygote:
+    """A :class:`Zygote` in a child process, in this process's namespace."""
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.socket_path = socket_path or f"/tmp/metacon_zygote.{os.getpid()}"
+        # 关闭 stdin 即让 zygote 退出，本进程异常退出时也不会遗留
+        self._process = subprocess.Popen(
+            [sys.executable, _SCRIPT, self.socket_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        wait_ready(self._process.stdout)
+
+    def is_running(self) -> bool:
+        return self._process.poll() is None
+
+    def spawn(
+        self, target: str, argv: Sequence[str] = (), output: Optional[str] = None
+    ) -> ZygoteProcess:
+        return spawn(self.socket_path, target, argv, output)
+
+    def close(self) -> None:
+        if self._process.poll() is None:
+            self._process.stdin.close()
+            self._process.wait()
+
+
+_local_zygotes = {}
+
+
+def local_zygote() -> LocalZygote:
+    """The :class:`LocalZygote` of this process, started on first use."""
+    # 按 pid 区分：sampler 的 worker 进程各自启动自己的 zygote
+    zygote = _local_zygotes.get(os.getpid())
+    if zygote is None or not zygote.is_running():
+        zygote = _local_zygotes[os.getpid()] = LocalZygote()
+        atexit.register(zygote.close)
+    return zygote
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fork server for client.py and server.py processes"
+    )
+    parser.add_argument("socket", help="unix socket to accept spawn requests on")
+    parser.add_argument("--certificate", help="server certificate (default: repo)")
+    parser.add_argument("--private-key", help="server private key (default: repo)")
+    args = parser.parse_args()
+    Zygote(args.socket, args.certificate, args.private_key).serve()
+
+
+if __name__ == "__main__":
+    main()